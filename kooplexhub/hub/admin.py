@@ -20,7 +20,7 @@ class ProfileAdmin(admin.ModelAdmin):
 class ProjectAdmin(admin.ModelAdmin):
     def project_creator(self, instance):
         return instance.creator
-    list_display = ('id', 'name', 'image', 'project_creator') 
+    list_display = ('id', 'name', 'image', 'resourceprofile', 'project_creator') 
 
 @admin.register(UserProjectBinding)
 class UserProjectBindingAdmin(admin.ModelAdmin):
@@ -33,7 +33,58 @@ class GroupProjectBindingAdmin(admin.ModelAdmin):
 
 @admin.register(Container)
 class ContainerAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'image', 'user', 'state', 'n_projects', 'marked_to_remove')
+    list_display = ('id', 'name', 'image', 'user', 'state', 'is_ready', 'engine', 'n_projects', 'marked_to_remove')
+    list_filter = ('state', 'image')
+    search_fields = ('name', 'user__username')
+    actions = [ 'bulk_stop', 'bulk_remove' ]
+
+    def _bulk(self, request, queryset, remove):
+        from kooplex.lib.bulkstop import stop
+        containers = list(queryset.filter(state = Container.ST_RUNNING)) if not remove else list(queryset.exclude(state = Container.ST_NOTPRESENT))
+        jobs = stop(containers, remove = remove)
+        self.message_user(request, "%d containers are queued to %s, see the container jobs for the progress" % (len(jobs), 'remove' if remove else 'stop'))
+
+    def bulk_stop(self, request, queryset):
+        self._bulk(request, queryset, remove = False)
+    bulk_stop.short_description = "Stop selected running containers"
+
+    def bulk_remove(self, request, queryset):
+        self._bulk(request, queryset, remove = True)
+    bulk_remove.short_description = "Remove selected containers"
+
+@admin.register(ContainerJob)
+class ContainerJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'container', 'action', 'phase', 'created_at', 'started_at', 'finished_at', 'worker', 'message')
+    search_fields = ('container__name', )
+
+@admin.register(ImagePool)
+class ImagePoolAdmin(admin.ModelAdmin):
+    list_display = ('id', 'image', 'min_size', 'max_size', 'n_pooled', 'is_active')
+
+@admin.register(PooledContainer)
+class PooledContainerAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'image', 'engine', 'volumes', 'created_at')
+
+@admin.register(PoolAdoption)
+class PoolAdoptionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'image', 'container_name', 'is_hit', 'latency', 'adopted_at')
+
+@admin.register(SideEffect)
+class SideEffectAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'idempotency_key', 'state', 'attempts', 'created_at', 'next_attempt_at', 'finished_at', 'last_error')
+    list_filter = ('kind', 'state')
+    search_fields = ('idempotency_key', )
+
+@admin.register(GarbageArchive)
+class GarbageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'owner', 'label', 'state', 'files', 'raw_bytes', 'stored_bytes', 'created_at', 'stored_at')
+    list_filter = ('kind', 'state')
+    search_fields = ('owner', 'label')
+
+@admin.register(CullEvent)
+class CullEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'container_name', 'user', 'idle_seconds', 'threshold_seconds', 'culled_at', 'is_success', 'message')
+    search_fields = ('container_name', 'user__username')
 
 @admin.register(ContainerEnvironment)
 class ContainerEnvironmentAdmin(admin.ModelAdmin):
@@ -58,7 +109,11 @@ class CourseContainerBindingAdmin(admin.ModelAdmin):
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'folder', 'description', 'image')
+    list_display = ('id', 'name', 'folder', 'description', 'image', 'idle_timeout', 'resourceprofile')
+
+@admin.register(CoursePrestart)
+class CoursePrestartAdmin(admin.ModelAdmin):
+    list_display = ('id', 'course', 'creator', 'prestart_at', 'stop_at', 'state', 'started_at', 'stopped_at')
 
 @admin.register(UserCourseCodeBinding)
 class UserCourseCodeBindingAdmin(admin.ModelAdmin):
@@ -132,9 +187,13 @@ class VolumeProjectBindingAdmin(admin.ModelAdmin):
 class VolumeContainerBindingAdmin(admin.ModelAdmin):
     list_display = ('id', 'container', 'volume' )
 
+@admin.register(ResourceProfile)
+class ResourceProfileAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'mem_limit', 'memswap_limit', 'mem_swappiness', 'cpu_shares', 'cpu_quota', 'cpu_period', 'pids_limit', 'shm_size')
+
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
+    list_display = ('id', 'name', 'idle_timeout', 'resourceprofile')
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,39 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kooplex.lib.aclaudit import expected_trees, audit, audit_memberships, Checkpoint
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Compare the ACLs and ownership of the share, course, usercourse and assignment folder trees to the database and optionally repair the drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', help = "Grant the missing entries and fix the owner of the roots, otherwise only report the drift", action = "store_true")
+        parser.add_argument('--revoke-extra', help = "When repairing, also remove the entries of users and groups not bound any more", action = "store_true")
+        parser.add_argument('--kind', help = "Audit only this kind of trees", choices = [ 'share', 'course', 'usercourse', 'assignment' ], action = 'append')
+        parser.add_argument('--checkpoint', help = "JSON file recording the audited roots, an interrupted run resumes from it", default = None)
+        parser.add_argument('--workers', help = "Number of trees scanned in parallel (default: 8)", type = int, default = 8)
+        parser.add_argument('--batch', help = "Number of trees scanned, repaired and checkpointed together (default: 100)", type = int, default = 100)
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        if options['revoke_extra'] and not options['repair']:
+            raise CommandError("--revoke-extra requires --repair")
+        try:
+            trees, memberships = expected_trees(options['kind'])
+        except KeyError as e:
+            raise CommandError("KOOPLEX['mountpoint'] misses %s" % e)
+        for name, missing, extra in audit_memberships(memberships, repair = options['repair']):
+            print ("group %s: missing users %s, extra users %s" % (name, sorted(missing), sorted(extra)))
+        checkpoint = Checkpoint(options['checkpoint'])
+        counters = audit(trees, repair = options['repair'], revoke_extra = options['revoke_extra'],
+                workers = options['workers'], batch = options['batch'], checkpoint = checkpoint, report = self.report)
+        print ("%(trees)d trees (%(skipped)d skipped) and %(entries)d entries scanned, %(drifted)d drifted, %(repaired)d entries repaired" % counters)
+        checkpoint.clear()
+
+    def report(self, drift):
+        print ("%s %s" % (drift.tree.kind, drift.tree.root))
+        for line in drift.lines():
+            print ("    %s" % line)
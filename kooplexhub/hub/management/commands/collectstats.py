@@ -0,0 +1,43 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kooplex.lib import Docker
+from kooplex.lib.resourcestats import ResourceStore, collect
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Sample the resource usage of running containers into the rolling stats store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', help = "Seconds between sampling rounds (default: 60)", type = int, default = 60)
+        parser.add_argument('--workers', help = "Number of containers sampled in parallel (default: 8)", type = int, default = 8)
+        parser.add_argument('--once', help = "Take a single round of samples and exit", action = "store_true")
+        parser.add_argument('--top', help = "Do not sample, list the heaviest containers of the last 5 minutes", type = int, default = 0)
+        parser.add_argument('--metric', help = "Ordering of --top", choices = ['cpu', 'mem'], default = 'cpu')
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        store = ResourceStore()
+        if options['top']:
+            for name, cpu, mem in store.top(options['top'], options['metric']):
+                print ("%-60s cpu %6.1f %% mem %8.1f MiB" % (name, cpu, mem))
+            return
+        dockers = [ Docker(engine) for engine in sorted(Docker.engines().keys()) ]
+        rounds = 0
+        while True:
+            t0 = time.time()
+            for docker in dockers:
+                try:
+                    collect(docker, store, options['workers'])
+                except Exception as e:
+                    logger.error("sampling round of engine %s failed -- %s" % (docker.engine, e))
+                    docker.client.healthcheck()
+            rounds += 1
+            if rounds % 60 == 0:
+                store.expire()
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - (time.time() - t0)))
@@ -0,0 +1,61 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, connection
+
+from hub.models import ContainerJob
+
+from kooplex.lib import now
+from kooplex.lib.queueworker import worker_id, reset_stale, serve
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Carry out queued container state transitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', help = "Number of jobs run in parallel (default: 4)", type = int, default = 4)
+        parser.add_argument('--poll', help = "Seconds to wait between polls of the job queue (default: 1)", type = float, default = 1)
+        parser.add_argument('--once', help = "Drain the queue and exit", action = "store_true")
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        self.worker = worker_id()
+        n = reset_stale(ContainerJob, 'phase', ContainerJob.PH_RUNNING, ContainerJob.PH_QUEUED)
+        if n:
+            logger.warning("%d stale jobs requeued" % n)
+        serve(self.claim, self.run, options['concurrency'], options['poll'], options['once'])
+
+    def claim(self, n):
+        """
+        @summary: mark at most n queued jobs as running, a container is never handled by two jobs at the same time
+        """
+        if n <= 0:
+            return []
+        with transaction.atomic():
+            queued = list(ContainerJob.objects.select_for_update().filter(phase = ContainerJob.PH_QUEUED).order_by('created_at'))
+            # read once the lock is held, so the jobs just claimed by a worker we waited for are seen
+            busy = set(ContainerJob.objects.filter(phase = ContainerJob.PH_RUNNING).values_list('container_id', flat = True))
+            jobs = []
+            for job in queued:
+                if job.container_id in busy:
+                    continue
+                busy.add(job.container_id)
+                job.phase = ContainerJob.PH_RUNNING
+                job.started_at = now()
+                job.worker = self.worker
+                job.save()
+                jobs.append(job)
+                if len(jobs) == n:
+                    break
+        return jobs
+
+    def run(self, job):
+        try:
+            logger.info("run %s" % job)
+            job.run()
+            logger.info("finished %s in %s" % (job, job.finished_at - job.started_at))
+        except Exception as e:
+            logger.error("job %s -- %s" % (job, e))
+        finally:
+            connection.close()
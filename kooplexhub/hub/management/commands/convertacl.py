@@ -0,0 +1,76 @@
+import os
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.models import Group, Project, UserProjectBinding, Course, UserCourseBinding
+
+from kooplex.settings import KOOPLEX
+from kooplex.lib import Dirname
+from kooplex.lib.acl import revoke, grant_group, apply as apply_acl
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Convert the share and course folder trees to group based inheritable ACLs once, before KOOPLEX['acl']['mode'] is set to group"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry', help = "Dry run: list the folders and the groups, and do not actually touch them", action = "store_true")
+        parser.add_argument('--strip', help = "Remove the per user entries of the members replaced by the group entry", action = "store_true")
+        parser.add_argument('--workers', help = "Number of subtrees walked in parallel (default: KOOPLEX['acl']['workers'])", type = int, default = None)
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        ops = []
+        for project in Project.objects.all():
+            bindings = list(UserProjectBinding.objects.filter(project = project).select_related('user__profile'))
+            if not bindings:
+                continue
+            dir_share = Dirname.share(bindings[0])
+            if not os.path.isdir(dir_share):
+                continue
+            group = self.group(Group.of_project, [ project ], [ b.user for b in bindings ], options['dry'])
+            ops.append(grant_group(dir_share, group.groupid, default = True))
+            if options['strip']:
+                ops.extend([ revoke(dir_share, b.user.profile.userid) for b in bindings ])
+        for course in Course.objects.all():
+            bindings = list(UserCourseBinding.objects.filter(course = course).select_related('user__profile'))
+            teachers = [ b.user for b in bindings if b.is_teacher ]
+            students = [ b.user for b in bindings if not b.is_teacher ]
+            try:
+                dir_courseprivate = Dirname.courseprivate(course)
+                dir_coursepublic = Dirname.coursepublic(course)
+                dir_courseworkdir = os.path.join(Dirname.mountpoint['usercourse'], course.folder)
+            except KeyError as e:
+                raise CommandError("KOOPLEX['mountpoint'] misses %s" % e)
+            g_teacher = self.group(Group.of_course, [ course, True ], teachers, options['dry'])
+            g_student = self.group(Group.of_course, [ course, False ], students, options['dry'])
+            for folder, gid, perms, members in [
+                    (dir_courseprivate, g_teacher.groupid, 'rwX', teachers),
+                    (dir_coursepublic, g_teacher.groupid, 'rwX', teachers),
+                    (dir_coursepublic, g_student.groupid, 'rX', students),
+                    (dir_courseworkdir, g_teacher.groupid, 'rX', teachers) ]:
+                if not os.path.isdir(folder):
+                    continue
+                ops.append(grant_group(folder, gid, perms, default = True))
+                if options['strip']:
+                    ops.extend([ revoke(folder, u.profile.userid) for u in members ])
+        for op in ops:
+            if op.perms is None:
+                print ("revoke u:%d %s" % (op.qualifier, op.folder))
+            else:
+                print ("grant g:%d:%s %s" % (op.qualifier, op.perms, op.folder))
+        if options['dry']:
+            return
+        stats = apply_acl(ops, workers = options['workers'])
+        print ("%(folders)d folders, %(entries)d entries checked, %(changed)d changed, %(errors)d errors in %(seconds).1f s" % stats)
+        for e in stats['error_samples']:
+            print ("error: %s" % e)
+
+    def group(self, f_group, f_args, members, dry):
+        if dry:
+            return Group(name = 'dry', groupid = 0)
+        group = f_group(*f_args)
+        for user in members:
+            group.bind(user)
+        return group
@@ -0,0 +1,30 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kooplex.lib.culler import cull
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Stop notebook containers whose kernels have been idle longer than the threshold of their course or image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry', help = "Dry run: list the idle containers, and do not actually stop them", action = "store_true")
+        parser.add_argument('--workers', help = "Number of notebook servers polled in parallel (default: 16)", type = int, default = 16)
+        parser.add_argument('--loop', help = "Keep culling with this many seconds between rounds", type = int, default = 0)
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        while True:
+            report = cull(dry = options['dry'], workers = options['workers'])
+            for container, idle, threshold, to_cull in report:
+                if idle is None:
+                    print ("?? %s cannot poll kernels" % container)
+                elif to_cull:
+                    print ("%s %s idle for %d s > %d s" % ("would cull" if options['dry'] else "culled", container, idle, threshold))
+            logger.info("%d containers polled, %d idle" % (len(report), len([ r for r in report if r[3] ])))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
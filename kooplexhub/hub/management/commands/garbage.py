@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.models import GarbageArchive
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'List the archives of the garbage store, or restore one of them into a folder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help = "List only the archives of this user")
+        parser.add_argument('--kind', help = "List only the archives of this kind", choices = GarbageArchive.KIND_LIST)
+        parser.add_argument('--restore', help = "Id of the archive to restore", type = int, default = None)
+        parser.add_argument('--target', help = "Folder to restore the archive into, it should not exist")
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        if options['restore'] is not None:
+            try:
+                archive = GarbageArchive.objects.get(id = options['restore'])
+            except GarbageArchive.DoesNotExist as e:
+                raise CommandError(e)
+            if not options['target']:
+                raise CommandError("--target is required to restore %s" % archive)
+            archive.do_restore(options['target'])
+            print ("%s restored to %s" % (archive, options['target']))
+            return
+        archives = GarbageArchive.objects.all()
+        if options['owner']:
+            archives = archives.filter(owner = options['owner'])
+        if options['kind']:
+            archives = archives.filter(kind = options['kind'])
+        for a in archives:
+            print ("%d\t%s\t%s\t%s\t%s\t%d files\t%.1f MB\t%s" % (a.id, a.created_at, a.kind, a.owner, a.label, a.files, a.raw_bytes / 1e6, a.state))
@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kooplex.lib.readiness import ReadinessTracker
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Probe the notebook servers of the started containers, and mark them ready when they answer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', help = "Number of containers probed in parallel (default: 16)", type = int, default = 16)
+        parser.add_argument('--poll', help = "Seconds to wait between rounds when no container became ready (default: 0.5)", type = float, default = .5)
+        parser.add_argument('--once', help = "Probe the pending containers once and exit", action = "store_true")
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        ReadinessTracker(workers = options['workers']).run(poll = options['poll'], once = options['once'])
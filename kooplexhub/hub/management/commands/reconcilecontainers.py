@@ -0,0 +1,124 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.models import Container
+
+from kooplex.lib import Docker, now
+
+logger = logging.getLogger(__name__)
+
+def engine2state(dockerstate):
+    if dockerstate is None:
+        return Container.ST_NOTPRESENT
+    return Container.ST_RUNNING if dockerstate == 'running' else Container.ST_NOTRUNNING
+
+class Command(BaseCommand):
+    help = 'Follow the docker event stream and keep container states in the database up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry', help = "Dry run: list state changes, and do not actually save them", action = "store_true")
+        parser.add_argument('--once', help = "Run a single full resynchronization and exit", action = "store_true")
+        parser.add_argument('--resync', help = "Seconds between full resynchronizations (default: 300)", type = int, default = 300)
+        parser.add_argument('--window', help = "Seconds to collect events before saving them in bulk (default: 2)", type = int, default = 2)
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        dockers = [ Docker(engine) for engine in sorted(Docker.engines().keys()) ]
+        dry = options['dry']
+        if options['once']:
+            self.resync(dockers, dry)
+            return
+        last_resync = 0
+        since = int(time.time())
+        # the event streams of the engines are followed in parallel, each call blocks for the window
+        with ThreadPoolExecutor(max_workers = len(dockers)) as pool:
+            while True:
+                if time.time() - last_resync >= options['resync']:
+                    try:
+                        self.resync(dockers, dry)
+                    except Exception as e:
+                        logger.error("resync failed -- %s" % e)
+                    last_resync = time.time()
+                until = since + options['window']
+                changes = {}
+                futures = [ (docker, pool.submit(self.collect, docker, since, until)) for docker in dockers ]
+                for docker, future in futures:
+                    try:
+                        changes.update(future.result())
+                    except Exception as e:
+                        logger.error("event processing of engine %s failed -- %s" % (docker.engine, e))
+                        docker.client.healthcheck()
+                try:
+                    self.save(changes, dry)
+                except Exception as e:
+                    logger.error("saving state changes failed -- %s" % e)
+                    time.sleep(options['window'])
+                since = until
+
+    def collect(self, docker, since, until):
+        """
+        @summary: fold the events of a time window into the latest state and message of each container
+        """
+        changes = {}
+        for event in docker.container_events(since, until):
+            action = event.get('Action', event.get('status'))
+            attributes = event.get('Actor', {}).get('Attributes', {})
+            name = attributes.get('name')
+            if name is None:
+                # older engines do not report names, the next resync takes care
+                continue
+            _, former_message = changes.get(name, (None, ''))
+            if action == 'start':
+                changes[name] = (Container.ST_RUNNING, 'Container started')
+            elif action == 'oom':
+                changes[name] = (Container.ST_NOTRUNNING, 'Container ran out of memory')
+            elif action == 'die':
+                message = 'Container exited with code %s' % attributes.get('exitCode', '?')
+                if former_message.startswith('Container ran out of memory'):
+                    message = '%s, exit code %s' % (former_message, attributes.get('exitCode', '?'))
+                changes[name] = (Container.ST_NOTRUNNING, message)
+            elif action == 'stop':
+                changes[name] = (Container.ST_NOTRUNNING, former_message or 'Container stopped')
+            elif action == 'destroy':
+                changes[name] = (Container.ST_NOTPRESENT, 'Container removed')
+        return changes
+
+    def resync(self, dockers, dry):
+        """
+        @summary: compare a single listing of each docker engine with the database
+        """
+        engine = {}
+        for docker in dockers:
+            engine.update(docker.list_containerstates())
+        changes = {}
+        for name, state in Container.objects.values_list('name', 'state'):
+            dockerstate = engine.get(name)
+            state_new = engine2state(dockerstate)
+            if state_new != state:
+                changes[name] = (state_new, 'Container state in engine: %s' % (dockerstate or 'missing'))
+        logger.info("resync: %d containers in engine, %d states differ" % (len(engine), len(changes)))
+        self.save(changes, dry)
+
+    def save(self, changes, dry):
+        """
+        @summary: update state and message of containers in bulk, grouped by the new values
+        @note: queryset updates do not fire the pre_save receivers, which would otherwise try to repeat the state transition in the engine
+        """
+        groups = {}
+        for name, change in changes.items():
+            groups.setdefault(change, []).append(name)
+        timestamp = now()
+        for (state, message), names in groups.items():
+            if dry:
+                print ("%s -> %s (%s)" % (", ".join(names), state, message))
+                continue
+            containers = Container.objects.filter(name__in = names)
+            if state == Container.ST_NOTPRESENT:
+                # a removed container is placed again when it is recreated
+                n = containers.update(state = state, last_message = message[:512], last_message_at = timestamp, engine = None)
+            else:
+                n = containers.update(state = state, last_message = message[:512], last_message_at = timestamp)
+            logger.debug("%d containers -> %s (%s)" % (n, state, message))
@@ -4,39 +4,27 @@ import json
 
 from django.core.management.base import BaseCommand, CommandError
 
-from hub.models import Container, Report
-
-from kooplex.lib.proxy import getroutes, addroute, droproutes
-from kooplex.settings import KOOPLEX
+from kooplex.lib.proxy import reconcileroutes
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Remove all proxy targets and reload those currently in use'
+    help = 'Bring the proxy route table in line with the containers and reports currently in use'
 
     def add_arguments(self, parser):
-        parser.add_argument('--dry', help = "Dry run: list proxy tergets to load", action = "store_true")
+        parser.add_argument('--dry', help = "Dry run: list the differences of the route table, and do not actually change it", action = "store_true")
+        parser.add_argument('--workers', help = "Number of parallel calls to the proxy API (default: 8)", type = int, default = 8)
     
     def handle(self, *args, **options):
         logger.info("call %s %s" % (args, options))
+        add, change, delete, errors = reconcileroutes(dry = options['dry'], workers = options['workers'])
         if options['dry']:
             print ("dry run")
-            resp = getroutes()
-            routes = json.loads(resp.content.decode())
-            for r, v in routes.items():
-                print ("remove %s [--> %s]" % (r, v['target']))
-            print ("----")
-        else:
-            droproutes()
-        for c in Container.objects.filter(state = Container.ST_RUNNING):
-            if options['dry']:
-                print ("%s --> %s" % (c.proxy_path, c.url))
-            else:
-                addroute(c)
-        for r in Report.objects.all():
-            if options['dry']:
-                target_url = KOOPLEX['reportserver'].get('base_url', 'http://localhost')
-                print ("%s --> %s" % (r.proxy_path, target_url))
-            else:
-                addroute(r)
-
+        for r, t in sorted(add.items()):
+            print ("+ %s --> %s" % (r, t))
+        for r, t in sorted(change.items()):
+            print ("~ %s --> %s" % (r, t))
+        for r, t in sorted(delete.items()):
+            print ("- %s [--> %s]" % (r, t))
+        if errors:
+            print ("%d calls failed" % errors)
@@ -1,7 +1,7 @@
 import logging
 
 from django.core.management.base import BaseCommand, CommandError
-from hub.models import Assignment, UserAssignmentBinding
+from hub.models import Assignment, UserAssignmentBinding, CoursePrestart, GarbageArchive
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +10,7 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--dry', help = "Dry run: list tasks to be done, and do not actually do anything with them", action = "store_true")
-        parser.add_argument('--task', help = "Task to run: all scheduled tasks are to be carried out when unspecified", choices = ['handout', 'collect'], nargs = 1)
+        parser.add_argument('--task', help = "Task to run: all scheduled tasks are to be carried out when unspecified", choices = ['handout', 'collect', 'prestart', 'poststop', 'retention'], nargs = 1)
     
     def handle(self, *args, **options):
         logger.info("tick %s %s" % (args, options))
@@ -20,6 +20,12 @@ class Command(BaseCommand):
             self.handle_personal_handout(UserAssignmentBinding.iter_valid(), options['dry'])
         if 'collect' in options.get('tasks', ['collect']):
             self.handle_collect(UserAssignmentBinding.iter_expired(), options['dry'])
+        if 'prestart' in options.get('tasks', ['prestart']):
+            self.handle_prestart(CoursePrestart.iter_due(), options['dry'])
+        if 'poststop' in options.get('tasks', ['poststop']):
+            self.handle_poststop(CoursePrestart.iter_expired(), options['dry'])
+        if 'retention' in options.get('tasks', ['retention']):
+            self.handle_retention(GarbageArchive.iter_expired(), options['dry'])
 
 
     def handle_mass_handout(self, valid_assignments, dry):
@@ -63,3 +69,47 @@ class Command(BaseCommand):
                     logger.error("opps -- %s" % e)
                     print("opps -- %s" % e)
 
+
+    def handle_prestart(self, due_prestarts, dry):
+        print ("Prestart")
+        for prestart in due_prestarts:
+            print ("=> %s" % prestart)
+            try:
+                for student in prestart.do_prestart(dry = dry):
+                    print ("\t-> %s" % student)
+                logger.info('=> %s' % prestart)
+            except Exception as e:
+                logger.error("opps -- %s" % e)
+                print("opps -- %s" % e)
+
+
+    def handle_poststop(self, expired_prestarts, dry):
+        print ("Poststop")
+        for prestart in expired_prestarts:
+            print ("<= %s" % prestart)
+            try:
+                for container in prestart.do_stop(dry = dry):
+                    print ("\t<- %s" % container)
+                logger.info('<= %s' % prestart)
+            except Exception as e:
+                logger.error("opps -- %s" % e)
+                print("opps -- %s" % e)
+
+
+    def handle_retention(self, expired_archives, dry):
+        print ("Retention")
+        for archive in list(expired_archives):
+            print ("x %s" % archive)
+            if not dry:
+                try:
+                    archive.discard()
+                    logger.info('x %s' % archive)
+                except Exception as e:
+                    logger.error("opps -- %s" % e)
+                    print("opps -- %s" % e)
+        try:
+            n, size = GarbageArchive.sweep(dry = dry)
+            print ("%d chunks, %.1f MB %s" % (n, size / 1e6, "to remove" if dry else "removed"))
+        except Exception as e:
+            logger.error("opps -- %s" % e)
+            print("opps -- %s" % e)
@@ -0,0 +1,64 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, connection
+from django.db.models import Count
+
+from hub.models import SideEffect
+
+from kooplex.lib import now
+from kooplex.lib.queueworker import worker_id, reset_stale, serve
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Carry out the side effects of model changes queued in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', help = "Number of side effects run in parallel (default: 8), each kind is further limited by its handler", type = int, default = 8)
+        parser.add_argument('--poll', help = "Seconds to wait between polls of the outbox (default: 1)", type = float, default = 1)
+        parser.add_argument('--once', help = "Drain the outbox and exit, side effects waiting for a retry are not waited for", action = "store_true")
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        self.worker = worker_id()
+        n = reset_stale(SideEffect, 'state', SideEffect.ST_RUNNING, SideEffect.ST_QUEUED)
+        if n:
+            logger.warning("%d stale side effects requeued" % n)
+        serve(self.claim, self.run, options['concurrency'], options['poll'], options['once'])
+
+    def claim(self, n):
+        """
+        @summary: mark at most n due side effects as running, respecting the concurrency limit of each kind
+        """
+        if n <= 0:
+            return []
+        with transaction.atomic():
+            due = list(SideEffect.objects.select_for_update().filter(state = SideEffect.ST_QUEUED, next_attempt_at__lte = now()).order_by('created_at'))
+            # read once the lock is held, so the side effects just claimed by a worker we waited for are counted
+            busy = dict(SideEffect.objects.filter(state = SideEffect.ST_RUNNING).values_list('kind').annotate(n = Count('id')))
+            effects = []
+            for effect in due:
+                if not effect.kind in SideEffect._handlers:
+                    logger.error("no handler registered for %s" % effect)
+                    continue
+                if busy.get(effect.kind, 0) >= effect.concurrency:
+                    continue
+                busy[effect.kind] = busy.get(effect.kind, 0) + 1
+                effect.state = SideEffect.ST_RUNNING
+                effect.worker = self.worker
+                effect.save()
+                effects.append(effect)
+                if len(effects) == n:
+                    break
+        return effects
+
+    def run(self, effect):
+        try:
+            logger.info("run %s" % effect)
+            effect = effect.run()
+            logger.info("finished %s" % effect)
+        except Exception as e:
+            logger.error("side effect %s -- %s" % (effect, e))
+        finally:
+            connection.close()
@@ -0,0 +1,35 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.models import Course, Image
+from kooplex.lib.bulkstop import select, stop
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Queue the stop or removal of the running containers of a course, of an image or idle for long in one go'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry', help = "Dry run: list the selected containers, and do not actually stop them", action = "store_true")
+        parser.add_argument('--course', help = "Name of the course whose containers are stopped")
+        parser.add_argument('--image', help = "Name of the image whose containers are stopped")
+        parser.add_argument('--idle', help = "Stop only containers whose kernels have been idle for more hours", type = float, default = None)
+        parser.add_argument('--remove', help = "Remove the containers instead of stopping them", action = "store_true")
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        try:
+            course = Course.objects.get(name = options['course']) if options['course'] else None
+            image = Image.objects.get(name = options['image']) if options['image'] else None
+        except (Course.DoesNotExist, Image.DoesNotExist) as e:
+            raise CommandError(e)
+        if course is None and image is None and options['idle'] is None:
+            raise CommandError("Refusing to stop all running containers, select a course, an image or an idle time")
+        containers = select(course = course, image = image, idle_hours = options['idle'])
+        if options['dry']:
+            for container in containers:
+                print ("would stop %s" % container)
+            return
+        for job in stop(containers, remove = options['remove']):
+            print ("queued %s" % job)
@@ -0,0 +1,36 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kooplex.lib import Docker
+from kooplex.lib.warmpool import refill, statistics
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Keep the pools of booted generic containers filled, and report pool usage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry', help = "Dry run: list pooled containers to create or remove, and do not actually do anything with them", action = "store_true")
+        parser.add_argument('--loop', help = "Refill the pools every LOOP seconds instead of exiting after a single pass", type = int, default = 0)
+        parser.add_argument('--stats', help = "Print pool hit rate and adoption latency per image", action = "store_true")
+
+    def handle(self, *args, **options):
+        logger.info("call %s %s" % (args, options))
+        if options['stats']:
+            for image, s in statistics().items():
+                print ("%s: hit rate %.2f (%d/%d) latency mean %s p95 %s" % (image, s['hitrate'], s['hit'], s['hit'] + s['miss'], s['latency_mean'], s['latency_p95']))
+            return
+        docker = Docker()
+        while True:
+            try:
+                for image, created, removed in refill(docker, dry = options['dry']):
+                    if created or removed:
+                        print ("%s: +%d -%d" % (image, created, removed))
+                        logger.info("pool %s: +%d -%d" % (image, created, removed))
+            except Exception as e:
+                logger.error("refill failed -- %s" % e)
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
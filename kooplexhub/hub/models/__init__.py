@@ -1,9 +1,14 @@
+from .sideeffect import SideEffect
 from .profile import Profile
 from .group import Group, UserGroupBinding
 
+from .resourceprofile import ResourceProfile
 from .image import Image
+from .warmpool import ImagePool, PooledContainer, PoolAdoption
 from .volume import Volume, VolumeOwnerBinding, ExtraFields, UserPrivilegeVolumeBinding, VolumeProjectBinding
 from .container import Container, ContainerEnvironment, ProjectContainerBinding, CourseContainerBinding, VolumeContainerBinding, ReportContainerBinding
+from .containerjob import ContainerJob
+from .cullevent import CullEvent
 
 from .versioncontrol import VCRepository, VCToken, VCProject, VCProjectProjectBinding
 from .filesync import FSServer, FSToken, FSLibrary, FSLibraryProjectBinding
@@ -13,6 +18,9 @@ from .project import Project,  UserProjectBinding, GroupProjectBinding
 from .report import Report
 
 from .course import CourseCode, Course, UserCourseBinding, UserCourseCodeBinding
+from .courseprestart import CoursePrestart
 from .assignment import Assignment, UserAssignmentBinding
 
+from .garbage import GarbageArchive
+
 
@@ -8,10 +8,11 @@ from django.contrib.auth.models import User
 from django.template.defaulttags import register
 
 from .course import CourseCode, UserCourseCodeBinding, UserCourseBinding
+from .sideeffect import SideEffect
 
 from kooplex.settings import KOOPLEX
 from kooplex.lib import standardize_str, now
-from kooplex.lib.filesystem import Dirname
+from kooplex.lib.filesystem import Dirname, Filename
 
 logger = logging.getLogger(__name__)
 
@@ -142,9 +143,8 @@ class UserAssignmentBinding(models.Model):
 
 @receiver(post_save, sender = Assignment)
 def snapshot_assignment(sender, instance, created, **kwargs):
-    from kooplex.lib.filesystem import snapshot_assignment
     if created:
-        snapshot_assignment(instance)
+        SideEffect.enqueue('snapshot_assignment', 'snapshot_assignment:%d' % instance.id, assignment_id = instance.id)
         if not instance.is_massassignment:
             return
         if instance.state == instance.ST_VALID:
@@ -165,22 +165,41 @@ def add_userassignmentbinding(sender, instance, created, **kwargs):
                 UserAssignmentBinding.objects.create(user = instance.user, assignment = a, expires_at = a.expires_at)
 
 
+@SideEffect.handler('snapshot_assignment', concurrency = 2)
+def _snapshot_assignment(assignment_id):
+    from kooplex.lib.filesystem import snapshot_assignment
+    assignment = Assignment.objects.filter(id = assignment_id).first()
+    if assignment is not None:
+        snapshot_assignment(assignment)
+
+
 @receiver(post_save, sender = UserAssignmentBinding)
 def copy_userassignment(sender, instance, created, **kwargs):
+    phase = 'created' if created else instance.state
+    if phase in [ 'created', UserAssignmentBinding.ST_SUBMITTED, UserAssignmentBinding.ST_COLLECTED, UserAssignmentBinding.ST_CORRECTING, UserAssignmentBinding.ST_FEEDBACK ]:
+        SideEffect.enqueue('cp_userassignment', 'cp_userassignment:%d:%s' % (instance.id, phase), binding_id = instance.id, phase = phase)
+
+@SideEffect.handler('cp_userassignment', concurrency = 4)
+def _copy_userassignment(binding_id, phase):
     from kooplex.lib.filesystem import cp_assignmentsnapshot, cp_userassignment, cp_userassignment2correct
     from .container import Container
-    if created:
-        cp_assignmentsnapshot(instance)
-    elif instance.state in [ UserAssignmentBinding.ST_SUBMITTED, UserAssignmentBinding.ST_COLLECTED ]:
-        cp_userassignment(instance)
-    elif instance.state == UserAssignmentBinding.ST_CORRECTING:
-        cp_userassignment2correct(instance)
-        for c in Container.objects.filter(user = instance.corrector):
-            if c.course == instance.assignment.coursecode.course:
+    binding = UserAssignmentBinding.objects.filter(id = binding_id).select_related('user', 'corrector', 'assignment', 'assignment__coursecode').first()
+    if binding is None:
+        return
+    if phase == 'created':
+        # the snapshot is taken by a parallel worker, retry later
+        assert os.path.exists(Filename.assignmentsnapshot(binding.assignment)), "snapshot of %s is not yet taken" % binding.assignment
+        cp_assignmentsnapshot(binding)
+    elif phase in [ UserAssignmentBinding.ST_SUBMITTED, UserAssignmentBinding.ST_COLLECTED ]:
+        cp_userassignment(binding)
+    elif phase == UserAssignmentBinding.ST_CORRECTING:
+        cp_userassignment2correct(binding)
+        for c in Container.objects.filter(user = binding.corrector):
+            if c.course == binding.assignment.coursecode.course:
                 c.managemount()
-    elif instance.state == UserAssignmentBinding.ST_FEEDBACK:
-        for c in Container.objects.filter(user = instance.user):
-            if c.course == instance.assignment.coursecode.course:
+    elif phase == UserAssignmentBinding.ST_FEEDBACK:
+        for c in Container.objects.filter(user = binding.user):
+            if c.course == binding.assignment.coursecode.course:
                 c.managemount()
 
 
@@ -6,7 +6,7 @@ import time
 
 from django.db import models
 from django.utils import timezone
-from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_init
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from django.contrib.auth.models import User
@@ -16,6 +16,7 @@ from .report import Report
 from .course import Course
 from .volume import Volume, VolumeProjectBinding
 from .image import Image
+from .resourceprofile import ResourceProfile
 from .versioncontrol import VCProjectProjectBinding
 from .filesync import FSLibraryProjectBinding
 
@@ -46,7 +47,12 @@ class Container(models.Model):
     state = models.CharField(max_length = 16, choices = [ (x, ST_LOOKUP[x]) for x in STATE_LIST ], default = ST_NOTPRESENT)
     last_message = models.CharField(max_length = 512, null = True)
     last_message_at = models.DateTimeField(default = None, null = True)
+    resources = models.CharField(max_length = 40, null = True, default = None) # signature of the resource profile the container was created with
+    engine = models.CharField(max_length = 64, null = True, default = None) # the docker engine the container is placed on
+    is_ready = models.BooleanField(default = False) # the notebook server answers, probed by the readinesstracker command
+    ready_at = models.DateTimeField(default = None, null = True)
 
+    TRACKED_FIELDS = [ 'state', 'image', 'last_message', 'marked_to_remove' ]
 
     def __lt__(self, c):
         return self.launched_at < c.launched_at
@@ -169,9 +175,49 @@ class Container(models.Model):
         for volume in VolumeContainerBinding.list_containervolumes(container = self):
             yield volume
 
-    def wait_until_ready(self):
-        from kooplex.lib import keeptrying
-        return keeptrying(method = requests.get, times = 10, url = self.api)
+    @property
+    def resourceprofile(self):
+        return ResourceProfile.resolve(self)
+
+    def check_resources(self):
+        """
+        @summary: if the resource profile of a created container changed, get rid of the docker container so that it is recreated
+        with the new limits at the next start. A running container is only marked to be removed when it is stopped, a stopped one
+        is removed by the containerworker.
+        """
+        # containers created before resource profiles were introduced got the default resources
+        applied = self.resources or ResourceProfile.default().signature
+        if not self.is_created or applied == self.resourceprofile.signature:
+            return
+        logger.info("resource profile of %s changed" % self)
+        if self.is_running:
+            self.marked_to_remove = True
+            self.save()
+        else:
+            from .containerjob import ContainerJob
+            ContainerJob.enqueue(self, ContainerJob.AC_REMOVE)
+
+    @property
+    def pending_job(self):
+        from .containerjob import ContainerJob
+        return ContainerJob.objects.filter(container = self, phase__in = [ ContainerJob.PH_QUEUED, ContainerJob.PH_RUNNING ]).order_by('created_at').first()
+
+    def probe_ready(self, timeout = (1, 2)):
+        """
+        @summary: a single short call to the notebook server, never sleeps. A positive answer is recorded with an update,
+        so the save receivers are not triggered.
+        @returns: whether the notebook server answers
+        """
+        try:
+            requests.get(self.api, timeout = timeout)
+        except requests.exceptions.RequestException as e:
+            logger.debug("%s is not ready -- %s" % (self, e))
+            return False
+        if not self.is_ready:
+            self.is_ready = True
+            self.ready_at = now()
+            Container.objects.filter(id = self.id, state = self.ST_RUNNING).update(is_ready = True, ready_at = self.ready_at)
+        return True
 
     @property
     def n_projects(self):
@@ -273,26 +319,8 @@ class Container(models.Model):
         return os.path.join(self.url, 'notebook', self.proxy_path)
 
     def managemount(self):
-        import threading
-        if hasattr(self, '_timer'):
-            logger.debug("still aggregating...")
-            return
-        else:
-            logger.debug("bla")
-            self._timer = threading.Timer(1, self._managemount)
-            self._timer.start()
-            logger.debug("Aggregating timer started.")
-
-    def _managemount(self):
-        from kooplex.lib import Docker
-        try: 
-            logger.debug("Aggregating timer expired.")
-            assert self.is_created, "%s is not manifested in docker engine"
-            Docker().managemount(self)
-        except Exception as e: 
-            logger.error("cannot manage mapping in container %s -- %s" % (self, e)) 
-        finally:
-            del self._timer
+        from kooplex.lib.mountwriter import schedule
+        schedule(self)
 
     def refresh_state(self):
         from kooplex.lib import Docker 
@@ -301,6 +329,61 @@ class Container(models.Model):
         except TypeError:
             pass
 
+    def refresh_from_db(self, *args, **kwargs):
+        super(Container, self).refresh_from_db(*args, **kwargs)
+        self._snapshot()
+
+    def _snapshot(self):
+        """
+        @summary: record the current values of the tracked fields, deferred fields are left out
+        """
+        self._original = {}
+        for name in self.TRACKED_FIELDS:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                self._original[name] = self.__dict__[attname]
+
+    @property
+    def original(self):
+        """
+        @summary: the values of the tracked fields as stored in the database, or the field defaults of a new instance
+        """
+        if self.id is None:
+            return dict([ (name, self._meta.get_field(name).get_default()) for name in self.TRACKED_FIELDS ])
+        missing = [ self._meta.get_field(name).attname for name in self.TRACKED_FIELDS if not name in self._original ]
+        if missing:
+            stored = Container.objects.filter(id = self.id).values(*missing).first() or {}
+            for name in self.TRACKED_FIELDS:
+                attname = self._meta.get_field(name).attname
+                if attname in stored:
+                    self._original[name] = stored[attname]
+        return self._original
+
+    def old_value(self, name):
+        return self.original[name]
+
+    def has_changed(self, name):
+        return self.old_value(name) != getattr(self, self._meta.get_field(name).attname)
+
+    @property
+    def changed_fields(self):
+        """
+        @summary: the tracked fields changed since the instance was loaded or last saved
+        @returns: a dictionary mapping field names to (old value, new value) tuples, foreign keys are represented by their ids
+        """
+        diff = {}
+        for name in self.TRACKED_FIELDS:
+            old = self.old_value(name)
+            new = getattr(self, self._meta.get_field(name).attname)
+            if old != new:
+                diff[name] = (old, new)
+        return diff
+
+
+@receiver(post_init, sender = Container)
+def container_snapshot(sender, instance, **kwargs):
+    instance._snapshot()
+
 class ContainerEnvironment(models.Model):
     name = models.CharField(max_length = 200, null = False)
     value = models.CharField(max_length = 200, null = False)
@@ -312,35 +395,39 @@ def container_state_change(sender, instance, **kwargs):
     from kooplex.lib import Docker
     from kooplex.lib.proxy import addroute, removeroute
     is_new = instance.id is None
-    logger.debug("DDDD %s"%instance.image)
-    old_instance = Container() if is_new else Container.objects.get(id = instance.id)
+    old_state = instance.old_value('state')
     msg = "%s %s" % (instance.id, is_new)
-    if not is_new and instance.state == old_instance.state:
+    if not is_new and instance.state == old_state:
         return
-    msg += "%s statchange %s -> %s" % (instance, ST_LOOKUP[old_instance.state], ST_LOOKUP[instance.state])
+    msg += "%s statchange %s -> %s" % (instance, ST_LOOKUP[old_state], ST_LOOKUP[instance.state])
     logger.debug(msg)
+    # the readiness tracker probes the notebook server after a start
+    instance.is_ready = False
+    instance.ready_at = None
     docker = Docker()
     # FIXME
     #assert instance.n_projects > 0 or instance.course or instance.report or instance.state == Container.ST_NOTPRESENT, 'container %s with 0 projects' % instance
-    if old_instance.state == Container.ST_NOTPRESENT and instance.state == Container.ST_RUNNING:
+    if old_state == Container.ST_NOTPRESENT and instance.state == Container.ST_RUNNING:
         docker.run_container(instance)
         addroute(instance)
         instance.marked_to_remove = False
+        instance.launched_at = now()
 
-    elif old_instance.state == Container.ST_RUNNING and instance.state == Container.ST_NOTRUNNING:
+    elif old_state == Container.ST_RUNNING and instance.state == Container.ST_NOTRUNNING:
         docker.stop_container(instance)
         removeroute(instance)
         if instance.marked_to_remove:
             docker.remove_container(instance)
             instance.marked_to_remove = False
             instance.state = Container.ST_NOTPRESENT
-    elif old_instance.state == Container.ST_NOTRUNNING and instance.state == Container.ST_RUNNING:
+    elif old_state == Container.ST_NOTRUNNING and instance.state == Container.ST_RUNNING:
         docker.run_container(instance)
         addroute(instance)
-    elif old_instance.state == Container.ST_NOTRUNNING and instance.state == Container.ST_NOTPRESENT:
+        instance.launched_at = now()
+    elif old_state == Container.ST_NOTRUNNING and instance.state == Container.ST_NOTPRESENT:
         docker.remove_container(instance)
         instance.marked_to_remove = False
-    elif old_instance.state == Container.ST_RUNNING and instance.state == Container.ST_NOTPRESENT:
+    elif old_state == Container.ST_RUNNING and instance.state == Container.ST_NOTPRESENT:
         docker.stop_container(instance)
         removeroute(instance)
         docker.remove_container(instance)
@@ -360,9 +447,8 @@ def remove_container_environment(instance, env):
 def container_image_change(sender, instance, **kwargs):
     import pwgen
     is_new = instance.id is None
-    old_instance = Container() if is_new else Container.objects.get(id = instance.id)
-    logger.debug("Changing image from %s to %s"%(old_instance.image, instance.image))
-    if not is_new and old_instance.image != instance.image:
+    if not is_new and instance.has_changed('image'):
+         logger.debug("Changing image of %s from %s to %s" % (instance, instance.old_value('image'), instance.image_id))
          remove_container_environment(instance, 'PASSWORD')
          instance.marked_to_remove = True
          if instance.state == Container.ST_NOTRUNNING:
@@ -372,7 +458,7 @@ def container_image_change(sender, instance, **kwargs):
              instance.state = Container.ST_NOTPRESENT
          if instance.state == Container.ST_NOTPRESENT:
              instance.marked_to_remove = False
-    if instance.image is None:
+    if instance.image_id is None:
         return
     if instance.marked_to_remove:
          remove_container_environment(instance, 'PASSWORD')
@@ -384,14 +470,17 @@ def container_image_change(sender, instance, **kwargs):
 
 @receiver(pre_save, sender = Container)
 def container_message_change(sender, instance, **kwargs):
-    is_new = instance.id is None
-    old_instance = Container() if is_new else Container.objects.get(id = instance.id)
-    if old_instance.last_message != instance.last_message:
+    if instance.has_changed('last_message'):
          logger.debug("msg of %s: %s" % (instance, instance.last_message))
          instance.last_message_at = now()
 
 
 
+@receiver(post_save, sender = Container)
+def container_reset_snapshot(sender, instance, **kwargs):
+    instance._snapshot()
+
+
 @receiver(post_save, sender = Container)
 def bind_home(sender, instance, created, **kwargs):
     if created and instance.report is None:
@@ -631,12 +720,12 @@ class VolumeContainerBinding(models.Model):
 
 @receiver(pre_save, sender = ProjectContainerBinding)
 def update_image(sender, instance, **kwargs):
-    if instance.container.image is None:
-        instance.container.image = instance.project.image
+    if instance.container.image_id is None and instance.project.image_id is not None:
+        instance.container.image_id = instance.project.image_id
         instance.container.save()
-        logger.debug("container (%s) image is set %s" % (instance.container, instance.container.image))
-    if instance.project.image is not None:
-        assert instance.container.image == instance.project.image, "Conflicting images %s =/= %s" % (instance.container.image, instance.project.image)
+        logger.debug("container (%s) image is set %s" % (instance.container, instance.container.image_id))
+    if instance.project.image_id is not None:
+        assert instance.container.image_id == instance.project.image_id, "Conflicting images %s =/= %s" % (instance.container.image, instance.project.image)
 
 
 
@@ -661,6 +750,48 @@ def container_check_image(sender, instance, **kwargs):
 
 
 
+@receiver(pre_save, sender = ResourceProfile)
+def resourceprofile_remember(sender, instance, **kwargs):
+    old = ResourceProfile.objects.filter(id = instance.id).first() if instance.id else None
+    instance._resources_changed = old is not None and old.signature != instance.signature
+
+@receiver(post_save, sender = ResourceProfile)
+def resourceprofile_change(sender, instance, **kwargs):
+    if not getattr(instance, '_resources_changed', False):
+        return
+    containers = Container.objects.exclude(state = Container.ST_NOTPRESENT)
+    query = models.Q(image__resourceprofile = instance) | models.Q(projectcontainerbinding__project__resourceprofile = instance) | models.Q(coursecontainerbinding__course__resourceprofile = instance)
+    for c in containers.filter(query).distinct():
+        c.check_resources()
+
+@receiver(pre_save, sender = Image)
+@receiver(pre_save, sender = Project)
+@receiver(pre_save, sender = Course)
+def resourceprofile_remember_choice(sender, instance, update_fields = None, **kwargs):
+    """
+    @summary: note whether the resource profile of an image, project or course is changed by this save
+    """
+    if instance.id is None or (update_fields is not None and not 'resourceprofile' in update_fields):
+        instance._resourceprofile_changed = False
+        return
+    old = sender.objects.filter(id = instance.id).values_list('resourceprofile_id', flat = True).first()
+    instance._resourceprofile_changed = old != instance.resourceprofile_id
+
+@receiver(post_save, sender = Image)
+def image_resourceprofile_change(sender, instance, **kwargs):
+    if not getattr(instance, '_resourceprofile_changed', False):
+        return
+    for c in Container.objects.filter(image = instance).exclude(state = Container.ST_NOTPRESENT):
+        c.check_resources()
+
+@receiver(post_save, sender = Project)
+def project_resourceprofile_change(sender, instance, **kwargs):
+    if not getattr(instance, '_resourceprofile_changed', False):
+        return
+    for pcb in ProjectContainerBinding.objects.filter(project = instance).exclude(container__state = Container.ST_NOTPRESENT).select_related('container'):
+        pcb.container.check_resources()
+
+
 class CourseContainerBinding(models.Model):
     course = models.ForeignKey(Course, null = False)
     container = models.ForeignKey(Container, null = False)
@@ -672,23 +803,33 @@ class CourseContainerBinding(models.Model):
 @receiver(pre_save, sender = Course)
 def update_courseimage(sender, instance, **kwargs):
     ccbs = CourseContainerBinding.objects.filter(course = instance)
-    for ccb in ccbs:
+    for ccb in ccbs.select_related('container'):
         c = ccb.container
+        if c.image_id == instance.image_id:
+            continue
         if c.is_running or c.is_stopped:
             c.marked_to_remove = True
-        c.image = instance.image
+        c.image_id = instance.image_id
         c.save()
-        logger.debug("container (%s) image is set %s" % (c, c.image))
+        logger.debug("container (%s) image is set %s" % (c, c.image_id))
+
+
+@receiver(post_save, sender = Course)
+def course_resourceprofile_change(sender, instance, **kwargs):
+    if not getattr(instance, '_resourceprofile_changed', False):
+        return
+    for ccb in CourseContainerBinding.objects.filter(course = instance).exclude(container__state = Container.ST_NOTPRESENT).select_related('container'):
+        ccb.container.check_resources()
 
 
 @receiver(pre_save, sender = CourseContainerBinding)
 def update_course_image(sender, instance, **kwargs):
-    if instance.container.image is None:
-        instance.container.image = instance.course.image
+    if instance.container.image_id is None and instance.course.image_id is not None:
+        instance.container.image_id = instance.course.image_id
         instance.container.save()
-        logger.debug("container (%s) image is set %s" % (instance.container, instance.container.image))
-    if instance.course.image is not None:
-        assert instance.container.image == instance.course.image, "Conflicting images %s =/= %s" % (instance.container.image, instance.course.image)
+        logger.debug("container (%s) image is set %s" % (instance.container, instance.container.image_id))
+    if instance.course.image_id is not None:
+        assert instance.container.image_id == instance.course.image_id, "Conflicting images %s =/= %s" % (instance.container.image, instance.course.image)
 
 
 @receiver(post_save, sender = CourseContainerBinding)
@@ -0,0 +1,109 @@
+import logging
+
+from django.db import models
+from django.utils import timezone
+
+from .container import Container
+
+from kooplex.lib import now
+
+logger = logging.getLogger(__name__)
+
+AC_LOOKUP = {
+    'start': 'Start container',
+    'stop': 'Stop container',
+    'remove': 'Remove container',
+}
+
+PH_LOOKUP = {
+    'queued': 'Waiting for a worker',
+    'running': 'Worker is carrying out the transition',
+    'done': 'Transition finished',
+    'failed': 'Transition failed',
+}
+
+class ContainerJob(models.Model):
+    AC_START = 'start'
+    AC_STOP = 'stop'
+    AC_REMOVE = 'remove'
+    ACTION_LIST = [ AC_START, AC_STOP, AC_REMOVE ]
+
+    PH_QUEUED = 'queued'
+    PH_RUNNING = 'running'
+    PH_DONE = 'done'
+    PH_FAILED = 'failed'
+    PHASE_LIST = [ PH_QUEUED, PH_RUNNING, PH_DONE, PH_FAILED ]
+
+    container = models.ForeignKey(Container, null = False)
+    action = models.CharField(max_length = 16, choices = [ (x, AC_LOOKUP[x]) for x in ACTION_LIST ])
+    phase = models.CharField(max_length = 16, choices = [ (x, PH_LOOKUP[x]) for x in PHASE_LIST ], default = PH_QUEUED)
+    created_at = models.DateTimeField(default = timezone.now)
+    started_at = models.DateTimeField(null = True, default = None)
+    finished_at = models.DateTimeField(null = True, default = None)
+    worker = models.CharField(max_length = 64, null = True, default = None)
+    message = models.CharField(max_length = 512, null = True, default = None)
+
+    def __str__(self):
+        return "<ContainerJob %s %s: %s>" % (self.action, self.container, self.phase)
+
+    @property
+    def is_pending(self):
+        return self.phase in [ self.PH_QUEUED, self.PH_RUNNING ]
+
+    @staticmethod
+    def enqueue(container, action):
+        """
+        @summary: queue a state transition of a container for the worker, an identical pending job is reused
+        @returns: the job instance
+        """
+        for job in ContainerJob.objects.filter(container = container, phase__in = [ ContainerJob.PH_QUEUED, ContainerJob.PH_RUNNING ]):
+            if job.action == action:
+                logger.debug("%s is already pending" % job)
+                return job
+        job = ContainerJob.objects.create(container = container, action = action)
+        logger.info("queued %s" % job)
+        return job
+
+    @staticmethod
+    def latest(container):
+        return ContainerJob.objects.filter(container = container).order_by('-created_at').first()
+
+    def run(self):
+        """
+        @summary: carry out the state transition through the usual Container methods, so the pre_save receivers do the docker and proxy work.
+        A start job does not wait for the notebook server to boot, the readinesstracker command takes it over.
+        """
+        container = Container.objects.get(id = self.container_id)
+        try:
+            if self.action == self.AC_START:
+                if not container.is_running:
+                    container.docker_start()
+            elif self.action == self.AC_STOP:
+                if container.is_running:
+                    container.docker_stop()
+            elif self.action == self.AC_REMOVE:
+                container.docker_remove()
+            self.phase = self.PH_DONE
+            self.message = container.last_message
+        except Exception as e:
+            logger.error("%s failed -- %s" % (self, e))
+            self.phase = self.PH_FAILED
+            self.message = str(e)[:512]
+        self.finished_at = now()
+        self.save()
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'container': self.container.name,
+            'container_state': self.container.state,
+            'action': self.action,
+            'phase': self.phase,
+            'phase_long': PH_LOOKUP[self.phase],
+            'message': self.message,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'wait_seconds': ((self.started_at or now()) - self.created_at).total_seconds(),
+            'run_seconds': ((self.finished_at or now()) - self.started_at).total_seconds() if self.started_at else None,
+        }
@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from django.template.defaulttags import register
 
 from .image import Image
+from .resourceprofile import ResourceProfile
 
 from kooplex.settings import KOOPLEX
 from kooplex.lib import standardize_str
@@ -21,6 +22,8 @@ class Course(models.Model):
     folder = models.CharField(max_length = 64, null = False)
     description = models.TextField(max_length = 512, blank = True)
     image = models.ForeignKey(Image, null = True)
+    idle_timeout = models.IntegerField(null = True, blank = True, default = None) # minutes, overrides the idle timeout of the image
+    resourceprofile = models.ForeignKey(ResourceProfile, null = True, blank = True, default = None)
 
     def __str__(self):
         #return "Course: %s" % self.name #FIXME: OperationalError at /admin/hub/course/31/change/ (1366, "Incorrect string value: '\\xC5\\xB1s\\xC3\\xA9g...' for column 'object_repr' at row 1")
@@ -310,14 +313,13 @@ def garbagedir_course(sender, instance, **kwargs):
 
 @receiver(post_save, sender = UserCourseBinding)
 def mkdir_usercourse(sender, instance, created, **kwargs):
-    from kooplex.lib.filesystem import mkdir_course_workdir, grantacl_course_workdir, grantacl_course_share
+    from kooplex.lib.filesystem import mkdir_course_workdir, grantacl_course_workdir, grantacl_course_share, grantacl_usercourse_teachers
     if created:
         grantacl_course_share(instance)
         mkdir_course_workdir(instance)
         grantacl_course_workdir(instance)
         if instance.is_teacher == False:
-            for binding in UserCourseBinding.objects.filter(course = instance.course, is_teacher = True):
-                grantacl_course_workdir(binding)
+            grantacl_usercourse_teachers(instance)
 
 
 @receiver(pre_delete, sender = UserCourseBinding)
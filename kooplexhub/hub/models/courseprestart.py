@@ -0,0 +1,139 @@
+import logging
+
+from django.db import models
+from django.utils import timezone
+from django.contrib.auth.models import User
+
+from .course import Course, UserCourseBinding
+from .container import Container, CourseContainerBinding
+from .containerjob import ContainerJob
+
+from kooplex.lib import now
+
+logger = logging.getLogger(__name__)
+
+ST_LOOKUP = {
+    'scheduled': 'Waiting for the prestart time',
+    'started': 'Student containers are started',
+    'stopped': 'Student containers are stopped',
+    'cancelled': 'Cancelled',
+}
+
+class CoursePrestart(models.Model):
+    """
+    @summary: an exam window of a course. At prestart_at the scheduler queues a start job of the course container of each student,
+    so the workers bring them up with bounded parallelism before the exam. At stop_at the running student containers are queued to stop.
+    """
+    ST_SCHEDULED = 'scheduled'
+    ST_STARTED = 'started'
+    ST_STOPPED = 'stopped'
+    ST_CANCELLED = 'cancelled'
+    STATE_LIST = [ ST_SCHEDULED, ST_STARTED, ST_STOPPED, ST_CANCELLED ]
+
+    course = models.ForeignKey(Course, null = False)
+    creator = models.ForeignKey(User, null = True, default = None)
+    prestart_at = models.DateTimeField(null = False)
+    stop_at = models.DateTimeField(null = True, blank = True, default = None)
+    state = models.CharField(max_length = 16, choices = [ (x, ST_LOOKUP[x]) for x in STATE_LIST ], default = ST_SCHEDULED)
+    created_at = models.DateTimeField(default = timezone.now)
+    started_at = models.DateTimeField(null = True, default = None)
+    stopped_at = models.DateTimeField(null = True, default = None)
+
+    class Meta:
+        ordering = [ 'prestart_at' ]
+
+    def __str__(self):
+        return "<CoursePrestart %s at %s: %s>" % (self.course, self.prestart_at, self.state)
+
+    @staticmethod
+    def iter_due():
+        for prestart in CoursePrestart.objects.filter(state = CoursePrestart.ST_SCHEDULED, prestart_at__lte = now()):
+            yield prestart
+
+    @staticmethod
+    def iter_expired():
+        for prestart in CoursePrestart.objects.filter(state = CoursePrestart.ST_STARTED, stop_at__lte = now()):
+            yield prestart
+
+    @property
+    def students(self):
+        return [ b.user for b in UserCourseBinding.objects.filter(course = self.course, is_teacher = False).select_related('user') ]
+
+    def containers(self):
+        """
+        @summary: the course containers of the students
+        @returns: a dictionary mapping user ids to containers
+        """
+        student_ids = set([ u.id for u in self.students ])
+        containers = {}
+        for b in CourseContainerBinding.objects.filter(course = self.course, container__user_id__in = student_ids).select_related('container'):
+            containers.setdefault(b.container.user_id, b.container)
+        return containers
+
+    def do_prestart(self, dry = False):
+        """
+        @summary: create the missing course containers of the students and queue their start. The container workers carry out the
+        jobs, their concurrency bounds the load on the docker engines, and the usual state transition registers the proxy routes.
+        Containers already running are left alone, so calling it again only picks up the newcomers and the failed ones.
+        @returns: the list of students whose container is queued to start
+        """
+        containers = self.containers()
+        queued = []
+        for student in self.students:
+            container = containers.get(student.id)
+            if container is not None and container.is_running:
+                continue
+            queued.append(student)
+            if dry:
+                continue
+            try:
+                if container is None:
+                    container = Container.get_usercoursecontainer(user = student, course_id = self.course.id, create = True)
+                ContainerJob.enqueue(container, ContainerJob.AC_START)
+            except Exception as e:
+                logger.error("%s cannot prestart container of %s -- %s" % (self, student, e))
+        if not dry and self.state == self.ST_SCHEDULED:
+            self.state = self.ST_STARTED
+            self.started_at = now()
+            self.save()
+        logger.info("%s queued %d containers to start" % (self, len(queued)))
+        return queued
+
+    def do_stop(self, dry = False):
+        """
+        @summary: queue the stop of the running course containers of the students, the containers of the teachers are not touched
+        @returns: the list of containers queued to stop
+        """
+        queued = [ c for c in self.containers().values() if c.is_running ]
+        if not dry:
+            for container in queued:
+                ContainerJob.enqueue(container, ContainerJob.AC_STOP)
+            self.state = self.ST_STOPPED
+            self.stopped_at = now()
+            self.save()
+        logger.info("%s queued %d containers to stop" % (self, len(queued)))
+        return queued
+
+    def readiness(self):
+        """
+        @summary: the per student state of the course containers. A container is ready if it is running and its notebook server answers.
+        @returns: a list of dictionaries with keys student, container, state, phase, message, is_ready
+        """
+        containers = self.containers()
+        latest = {}
+        for job in ContainerJob.objects.filter(container__in = list(containers.values())).order_by('created_at'):
+            latest[job.container_id] = job
+        result = []
+        for student in sorted(self.students, key = lambda u: (u.last_name, u.first_name, u.username)):
+            container = containers.get(student.id)
+            job = latest.get(container.id) if container else None
+            is_ready = container is not None and container.is_running and container.is_ready
+            result.append({
+                'student': student,
+                'container': container,
+                'state': container.get_state_display() if container else 'Not created',
+                'phase': job.get_phase_display() if job else None,
+                'message': job.message if job else None,
+                'is_ready': is_ready,
+            })
+        return result
@@ -0,0 +1,19 @@
+import logging
+
+from django.db import models
+from django.utils import timezone
+from django.contrib.auth.models import User
+
+logger = logging.getLogger(__name__)
+
+class CullEvent(models.Model):
+    container_name = models.CharField(max_length = 200, null = False)
+    user = models.ForeignKey(User, null = False)
+    idle_seconds = models.IntegerField(null = False)
+    threshold_seconds = models.IntegerField(null = False)
+    culled_at = models.DateTimeField(default = timezone.now)
+    is_success = models.BooleanField(default = True)
+    message = models.CharField(max_length = 512, null = True, default = None)
+
+    def __str__(self):
+        return "<CullEvent %s idle %d s %s>" % (self.container_name, self.idle_seconds, 'stopped' if self.is_success else 'failed')
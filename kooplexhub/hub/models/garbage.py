@@ -0,0 +1,136 @@
+import logging
+import datetime
+
+from django.db import models
+from django.utils import timezone
+
+from .sideeffect import SideEffect
+
+from kooplex.settings import KOOPLEX
+from kooplex.lib import now
+
+logger = logging.getLogger(__name__)
+
+garbageconf = KOOPLEX.get('garbage', {})
+
+KIND_LOOKUP = {
+    'home': 'Home folder of a deleted user',
+    'share': 'Share folder of a deleted project',
+    'workdir': 'Workdir of a user leaving a project',
+    'course': 'Course folder of a deleted course',
+    'usercourse': 'Course workdir of a student leaving a course',
+    'report': 'Tagged report folder',
+}
+
+ST_LOOKUP = {
+    'queued': 'Folder is moved aside, waiting to be stored',
+    'stored': 'Folder is stored and removed',
+}
+
+class GarbageArchive(models.Model):
+    """
+    @summary: the index of the garbage store. A folder to be thrown away is moved aside at once, and the sideeffectworker
+    stores it in the content addressed store of kooplex.lib.garbage and removes it later. The scheduler discards the archives
+    older than KOOPLEX['garbage']['max_age_days'] and the oldest ones of an owner beyond KOOPLEX['garbage']['max_bytes_per_owner'].
+    """
+    KIND_LIST = [ 'home', 'share', 'workdir', 'course', 'usercourse', 'report' ]
+    ST_QUEUED = 'queued'
+    ST_STORED = 'stored'
+    STATE_LIST = [ ST_QUEUED, ST_STORED ]
+
+    kind = models.CharField(max_length = 16, choices = [ (x, KIND_LOOKUP[x]) for x in KIND_LIST ])
+    # the username is kept, the user may be deleted with the folder
+    owner = models.CharField(max_length = 150, null = True, default = None)
+    label = models.CharField(max_length = 255, null = False)
+    source = models.CharField(max_length = 512, null = False)
+    staging = models.CharField(max_length = 512, null = True, default = None)
+    state = models.CharField(max_length = 16, choices = [ (x, ST_LOOKUP[x]) for x in STATE_LIST ], default = ST_QUEUED)
+    files = models.IntegerField(default = 0)
+    raw_bytes = models.BigIntegerField(default = 0)
+    stored_bytes = models.BigIntegerField(default = 0)
+    created_at = models.DateTimeField(default = timezone.now)
+    stored_at = models.DateTimeField(null = True, default = None)
+
+    class Meta:
+        ordering = [ '-created_at' ]
+
+    def __str__(self):
+        return "<GarbageArchive %s %s of %s: %s>" % (self.kind, self.label, self.owner, self.state)
+
+    @property
+    def name(self):
+        return "garbage-%d" % self.id
+
+    @staticmethod
+    def collect(kind, folder, owner, label):
+        """
+        @summary: move a folder aside and queue it to be stored, the request or signal does not wait for the archiving
+        @returns: the archive, None if the folder is missing
+        """
+        from kooplex.lib.garbage import stage
+        staging = stage(folder)
+        if staging is None:
+            return None
+        archive = GarbageArchive.objects.create(kind = kind, owner = owner, label = label, source = folder, staging = staging)
+        SideEffect.enqueue('garbage', 'garbage:%d' % archive.id, archive_id = archive.id)
+        return archive
+
+    def do_store(self):
+        from kooplex.lib.garbage import store, unstage
+        stats = store(self.staging, self.name)
+        self.files = stats['files']
+        self.raw_bytes = stats['raw_bytes']
+        self.stored_bytes = stats['stored_bytes']
+        self.state = self.ST_STORED
+        self.stored_at = now()
+        self.save()
+        unstage(self.staging)
+
+    def do_restore(self, target):
+        from kooplex.lib.garbage import restore
+        assert self.state == self.ST_STORED, "%s is not stored yet, the folder is at %s" % (self, self.staging)
+        restore(self.name, target)
+
+    def discard(self):
+        from kooplex.lib.garbage import discard
+        if self.state == self.ST_STORED:
+            discard(self.name)
+        self.delete()
+
+    @staticmethod
+    def iter_expired():
+        """
+        @summary: the stored archives beyond the retention policy, the newest ones of an owner are kept within the size limit,
+        which is applied to the original size of the folders, the chunks shared with other archives are counted for each
+        """
+        max_age = garbageconf.get('max_age_days', 180)
+        max_bytes = garbageconf.get('max_bytes_per_owner', None)
+        deadline = now() - datetime.timedelta(days = max_age)
+        total = {}
+        for archive in GarbageArchive.objects.filter(state = GarbageArchive.ST_STORED).order_by('-created_at'):
+            if archive.created_at < deadline:
+                yield archive
+                continue
+            if max_bytes is None or archive.owner is None:
+                continue
+            # the newest archive of an owner is kept whatever its size
+            is_newest = not archive.owner in total
+            total[archive.owner] = total.get(archive.owner, 0) + archive.raw_bytes
+            if not is_newest and total[archive.owner] > max_bytes:
+                yield archive
+
+    @staticmethod
+    def sweep(dry = False):
+        """
+        @summary: remove the chunks of the discarded archives
+        """
+        from kooplex.lib.garbage import sweep
+        return sweep([ a.name for a in GarbageArchive.objects.filter(state = GarbageArchive.ST_STORED) ], dry = dry)
+
+
+@SideEffect.handler('garbage', concurrency = garbageconf.get('workers', 2))
+def _store_garbage(archive_id):
+    archive = GarbageArchive.objects.filter(id = archive_id).first()
+    if archive is None or archive.state == GarbageArchive.ST_STORED:
+        return
+    archive.do_store()
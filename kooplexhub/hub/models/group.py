@@ -1,6 +1,6 @@
 import logging
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
@@ -10,12 +10,57 @@ from kooplex.settings import KOOPLEX
 logger = logging.getLogger(__name__)
 
 class Group(models.Model):
-    groupid = models.IntegerField(null = False)
-    name = models.CharField(max_length = 32, null = False)
+    groupid = models.IntegerField(null = False, unique = True)
+    name = models.CharField(max_length = 32, null = False, unique = True)
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def get_or_create_named(name):
+        """
+        @summary: the group of the given name, a new one gets the next free group id. Concurrent callers are
+        serialized by the unique name and group id: the one losing the insert picks up the group of the winner,
+        or retries with the next group id.
+        """
+        for attempt in range(5):
+            try:
+                return Group.objects.get(name = name)
+            except Group.DoesNotExist:
+                pass
+            last_gid = Group.objects.all().aggregate(models.Max('groupid'))['groupid__max']
+            gid = KOOPLEX.get('min_groupid', 10000) if last_gid is None else last_gid + 1
+            try:
+                with transaction.atomic():
+                    group = Group.objects.create(name = name, groupid = gid)
+                logger.info("created group: %s (%d)" % (group, gid))
+                return group
+            except IntegrityError as e:
+                logger.debug("group %s or gid %d is taken meanwhile -- %s" % (name, gid, e))
+        return Group.objects.get(name = name)
+
+    @staticmethod
+    def of_project(project):
+        """
+        @summary: the group whose members access the share of the project, used when KOOPLEX['acl']['mode'] is group
+        """
+        return Group.get_or_create_named('prj-%d' % project.id)
+
+    @staticmethod
+    def of_course(course, is_teacher):
+        """
+        @summary: the group of the teachers or of the students of a course, used when KOOPLEX['acl']['mode'] is group
+        """
+        return Group.get_or_create_named('crs-%d-%s' % (course.id, 'teacher' if is_teacher else 'student'))
+
+    def bind(self, user):
+        binding, created = UserGroupBinding.objects.get_or_create(user = user, group = self)
+        return binding
+
+    def unbind(self, user):
+        for binding in UserGroupBinding.objects.filter(user = user, group = self):
+            binding.delete()
+
 class UserGroupBinding(models.Model):
     user = models.ForeignKey(User, null = False)
     group = models.ForeignKey(Group, null = False)
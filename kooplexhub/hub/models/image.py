@@ -4,12 +4,16 @@ from django.db import models
 
 from kooplex.settings import KOOPLEX
 
+from .resourceprofile import ResourceProfile
+
 logger = logging.getLogger(__name__)
 
 class Image(models.Model):
     name = models.CharField(max_length = 32)
     present = models.BooleanField(default = True)
     description = models.CharField(max_length = 250, default="description missing")
+    idle_timeout = models.IntegerField(null = True, blank = True, default = None) # minutes, containers idle longer are stopped
+    resourceprofile = models.ForeignKey(ResourceProfile, null = True, blank = True, default = None)
 
     def __str__(self):
         return self.name
@@ -11,6 +11,8 @@ from django.contrib.auth.models import User
 from kooplex.settings import KOOPLEX
 from kooplex.lib.filesystem import Dirname
 
+from .sideeffect import SideEffect
+
 logger = logging.getLogger(__name__)
 
 class Profile(models.Model):
@@ -160,14 +162,18 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender = User)
 def create_user_home_and_reportprepare(sender, instance, created, **kwargs):
-    from kooplex.lib.filesystem import mkdir_home, mkdir_reportprepare, mkdir_usergarbage
     if created:
-        try:
-            mkdir_home(instance)
-            mkdir_reportprepare(instance)
-            mkdir_usergarbage(instance)
-        except Exception as e:
-            logger.error("Failed to create home for %s -- %s" % (instance, e))
+        SideEffect.enqueue('mkdir_home', 'mkdir_home:%d' % instance.id, user_id = instance.id)
+
+@SideEffect.handler('mkdir_home', concurrency = 4)
+def _mkdir_home(user_id):
+    from kooplex.lib.filesystem import mkdir_home, mkdir_reportprepare, mkdir_usergarbage
+    user = User.objects.filter(id = user_id).first()
+    if user is None:
+        return
+    mkdir_home(user)
+    mkdir_reportprepare(user)
+    mkdir_usergarbage(user)
 
 
 @receiver(post_delete, sender = Profile)
@@ -183,31 +189,41 @@ def garbage_user_home(sender, instance, **kwargs):
 
 
 @receiver(post_save, sender = User)
-def ldap_create_user(sender, instance, created, **kwargs):
-    from kooplex.lib.ldap import Ldap
-    regenerate = False
+def ldap_create_user(sender, instance, created, update_fields = None, **kwargs):
+    # a login saves last_login only, the ldap entry does not depend on it
+    if not created and update_fields is not None and set(update_fields) <= set([ 'last_login' ]):
+        return
+    SideEffect.enqueue('ldap_user', 'ldap_user:%d' % instance.id, user_id = instance.id)
+
+@SideEffect.handler('ldap_user', concurrency = 2)
+def _ldap_create_user(user_id):
+    from kooplex.lib.ldap import Ldap, LdapException
+    user = User.objects.filter(id = user_id).select_related('profile').first()
+    if user is None:
+        return
+    ldap = Ldap()
     try:
-        ldap = Ldap()
-        response = ldap.get_user(instance)
+        response = ldap.get_user(user)
+    except LdapException as e:
+        logger.info("No ldap entry for %s -- %s" % (user, e))
+        response = None
+    if response is not None:
         uidnumber = response.get('attributes', {}).get('uidNumber')
-        if uidnumber != instance.profile.userid:
-            ldap.removeuser(instance)
-            regenerate = True
-    except Exception as e:
-        logger.error("Failed to get ldap entry for %s -- %s" % (instance, e))
-    if created or regenerate:
-        try:
-            ldap.adduser(instance)
-        except Exception as e:
-            logger.error("Failed to create ldap entry for %s -- %s" % (instance, e))
+        if uidnumber == user.profile.userid:
+            return
+        ldap.removeuser(user)
+    ldap.adduser(user)
 
 
 @receiver(post_delete, sender = User)
 def ldap_delete_user(sender, instance, **kwargs):
+    SideEffect.enqueue('ldap_delete_user', 'ldap_delete_user:%s' % instance.username, username = instance.username)
+
+@SideEffect.handler('ldap_delete_user', concurrency = 2)
+def _ldap_delete_user(username):
     from kooplex.lib.ldap import Ldap
-    try:
-        Ldap().removeuser(instance)
-    except Exception as e:
-        logger.error("Failed to remove ldap entry for %s -- %s" % (instance, e))
+    if User.objects.filter(username = username).exists():
+        return
+    Ldap().removeuser(User(username = username))
 
 
@@ -9,6 +9,8 @@ from django.dispatch import receiver
 
 from .image import Image
 from .group import Group
+from .resourceprofile import ResourceProfile
+from .sideeffect import SideEffect
 
 from kooplex.settings import KOOPLEX
 from kooplex.lib import standardize_str
@@ -32,6 +34,7 @@ class Project(models.Model):
     description = models.TextField(null = True)
     image = models.ForeignKey(Image, null = True)
     scope = models.CharField(max_length = 16, choices = [ (x, SCP_LOOKUP[x]) for x in SCOPE_LIST ], default = SCP_PRIVATE)
+    resourceprofile = models.ForeignKey(ResourceProfile, null = True, blank = True, default = None)
 
     def __str__(self):
         return self.name
@@ -39,13 +42,16 @@ class Project(models.Model):
     def __lt__(self, p):
         return self.name < p.name
 
+    _creator = None
     @property
     def creator(self):
-        try:
-            return UserProjectBinding.objects.get(project = self, role = UserProjectBinding.RL_CREATOR).user
-        except UserProjectBinding.DoesNotExist:
-            logger.warning('no creator for %s' % self)
-            return
+        if self._creator is None:
+            try:
+                self._creator = UserProjectBinding.objects.get(project = self, role = UserProjectBinding.RL_CREATOR).user
+            except UserProjectBinding.DoesNotExist:
+                logger.warning('no creator for %s' % self)
+                return
+        return self._creator
 
     @property
     def cleanname(self):
@@ -258,9 +264,24 @@ def assert_single_creator(sender, instance, **kwargs):
 
 @receiver(post_save, sender = UserProjectBinding)
 def mkdir_share(sender, instance, created, **kwargs):
-    from kooplex.lib.filesystem import mkdir_share
-    if created and instance.role == UserProjectBinding.RL_CREATOR:
-        mkdir_share(instance)
+    SideEffect.enqueue('fs_userprojectbinding', 'fs_userprojectbinding:%d' % instance.id, binding_id = instance.id, created = created)
+
+@SideEffect.handler('fs_userprojectbinding', concurrency = 4, sticky = [ 'created' ])
+def _fs_userprojectbinding(binding_id, created):
+    """
+    @summary: create the share folder of the creator, grant access to it to a new member, and create the user's workdir
+    """
+    from kooplex.lib.filesystem import mkdir_share, grantaccess_share, mkdir_workdir, Dirname
+    binding = UserProjectBinding.objects.filter(id = binding_id).select_related('user', 'user__profile', 'project').first()
+    if binding is None:
+        return
+    if created and binding.role == UserProjectBinding.RL_CREATOR:
+        mkdir_share(binding)
+    if created:
+        # the creator's binding may be handled by a parallel worker, retry later
+        assert os.path.isdir(Dirname.share(binding)), "share folder of %s is not yet created" % binding.project
+        grantaccess_share(binding)
+    mkdir_workdir(binding)
 
 @receiver(pre_delete, sender = UserProjectBinding)
 def garbagedir_share(sender, instance, **kwargs):
@@ -269,23 +290,12 @@ def garbagedir_share(sender, instance, **kwargs):
         garbagedir_share(instance)
 
 
-@receiver(post_save, sender = UserProjectBinding)
-def grantaccess_share(sender, instance, created, **kwargs):
-    from kooplex.lib.filesystem import grantaccess_share
-    if created:
-        grantaccess_share(instance)
-
 @receiver(pre_delete, sender = UserProjectBinding)
 def revokeaccess_share(sender, instance, **kwargs):
     from kooplex.lib.filesystem import revokeaccess_share
     revokeaccess_share(instance)
 
 
-@receiver(post_save, sender = UserProjectBinding)
-def mkdir_workdir(sender, instance, created, **kwargs):
-    from kooplex.lib.filesystem import mkdir_workdir
-    mkdir_workdir(instance)
-
 @receiver(pre_delete, sender = UserProjectBinding)
 def archivedir_workdir(sender, instance, **kwargs):
     from kooplex.lib.filesystem import archivedir_workdir
@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from django.dispatch import receiver
 
 from .image import Image
+from .sideeffect import SideEffect
 
 from kooplex.settings import KOOPLEX
 from kooplex.lib import  standardize_str, now, human_localtime, add_report_nginx_api, remove_report_nginx_api
@@ -152,22 +153,32 @@ class Report(models.Model):
 
 
 @receiver(pre_save, sender = Report)
-def snapshot_report(sender, instance, **kwargs):
+def stamp_report(sender, instance, **kwargs):
+    is_new = instance.id is None
+    if is_new:
+        instance.created_at = now()
+
+@receiver(post_save, sender = Report)
+def snapshot_report(sender, instance, created, **kwargs):
+    if created:
+        SideEffect.enqueue('snapshot_report', 'snapshot_report:%d' % instance.id, report_id = instance.id)
+
+@SideEffect.handler('snapshot_report', concurrency = 2)
+def _snapshot_report(report_id):
     from kooplex.lib.filesystem import snapshot_report, prepare_dashboardreport_withinitcell
     from kooplex.lib.proxy import addroute#, removeroute
-    is_new = instance.id is None
-    if not is_new:
+    report = Report.objects.filter(id = report_id).select_related('creator').first()
+    if report is None:
         return
-    instance.created_at = now()
-    snapshot_report(instance)
-    if instance.reporttype == instance.TP_DYNAMIC:
-        prepare_dashboardreport_withinitcell(instance)
-    if instance.reporttype == Report.TP_STATIC:
-        addroute(instance)
-        if instance.password:
-            add_report_nginx_api(instance)
-    if instance.reporttype == Report.TP_BOKEH or instance.reporttype == Report.TP_SHINY:
-        addroute(instance)
+    snapshot_report(report)
+    if report.reporttype == report.TP_DYNAMIC:
+        prepare_dashboardreport_withinitcell(report)
+    if report.reporttype == Report.TP_STATIC:
+        addroute(report)
+        if report.password:
+            add_report_nginx_api(report)
+    if report.reporttype == Report.TP_BOKEH or report.reporttype == Report.TP_SHINY:
+        addroute(report)
 
 
 @receiver(pre_delete, sender = Report)
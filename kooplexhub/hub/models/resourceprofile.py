@@ -0,0 +1,72 @@
+import json
+import hashlib
+import logging
+
+from django.db import models
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESOURCES = {
+    'privileged': True,
+    'mem_limit': '2g',
+    'memswap_limit': '170m',
+    'mem_swappiness': 0,
+    'cpu_shares': 2,
+}
+
+class ResourceProfile(models.Model):
+    """
+    @summary: container resource limits. Fields left empty fall back to KOOPLEX['docker']['resources'].
+    A project's profile overrides the course's, which overrides the image's.
+    """
+    name = models.CharField(max_length = 64, unique = True)
+    mem_limit = models.CharField(max_length = 16, null = True, blank = True, default = None)
+    memswap_limit = models.CharField(max_length = 16, null = True, blank = True, default = None)
+    mem_swappiness = models.IntegerField(null = True, blank = True, default = None)
+    cpu_shares = models.IntegerField(null = True, blank = True, default = None)
+    cpu_quota = models.IntegerField(null = True, blank = True, default = None)
+    cpu_period = models.IntegerField(null = True, blank = True, default = None)
+    pids_limit = models.IntegerField(null = True, blank = True, default = None)
+    shm_size = models.CharField(max_length = 16, null = True, blank = True, default = None)
+
+    FIELDS = [ 'mem_limit', 'memswap_limit', 'mem_swappiness', 'cpu_shares', 'cpu_quota', 'cpu_period', 'pids_limit', 'shm_size' ]
+
+    def __str__(self):
+        return "<ResourceProfile %s>" % self.name
+
+    @property
+    def host_config(self):
+        """
+        @summary: the resource related keyword arguments of docker's create_host_config
+        """
+        resources = dict(DEFAULT_RESOURCES)
+        resources.update(KOOPLEX.get('docker', {}).get('resources', {}))
+        for f in self.FIELDS:
+            value = getattr(self, f)
+            if value is not None:
+                resources[f] = value
+        return resources
+
+    @property
+    def signature(self):
+        return hashlib.sha1(json.dumps(self.host_config, sort_keys = True).encode()).hexdigest()
+
+    @staticmethod
+    def default():
+        return ResourceProfile(name = 'default')
+
+    @staticmethod
+    def resolve(container):
+        """
+        @summary: the profile applying to a container, the first bound project with a profile wins, then the course, then the image
+        """
+        from .container import ProjectContainerBinding, CourseContainerBinding
+        for b in ProjectContainerBinding.objects.filter(container = container, project__resourceprofile__isnull = False).select_related('project__resourceprofile').order_by('id'):
+            return b.project.resourceprofile
+        for b in CourseContainerBinding.objects.filter(container = container, course__resourceprofile__isnull = False).select_related('course__resourceprofile'):
+            return b.course.resourceprofile
+        if container.image_id is not None and container.image.resourceprofile_id is not None:
+            return container.image.resourceprofile
+        return ResourceProfile.default()
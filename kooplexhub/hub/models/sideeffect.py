@@ -0,0 +1,146 @@
+import json
+import logging
+import datetime
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from kooplex.settings import KOOPLEX
+from kooplex.lib import now
+
+logger = logging.getLogger(__name__)
+
+ST_LOOKUP = {
+    'queued': 'Waiting for a worker',
+    'running': 'Worker is carrying out the side effect',
+    'done': 'Side effect carried out',
+    'failed': 'Side effect failed, retries exhausted',
+}
+
+class SideEffect(models.Model):
+    """
+    @summary: the outbox of side effects of model changes. Receivers enqueue records right after the change is saved,
+    and the sideeffectworker command carries them out. Views run in a transaction (ATOMIC_REQUESTS), so the record is
+    committed together with the change, and a rolled back request leaves none behind. Code saving models outside of
+    a request has to wrap the save in transaction.atomic() for the same guarantee.
+    A record is identified by its idempotency key: enqueueing a queued key replaces its payload, a running one is run once more
+    with the new payload when it finishes, and a finished one is rearmed with the new payload. The sticky flags of a kind stay
+    set in the payload until the record is done, so a later enqueue does not drop work that is done only once.
+    """
+    ST_QUEUED = 'queued'
+    ST_RUNNING = 'running'
+    ST_DONE = 'done'
+    ST_FAILED = 'failed'
+    STATE_LIST = [ ST_QUEUED, ST_RUNNING, ST_DONE, ST_FAILED ]
+
+    kind = models.CharField(max_length = 64, null = False)
+    payload = models.TextField(default = '{}')
+    idempotency_key = models.CharField(max_length = 255, unique = True)
+    state = models.CharField(max_length = 16, choices = [ (x, ST_LOOKUP[x]) for x in STATE_LIST ], default = ST_QUEUED)
+    rerun = models.BooleanField(default = False)
+    attempts = models.IntegerField(default = 0)
+    created_at = models.DateTimeField(default = timezone.now)
+    next_attempt_at = models.DateTimeField(default = timezone.now)
+    finished_at = models.DateTimeField(null = True, default = None)
+    worker = models.CharField(max_length = 64, null = True, default = None)
+    last_error = models.CharField(max_length = 512, null = True, default = None)
+
+    _handlers = {}
+
+    def __str__(self):
+        return "<SideEffect %s: %s>" % (self.idempotency_key, self.state)
+
+    @staticmethod
+    def handler(kind, concurrency = 1, retries = 5, sticky = []):
+        """
+        @summary: decorator registering the function carrying out side effects of a kind.
+        The function is called with the payload as keyword arguments, and it must be safe to call more than once.
+        @param concurrency: the number of side effects of this kind a worker runs in parallel
+        @param retries: the number of attempts before the side effect is marked failed
+        @param sticky: boolean payload keys merged with or into a payload not yet carried out
+        """
+        def decorator(f):
+            SideEffect._handlers[kind] = { 'function': f, 'concurrency': concurrency, 'retries': retries, 'sticky': sticky }
+            return f
+        return decorator
+
+    @staticmethod
+    def enqueue(kind, key, **payload):
+        """
+        @summary: record a side effect, within the transaction of the caller if there is one, so the worker sees it when that commits
+        @param kind: the registered kind of the side effect
+        @param key: the idempotency key
+        @param payload: json serializable keyword arguments of the handler
+        @returns: the side effect instance
+        """
+        assert kind in SideEffect._handlers, "No handler registered for side effect %s" % kind
+        with transaction.atomic():
+            effect, created = SideEffect.objects.select_for_update().get_or_create(idempotency_key = key, defaults = { 'kind': kind, 'payload': json.dumps(payload) })
+            if created:
+                logger.debug("queued %s" % effect)
+                return effect
+            if effect.state != SideEffect.ST_DONE:
+                # the former payload is not carried out yet, or it is being carried out and may fail
+                pending = json.loads(effect.payload)
+                for k in SideEffect._handlers[kind]['sticky']:
+                    payload[k] = bool(payload.get(k) or pending.get(k))
+            if effect.state == SideEffect.ST_QUEUED:
+                effect.kind = kind
+                effect.payload = json.dumps(payload)
+                effect.save()
+            elif effect.state == SideEffect.ST_RUNNING:
+                effect.kind = kind
+                effect.payload = json.dumps(payload)
+                effect.rerun = True
+                effect.save()
+                logger.debug("%s is running, rerun requested" % effect)
+            elif effect.state in [ SideEffect.ST_DONE, SideEffect.ST_FAILED ]:
+                effect.kind = kind
+                effect.payload = json.dumps(payload)
+                effect.state = SideEffect.ST_QUEUED
+                effect.attempts = 0
+                effect.next_attempt_at = now()
+                effect.finished_at = None
+                effect.last_error = None
+                effect.save()
+                logger.debug("rearmed %s" % effect)
+        return effect
+
+    @property
+    def concurrency(self):
+        return self._handlers[self.kind]['concurrency']
+
+    def run(self):
+        """
+        @summary: call the handler, on failure schedule a retry with exponential backoff until the retries of the kind are exhausted
+        """
+        conf = KOOPLEX.get('outbox', {})
+        try:
+            h = self._handlers[self.kind]
+            h['function'](**json.loads(self.payload))
+            error = None
+        except Exception as e:
+            logger.error("%s failed -- %s" % (self, e))
+            error = str(e)[:512]
+        with transaction.atomic():
+            effect = SideEffect.objects.select_for_update().get(id = self.id)
+            effect.attempts += 1
+            effect.worker = None
+            if effect.rerun:
+                effect.rerun = False
+                effect.state = SideEffect.ST_QUEUED
+                effect.attempts = 0
+                effect.next_attempt_at = now()
+            elif error is None:
+                effect.state = SideEffect.ST_DONE
+                effect.finished_at = now()
+            elif effect.attempts >= self._handlers.get(self.kind, {}).get('retries', 1):
+                effect.state = SideEffect.ST_FAILED
+                effect.finished_at = now()
+            else:
+                backoff = min(conf.get('backoff', 5) * 2 ** (effect.attempts - 1), conf.get('backoff_max', 600))
+                effect.state = SideEffect.ST_QUEUED
+                effect.next_attempt_at = now() + datetime.timedelta(seconds = backoff)
+            effect.last_error = error
+            effect.save()
+        return effect
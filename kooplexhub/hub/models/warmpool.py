@@ -0,0 +1,44 @@
+import logging
+
+from django.db import models
+from django.utils import timezone
+
+from .image import Image
+
+logger = logging.getLogger(__name__)
+
+class ImagePool(models.Model):
+    image = models.OneToOneField(Image, null = False)
+    min_size = models.IntegerField(default = 0)
+    max_size = models.IntegerField(default = 0)
+    is_active = models.BooleanField(default = True)
+
+    def __str__(self):
+        return "<ImagePool %s [%d-%d]>" % (self.image, self.min_size, self.max_size)
+
+    @property
+    def n_pooled(self):
+        return PooledContainer.objects.filter(image = self.image).count()
+
+
+class PooledContainer(models.Model):
+    name = models.CharField(max_length = 200, unique = True)
+    image = models.ForeignKey(Image, null = False)
+    engine = models.CharField(max_length = 64, null = True, default = None)
+    # the sorted names of the mounted volumes, a container is adopted only if it mounts exactly these
+    volumes = models.CharField(max_length = 512, null = False, default = '')
+    created_at = models.DateTimeField(default = timezone.now)
+
+    def __str__(self):
+        return "<PooledContainer %s>" % self.name
+
+
+class PoolAdoption(models.Model):
+    image = models.ForeignKey(Image, null = False)
+    container_name = models.CharField(max_length = 200, null = False)
+    is_hit = models.BooleanField(default = False)
+    latency = models.FloatField(null = True, default = None)
+    adopted_at = models.DateTimeField(default = timezone.now)
+
+    def __str__(self):
+        return "<PoolAdoption %s %s %s>" % (self.container_name, 'hit' if self.is_hit else 'miss', self.latency)
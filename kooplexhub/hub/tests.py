@@ -1,3 +1,136 @@
-from django.test import TestCase
+import json
+import time
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import transaction, connection
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+
+from hub.models import Container, ContainerJob, SideEffect
+from hub.models import Image, ImagePool, PoolAdoption, Volume, VolumeContainerBinding
+from kooplex.lib.warmpool import pool_volumes, refill, adopt
+
+class ContainerChangeTrackingTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(username = 'tracked')
+        self.container_id = Container.objects.create(name = 'tracked-container', user = user).id
+
+    def test_save_is_a_single_query(self):
+        container = Container.objects.get(id = self.container_id)
+        container.last_message = 'hello'
+        with self.assertNumQueries(1):
+            container.save()
+        self.assertIsNotNone(container.last_message_at)
+        with self.assertNumQueries(1):
+            container.save()
+
+    def test_changed_fields(self):
+        container = Container.objects.get(id = self.container_id)
+        self.assertEqual(container.changed_fields, {})
+        container.last_message = 'hello'
+        self.assertEqual(container.changed_fields, { 'last_message': (None, 'hello') })
+        self.assertTrue(container.has_changed('last_message'))
+        self.assertFalse(container.has_changed('state'))
+        container.save()
+        self.assertEqual(container.changed_fields, {})
+
+    def test_deferred_fields_are_loaded_once(self):
+        container = Container.objects.only('id', 'name').get(id = self.container_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(container.old_value('state'), Container.ST_NOTPRESENT)
+        with self.assertNumQueries(0):
+            self.assertEqual(container.old_value('image'), None)
+
+
+class SideEffectOutboxTest(TestCase):
+    def test_requests_are_atomic(self):
+        self.assertTrue(settings.DATABASES['default'].get('ATOMIC_REQUESTS'))
+
+    def test_rolled_back_save_leaves_no_side_effect(self):
+        class Rollback(Exception):
+            pass
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username = 'rolledback')
+                self.assertTrue(SideEffect.objects.filter(idempotency_key = 'mkdir_home:%d' % user.id).exists())
+                raise Rollback()
+        except Rollback:
+            pass
+        self.assertFalse(User.objects.filter(username = 'rolledback').exists())
+        self.assertFalse(SideEffect.objects.exists())
+
+    def test_sticky_flag_survives_a_later_enqueue(self):
+        key = 'fs_userprojectbinding:0'
+        SideEffect.enqueue('fs_userprojectbinding', key, binding_id = 0, created = True)
+        effect = SideEffect.enqueue('fs_userprojectbinding', key, binding_id = 0, created = False)
+        self.assertEqual(json.loads(effect.payload), { 'binding_id': 0, 'created': True })
+        effect.state = SideEffect.ST_DONE
+        effect.save()
+        effect = SideEffect.enqueue('fs_userprojectbinding', key, binding_id = 0, created = False)
+        self.assertEqual(json.loads(effect.payload), { 'binding_id': 0, 'created': False })
+
+
+class ContainerJobClaimTest(TransactionTestCase):
+    def test_interleaved_claims_keep_one_job_per_container(self):
+        from hub.management.commands import containerworker
+        user = User.objects.create(username = 'claimer')
+        container = Container.objects.create(name = 'claimed-container', user = user)
+        first = ContainerJob.objects.create(container = container, action = ContainerJob.AC_STOP)
+        ContainerJob.objects.create(container = container, action = ContainerJob.AC_START)
+        a, b = containerworker.Command(), containerworker.Command()
+        a.worker, b.worker = 'test:1', 'test:2'
+        marking = threading.Event()
+        claimed = {}
+        now = containerworker.now
+
+        def slow_now():
+            # worker a holds the lock while worker b starts its claim
+            if threading.current_thread().name == 'a':
+                marking.set()
+                time.sleep(.5)
+            return now()
+
+        def claim(worker):
+            try:
+                claimed[worker.worker] = worker.claim(2)
+            finally:
+                connection.close()
+
+        with mock.patch.object(containerworker, 'now', slow_now):
+            ta = threading.Thread(target = claim, args = (a,), name = 'a')
+            ta.start()
+            marking.wait()
+            tb = threading.Thread(target = claim, args = (b,), name = 'b')
+            tb.start()
+            ta.join()
+            tb.join()
+        self.assertEqual([ j.id for j in claimed['test:1'] ], [ first.id ])
+        self.assertEqual(claimed['test:2'], [])
+
+
+class WarmPoolVolumeSetTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(username = 'pooler')
+        self.image = Image.objects.create(name = 'mixed')
+        ImagePool.objects.create(image = self.image, min_size = 1, max_size = 2)
+        Volume.objects.create(name = 'home', displayname = 'home', volumetype = Volume.HOME)
+        share = Volume.objects.create(name = 'share', displayname = 'share', volumetype = Volume.SHARE)
+        course = Volume.objects.create(name = 'course', displayname = 'course', volumetype = Volume.COURSE_SHARE)
+        # home is bound to both containers when they are created
+        self.project_container = Container.objects.create(name = 'project-container', user = user, image = self.image)
+        VolumeContainerBinding.objects.create(container = self.project_container, volume = share)
+        self.course_container = Container.objects.create(name = 'course-container', user = user, image = self.image)
+        VolumeContainerBinding.objects.create(container = self.course_container, volume = course)
+
+    def test_mixed_image_has_a_volume_set_per_kind(self):
+        self.assertEqual(set(pool_volumes(self.image).keys()), set([ 'home,share', 'course,home' ]))
+
+    def test_each_kind_adopts_its_own_pooled_container(self):
+        docker = mock.Mock()
+        docker.adopt_pooled.side_effect = lambda pooled, container: { 'Name': container.name, 'volumes': pooled.volumes }
+        self.assertEqual(refill(docker), [ (self.image, 2, 0) ])
+        self.assertEqual(adopt(docker, self.course_container)['volumes'], 'course,home')
+        self.assertEqual(adopt(docker, self.project_container)['volumes'], 'home,share')
+        self.assertEqual(PoolAdoption.objects.filter(is_hit = True).count(), 2)
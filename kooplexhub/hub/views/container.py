@@ -5,15 +5,17 @@ from django.conf.urls import url
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.shortcuts import render, redirect
+from django.http import JsonResponse, StreamingHttpResponse
 import django_tables2 as tables
 from django_tables2 import RequestConfig
 
+from kooplex.settings import KOOPLEX
 from kooplex.lib import standardize_str
 
 from hub.forms import table_projects
 from hub.models import Image
 from hub.models import Project, UserProjectBinding
-from hub.models import Container, ContainerEnvironment
+from hub.models import Container, ContainerEnvironment, ContainerJob
 from hub.models import ProjectContainerBinding
 
 logger = logging.getLogger(__name__)
@@ -64,7 +66,8 @@ def startprojectcontainer(request, project_id, next_page):
     user = request.user
     try:
         container = Container.get_userprojectcontainer(user = user, project_id = project_id, create = True)
-        container.docker_start()
+        ContainerJob.enqueue(container, ContainerJob.AC_START)
+        messages.info(request, 'Container %s is being started' % container.name)
         showpass(request, container)
     except Container.DoesNotExist:
         messages.error(request, 'Project does not exist')
@@ -81,7 +84,11 @@ def startcoursecontainer(request, course_id, next_page):
     container = None
     try:
         container = Container.get_usercoursecontainer(user = user, course_id = course_id, create = True)
-        container.docker_start()
+        if container.is_running and container.pending_job is None:
+            # prestarted for an exam
+            return redirect('container:open', container.id, next_page)
+        ContainerJob.enqueue(container, ContainerJob.AC_START)
+        messages.info(request, 'Container %s is being started' % container.name)
         showpass(request, container)
     except Container.DoesNotExist:
         messages.error(request, 'Course does not exist')
@@ -97,7 +104,8 @@ def startcontainer(request, container_id, next_page):
     user = request.user
     try:
         container = Container.objects.get(user = user, id = container_id)
-        container.docker_start()
+        ContainerJob.enqueue(container, ContainerJob.AC_START)
+        messages.info(request, 'Container %s is being started' % container.name)
         showpass(request, container)
     except Container.DoesNotExist:
         messages.error(request, 'Container does not exist')
@@ -113,8 +121,9 @@ def opencontainer(request, container_id, next_page):
     user = request.user
     try:
         container = Container.objects.get(id = container_id, user = user, state = Container.ST_RUNNING)
-        container.wait_until_ready()
-        return redirect(container.url_external)
+        if container.is_ready or container.probe_ready():
+            return redirect(container.url_external)
+        messages.info(request, 'Container %s is still booting, it opens as soon as it is ready' % container.name)
     except Container.DoesNotExist:
         messages.error(request, 'Container is missing or stopped')
     return redirect(next_page)
@@ -126,7 +135,8 @@ def stopcontainer(request, container_id, next_page):
     user = request.user
     try:
         container = Container.objects.get(id = container_id, user = user, state = Container.ST_RUNNING)
-        container.docker_stop()
+        ContainerJob.enqueue(container, ContainerJob.AC_STOP)
+        messages.info(request, 'Container %s is being stopped' % container.name)
     except Container.DoesNotExist:
         messages.error(request, 'Container is missing or stopped')
     return redirect(next_page)
@@ -138,7 +148,8 @@ def removecontainer(request, container_id, next_page):
     user = request.user
     try:
         container = Container.objects.get(id = container_id, user = user)
-        container.docker_remove()
+        ContainerJob.enqueue(container, ContainerJob.AC_REMOVE)
+        messages.info(request, 'Container %s is being removed' % container.name)
     except Container.DoesNotExist:
         messages.error(request, 'Container is missing or stopped')
     return redirect(next_page)
@@ -215,6 +226,59 @@ def addproject(request, container_id):
         return redirect(next_page)
 
 
+@login_required
+def jobstatus(request, container_id):
+    """Reports the phase and timings of the latest lifecycle job of a container"""
+    try:
+        container = Container.objects.get(id = container_id, user = request.user)
+    except Container.DoesNotExist:
+        return JsonResponse({ 'error': 'Container does not exist' }, status = 404)
+    job = ContainerJob.latest(container)
+    if job is None:
+        return JsonResponse({ 'container': container.name, 'container_state': container.state, 'phase': None })
+    return JsonResponse(job.as_dict())
+
+
+@login_required
+def readiness(request, container_id):
+    """Reports whether the notebook server of a container is ready. It answers at once from the fields kept up to date
+    by the readinesstracker, the browser polls it, so no worker waits for a container to boot."""
+    r = Container.objects.filter(id = container_id, user = request.user).values('state', 'is_ready').first()
+    if r is None:
+        return JsonResponse({ 'error': 'Container does not exist' }, status = 404)
+    r['is_running'] = r['state'] == Container.ST_RUNNING
+    return JsonResponse(r)
+
+
+@login_required
+def containerlogs(request, container_id):
+    """Streams the tail of the docker log of a container, and optionally follows it.
+    The amount and the follow time are capped by KOOPLEX['logs']."""
+    from kooplex.lib import Docker
+    logconf = KOOPLEX.get('logs', {})
+    try:
+        if request.user.is_superuser:
+            container = Container.objects.get(id = container_id)
+        else:
+            container = Container.objects.get(id = container_id, user = request.user)
+        assert container.is_created, "Container is not present"
+        tail = min(int(request.GET.get('tail', 200)), logconf.get('max_tail', 5000))
+        follow = request.GET.get('follow') == '1'
+    except (Container.DoesNotExist, AssertionError, ValueError) as e:
+        return JsonResponse({ 'error': str(e) }, status = 404)
+    def chunks():
+        try:
+            for chunk in Docker().logs(container, tail = tail, follow = follow, max_bytes = logconf.get('max_bytes', 2 ** 20), seconds = logconf.get('follow_seconds', 60)):
+                yield chunk
+        except Exception as e:
+            logger.error("cannot stream logs of %s -- %s" % (container, e))
+            yield ("\n[cannot read logs -- %s]\n" % e).encode()
+    response = StreamingHttpResponse(chunks(), content_type = 'text/plain; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def refreshlogs(request, container_id):
     container = Container.objects.get(id = container_id)
@@ -230,6 +294,9 @@ urlpatterns = [
     url(r'^remove/(?P<container_id>\d+)/(?P<next_page>\w+:?\w*)$', removecontainer, name = 'remove'),
     url(r'^destroy/(?P<container_id>\d+)/(?P<next_page>\w+:?\w*)$', destroycontainer, name = 'destroy'),
     url(r'^refreshlogs/(?P<container_id>\d+)$', refreshlogs, name = 'refreshlogs'),
+    url(r'^job/(?P<container_id>\d+)$', jobstatus, name = 'job'),
+    url(r'^readiness/(?P<container_id>\d+)$', readiness, name = 'readiness'),
+    url(r'^logs/(?P<container_id>\d+)$', containerlogs, name = 'logs'),
 
     url(r'^addproject/(?P<container_id>\d+)$', addproject, name = 'addproject'),
     url(r'^startproject/(?P<project_id>\d+)/(?P<next_page>\w+:?\w*)$', startprojectcontainer, name = 'startprojectcontainer'),
@@ -8,7 +8,7 @@ from django.contrib import messages
 from django.shortcuts import redirect, render
 from django_tables2 import RequestConfig
 
-from hub.models import CourseCode, Course, UserCourseCodeBinding, UserCourseBinding
+from hub.models import CourseCode, Course, UserCourseCodeBinding, UserCourseBinding, CoursePrestart
 from hub.models import Assignment, UserAssignmentBinding
 from hub.models import Image
 
@@ -457,6 +457,85 @@ def submitassignment(request, course_id):
     return redirect('education:courses')
 
 
+@login_required
+def prestart(request, course_id):
+    """Schedules the prestart of the student containers for an exam and reports their readiness"""
+    user = request.user
+    logger.debug("user %s, method: %s" % (user, request.method))
+    try:
+        course = Course.objects.get(id = course_id)
+        UserCourseBinding.objects.get(user = user, course = course, is_teacher = True)
+    except (Course.DoesNotExist, UserCourseBinding.DoesNotExist) as e:
+        logger.error("Invalid request with course id %s and user %s -- %s" % (course_id, user, e))
+        return redirect('education:teaching')
+    if request.method == 'POST':
+        button = request.POST.get('button')
+        try:
+            if button == 'schedule':
+                timenow = now()
+                prestart_at = translate_date(request.POST.get('prestart_at')) or timenow
+                stop_at = translate_date(request.POST.get('stop_at'))
+                assert prestart_at >= timenow, "You try to schedule the prestart behind time."
+                if stop_at:
+                    assert stop_at > prestart_at, "The containers are to be stopped after they are started."
+                p = CoursePrestart.objects.create(course = course, creator = user, prestart_at = prestart_at, stop_at = stop_at)
+                messages.info(request, 'Containers of course %s are started at %s' % (course.name, p.prestart_at))
+            else:
+                p = CoursePrestart.objects.get(id = request.POST.get('prestart_id'), course = course)
+                if button == 'cancel':
+                    assert p.state == CoursePrestart.ST_SCHEDULED, "Only scheduled prestarts can be cancelled"
+                    p.state = CoursePrestart.ST_CANCELLED
+                    p.save()
+                elif button == 'start':
+                    n = len(p.do_prestart())
+                    messages.info(request, '%d containers are queued to start' % n)
+                elif button == 'stop':
+                    n = len(p.do_stop())
+                    messages.info(request, '%d containers are queued to stop' % n)
+        except Exception as e:
+            logger.error("prestart %s of course %s by %s -- %s" % (button, course, user, e))
+            messages.error(request, 'Cannot %s prestart -- %s' % (button, e))
+        return redirect('education:prestart', course.id)
+    prestarts = CoursePrestart.objects.filter(course = course).exclude(state = CoursePrestart.ST_CANCELLED)
+    current = prestarts.filter(state = CoursePrestart.ST_STARTED).last() or prestarts.filter(state = CoursePrestart.ST_SCHEDULED).first()
+    # without a prestart the table still follows the containers of the students, e.g. the progress of a bulk stop
+    readiness = (current or CoursePrestart(course = course)).readiness()
+    context_dict = {
+        'course': course,
+        'prestarts': prestarts,
+        'current': current,
+        'readiness': readiness,
+        'n_ready': len([ r for r in readiness if r['is_ready'] ]),
+        'menu_teaching': 'active',
+        'submenu': 'prestart',
+        'next_page': 'education:teaching',
+    }
+    return render(request, 'edu/assignment-teacher.html', context = context_dict)
+
+
+
+@login_required
+def stopcontainers(request, course_id):
+    """Queues the stop of the running containers of the students of a course in one go"""
+    from kooplex.lib.bulkstop import select, stop
+    user = request.user
+    try:
+        course = Course.objects.get(id = course_id)
+        UserCourseBinding.objects.get(user = user, course = course, is_teacher = True)
+    except (Course.DoesNotExist, UserCourseBinding.DoesNotExist) as e:
+        logger.error("Invalid request with course id %s and user %s -- %s" % (course_id, user, e))
+        return redirect('education:teaching')
+    if request.method == 'POST':
+        try:
+            idle = request.POST.get('idle_hours')
+            idle_hours = float(idle) if idle else None
+            jobs = stop(select(course = course, idle_hours = idle_hours, exclude_teachers = True))
+            messages.info(request, '%d containers of course %s are queued to stop' % (len(jobs), course.name))
+        except Exception as e:
+            logger.error("bulk stop of course %s by %s -- %s" % (course, user, e))
+            messages.error(request, 'Cannot stop containers -- %s' % e)
+    return redirect('education:prestart', course.id)
+
 
 urlpatterns = [
     url(r'^teaching/?$', teaching, name = 'teaching'),
@@ -468,4 +547,6 @@ urlpatterns = [
     url(r'^feedback/(?P<course_id>\d+)$', feedbackassignment, name = 'feedback'),
     url(r'^summary/(?P<course_id>\d+)$', summaryassignment, name = 'summary'),
     url(r'^submitassignment/(?P<course_id>\d+)$', submitassignment, name = 'submitassignment'),
+    url(r'^prestart/(?P<course_id>\d+)$', prestart, name = 'prestart'),
+    url(r'^stopcontainers/(?P<course_id>\d+)$', stopcontainers, name = 'stopcontainers'),
 ]
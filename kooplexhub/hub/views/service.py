@@ -11,7 +11,7 @@ from django_tables2 import RequestConfig
 #from django.utils.translation import gettext_lazy as _
 #from django.db.models import Q
 #
-from kooplex.lib import list_projects, impersonator_clone, impersonator_removecache
+from kooplex.lib import list_projects, impersonator_clone_many, impersonator_removecache
 from kooplex.lib import list_libraries, impersonator_sync
 from kooplex.lib import now
 #
@@ -206,16 +206,15 @@ def vc_commit(request):
     request_rmcache = request.POST.getlist('removecache')
     clone_folders = []
     rmcache = []
-    for r_id in request_clone:
-        try:
-            r = VCProject.objects.get(token__user = user, cloned = False, id = r_id)
-            r.clone_folder = impersonator_clone(r)
-            r.cloned = True
-            r.save()
-            clone_folders.append(r.clone_folder)
-        except Exception as e:
+    for r, clone_folder, e in impersonator_clone_many(VCProject.objects.filter(token__user = user, cloned = False, id__in = request_clone).select_related('token__user', 'token__repository')):
+        if e is not None:
             logger.error(e)
             messages.error(request, "clone oops -- {}".format(e))
+            continue
+        r.clone_folder = clone_folder
+        r.cloned = True
+        r.save()
+        clone_folders.append(r.clone_folder)
     for r_id in request_rmcache:
         try:
             r = VCProject.objects.get(token__user = user, cloned = True, id = r_id)
@@ -0,0 +1,329 @@
+"""
+@author: Jozsef Steger
+@summary: POSIX ACL engine. A batch of grant and revoke operations is merged per folder, and each folder tree is walked once
+with os.scandir, the system.posix_acl_access and system.posix_acl_default extended attributes are read and written directly.
+The subtrees are spread over a worker pool. Where the filesystem does not support the extended attributes, setfacl is run once per folder.
+"""
+import os
+import time
+import errno
+import struct
+import logging
+import threading
+import subprocess
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+aclconf = KOOPLEX.get('acl', {})
+
+XATTR_ACCESS = 'system.posix_acl_access'
+XATTR_DEFAULT = 'system.posix_acl_default'
+
+ACL_VERSION = 2
+TAG_USER_OBJ = 0x01
+TAG_USER = 0x02
+TAG_GROUP_OBJ = 0x04
+TAG_GROUP = 0x08
+TAG_MASK = 0x10
+TAG_OTHER = 0x20
+UNDEFINED_ID = 0xffffffff
+
+_HEADER = struct.Struct('<I')
+_ENTRY = struct.Struct('<HHI')
+
+Op = namedtuple('Op', [ 'folder', 'tag', 'qualifier', 'perms', 'default' ])
+
+def grant(folder, uid, perms = 'rwX', default = False):
+    """
+    @summary: an operation granting a user access to a folder tree
+    @param perms: like setfacl, X stands for execute permission on directories and on files executable by someone
+    @param default: also set the entry in the default ACL of the directories, so new files inherit it
+    """
+    return Op(os.path.normpath(folder), TAG_USER, uid, perms, default)
+
+def revoke(folder, uid, default = False):
+    """
+    @summary: an operation removing the entry of a user from the ACLs of a folder tree
+    """
+    return Op(os.path.normpath(folder), TAG_USER, uid, None, default)
+
+def grant_group(folder, gid, perms = 'rwX', default = False):
+    return Op(os.path.normpath(folder), TAG_GROUP, gid, perms, default)
+
+def revoke_group(folder, gid, default = False):
+    return Op(os.path.normpath(folder), TAG_GROUP, gid, None, default)
+
+def merge(ops):
+    """
+    @summary: group the operations by folder, a later operation of the same entry and folder overrides the former
+    @returns: an ordered dictionary mapping folders to ordered dictionaries of (tag, qualifier) -> (perms, default), perms None means revoke
+    """
+    merged = OrderedDict()
+    for op in ops:
+        changes = merged.setdefault(op.folder, OrderedDict())
+        changes.pop((op.tag, op.qualifier), None)
+        changes[(op.tag, op.qualifier)] = (op.perms, op.default)
+    return merged
+
+def decode(blob):
+    """
+    @summary: parse the value of a posix_acl extended attribute
+    @returns: a dictionary mapping (tag, qualifier) to permission bits
+    """
+    version, = _HEADER.unpack_from(blob)
+    assert version == ACL_VERSION, "Unsupported ACL version %d" % version
+    entries = {}
+    for offset in range(_HEADER.size, len(blob), _ENTRY.size):
+        tag, perm, qualifier = _ENTRY.unpack_from(blob, offset)
+        entries[(tag, qualifier if tag in [ TAG_USER, TAG_GROUP ] else UNDEFINED_ID)] = perm
+    return entries
+
+def encode(entries):
+    # the kernel expects the entries ordered by tag and qualifier
+    return _HEADER.pack(ACL_VERSION) + b''.join([ _ENTRY.pack(tag, entries[(tag, qualifier)], qualifier) for tag, qualifier in sorted(entries.keys()) ])
+
+def from_mode(mode):
+    """
+    @summary: the minimal ACL equivalent to the permission bits of a file
+    """
+    return {
+        (TAG_USER_OBJ, UNDEFINED_ID): (mode >> 6) & 7,
+        (TAG_GROUP_OBJ, UNDEFINED_ID): (mode >> 3) & 7,
+        (TAG_OTHER, UNDEFINED_ID): mode & 7,
+    }
+
+def permbits(perms, is_dir, mode):
+    bits = 0
+    for c in perms:
+        if c == 'r':
+            bits |= 4
+        elif c == 'w':
+            bits |= 2
+        elif c == 'x' or (c == 'X' and (is_dir or mode & 0o111)):
+            bits |= 1
+    return bits
+
+def modified(entries, changes, is_dir, mode):
+    """
+    @summary: apply the named entry changes to an ACL, and recalculate the mask the way setfacl does
+    @returns: the new ACL entries
+    """
+    acl = dict(entries)
+    for key, (perms, _) in changes.items():
+        if perms is None:
+            acl.pop(key, None)
+        else:
+            acl[key] = permbits(perms, is_dir, mode)
+    named = [ p for (tag, _), p in acl.items() if tag in [ TAG_USER, TAG_GROUP ] ]
+    if named or (TAG_MASK, UNDEFINED_ID) in acl:
+        mask = acl.get((TAG_GROUP_OBJ, UNDEFINED_ID), 0)
+        for p in named:
+            mask |= p
+        acl[(TAG_MASK, UNDEFINED_ID)] = mask
+    return acl
+
+def read_acl(path, mode):
+    try:
+        return decode(os.getxattr(path, XATTR_ACCESS, follow_symlinks = False))
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return from_mode(mode)
+        raise
+
+def read_default(path):
+    try:
+        return decode(os.getxattr(path, XATTR_DEFAULT, follow_symlinks = False))
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return {}
+        raise
+
+def named_entries(path, default = False):
+    """
+    @summary: the named user and group entries of the access or the default ACL, no stat call is needed
+    @returns: a dictionary mapping (tag, qualifier) to permission bits
+    """
+    try:
+        entries = decode(os.getxattr(path, XATTR_DEFAULT if default else XATTR_ACCESS, follow_symlinks = False))
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return {}
+        raise
+    return dict([ (k, p) for k, p in entries.items() if k[0] in [ TAG_USER, TAG_GROUP ] ])
+
+def _base(entries):
+    return dict([ (k, p) for k, p in entries.items() if k[0] in [ TAG_USER_OBJ, TAG_GROUP_OBJ, TAG_OTHER ] ])
+
+
+class Stats:
+    """
+    @summary: thread safe counters of a batch, only the first few errors are kept
+    """
+    MAX_ERRORS = 20
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.folders = 0
+        self.entries = 0
+        self.changed = 0
+        self.fallbacks = 0
+        self.n_errors = 0
+        self.errors = []
+        self.seconds = 0.
+
+    def count(self, entries = 0, changed = 0, folders = 0, fallbacks = 0):
+        with self._lock:
+            self.entries += entries
+            self.changed += changed
+            self.folders += folders
+            self.fallbacks += fallbacks
+
+    def error(self, path, e):
+        with self._lock:
+            self.n_errors += 1
+            if len(self.errors) < self.MAX_ERRORS:
+                self.errors.append("%s -- %s" % (path, e))
+
+    def as_dict(self):
+        return {
+            'folders': self.folders,
+            'entries': self.entries,
+            'changed': self.changed,
+            'fallbacks': self.fallbacks,
+            'errors': self.n_errors,
+            'error_samples': list(self.errors),
+            'seconds': self.seconds,
+        }
+
+
+def _unsupported(e):
+    return isinstance(e, OSError) and e.errno in [ errno.ENOTSUP, errno.EOPNOTSUPP ]
+
+def _update(path, changes, stats, is_dir, mode):
+    try:
+        old = read_acl(path, mode)
+        new = modified(old, changes, is_dir, mode)
+        changed = new != old
+        if changed:
+            os.setxattr(path, XATTR_ACCESS, encode(new), follow_symlinks = False)
+        defaults = OrderedDict([ (k, v) for k, v in changes.items() if v[1] ]) if is_dir else {}
+        if defaults:
+            old_d = read_default(path)
+            # like setfacl, an empty default ACL starts from the base entries of the access ACL
+            if old_d or [ v for v in defaults.values() if v[0] is not None ]:
+                new_d = modified(old_d or _base(new), defaults, True, mode)
+                if new_d != old_d:
+                    os.setxattr(path, XATTR_DEFAULT, encode(new_d), follow_symlinks = False)
+                    changed = True
+        stats.count(entries = 1, changed = 1 if changed else 0)
+    except Exception as e:
+        if _unsupported(e):
+            raise
+        stats.error(path, e)
+
+def _scan(path, changes, stats):
+    """
+    @summary: update the entries directly in a directory
+    @returns: the list of subdirectories, symbolic links are not followed
+    """
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks = False):
+                        subdirs.append(entry.path)
+                    else:
+                        _update(entry.path, changes, stats, False, entry.stat(follow_symlinks = False).st_mode)
+                except OSError as e:
+                    if _unsupported(e):
+                        raise
+                    stats.error(entry.path, e)
+    except OSError as e:
+        if _unsupported(e):
+            raise
+        stats.error(path, e)
+    return subdirs
+
+def _subtree(path, changes, stats):
+    stack = [ path ]
+    while stack:
+        d = stack.pop()
+        try:
+            _update(d, changes, stats, True, os.lstat(d).st_mode)
+            stack.extend(_scan(d, changes, stats))
+        except OSError as e:
+            stats.error(d, e)
+
+def _setfacl(folder, changes, recursive, stats):
+    """
+    @summary: the fallback, one setfacl call per folder for the grants and one for the revokes
+    """
+    r = [ '-R' ] if recursive else []
+    grants, revokes = [], []
+    for (tag, qualifier), (perms, default) in changes.items():
+        entry = "%s:%d" % ('u' if tag == TAG_USER else 'g', qualifier)
+        specs = [ entry, "d:" + entry ] if default else [ entry ]
+        if perms is None:
+            revokes.extend(specs)
+        else:
+            grants.extend([ "%s:%s" % (spec, perms) for spec in specs ])
+    grants, revokes = ",".join(grants), ",".join(revokes)
+    for flag, spec in [ ('-m', grants), ('-x', revokes) ]:
+        if not spec:
+            continue
+        command = [ 'setfacl' ] + r + [ flag, spec, folder ]
+        logger.info(" ".join(command))
+        if subprocess.call(command) != 0:
+            stats.error(folder, "%s failed" % " ".join(command))
+    stats.count(fallbacks = 1)
+
+def _root(folder, changes, stats, recursive):
+    """
+    @summary: update the folder and the files directly in it
+    @returns: the subdirectories to walk in parallel
+    """
+    try:
+        mode = os.lstat(folder).st_mode
+    except OSError as e:
+        stats.error(folder, e)
+        return []
+    stats.count(folders = 1)
+    try:
+        _update(folder, changes, stats, True, mode)
+        return _scan(folder, changes, stats) if recursive else []
+    except OSError as e:
+        logger.debug("no native ACL support for %s -- %s" % (folder, e))
+        _setfacl(folder, changes, recursive, stats)
+        return []
+
+def apply(ops, recursive = True, workers = None):
+    """
+    @summary: carry out a batch of ACL operations, each folder tree is walked once whatever number of users it concerns
+    @param ops: a list of operations made by grant(), revoke(), grant_group() and revoke_group()
+    @param recursive: apply the changes to the whole tree, otherwise to the folders themselves
+    @param workers: the size of the pool walking the subtrees, defaults to KOOPLEX['acl']['workers']
+    @returns: the statistics of the batch, see Stats.as_dict()
+    """
+    merged = merge(ops)
+    stats = Stats()
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers = workers or aclconf.get('workers', 8)) as pool:
+        roots = [ (folder, pool.submit(_root, folder, changes, stats, recursive)) for folder, changes in merged.items() ]
+        subtrees = []
+        for folder, future in roots:
+            for subdir in future.result():
+                subtrees.append(pool.submit(_subtree, subdir, merged[folder], stats))
+        for future in subtrees:
+            future.result()
+    stats.seconds = time.time() - t0
+    logger.info("acl batch of %d operations on %d folders: %d entries checked, %d changed, %d errors in %.2f s" % (len(ops), len(merged), stats.entries, stats.changed, stats.n_errors, stats.seconds))
+    for e in stats.errors:
+        logger.warning("acl error %s" % e)
+    return stats.as_dict()
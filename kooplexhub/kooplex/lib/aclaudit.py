@@ -0,0 +1,279 @@
+"""
+@author: Jozsef Steger
+@summary: compare the ACLs and ownership of the share, course, usercourse and assignment trees to the bindings in the database,
+and repair the drift with batched ACL writes
+"""
+import os
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.settings import KOOPLEX
+from kooplex.lib import Dirname
+from kooplex.lib.acl import TAG_USER, TAG_GROUP, permbits, named_entries, grant, revoke, grant_group, revoke_group, apply as apply_acl
+
+logger = logging.getLogger(__name__)
+
+Tree = namedtuple('Tree', [ 'kind', 'root', 'expected', 'owner', 'inherit' ])
+Tree.__doc__ = """
+@summary: a folder tree to audit
+@param expected: a dictionary mapping (tag, qualifier) to perms every entry of the tree has to grant
+@param owner: the uid expected to own the root, None if not checked
+@param inherit: whether the expected entries are in the default ACL of the root
+"""
+
+def _groupmode():
+    return KOOPLEX.get('acl', {}).get('mode', 'user') == 'group'
+
+def expected_trees(kinds = None):
+    """
+    @summary: the trees and their expected ACL entries, computed from a few bulk queries
+    @param kinds: a subset of share, course, usercourse and assignment, all by default
+    @returns: the list of trees and the expected group memberships as a dictionary mapping group names to sets of user ids
+    """
+    from hub.models import Group, UserProjectBinding, UserCourseBinding, UserAssignmentBinding
+    kinds = kinds or [ 'share', 'course', 'usercourse', 'assignment' ]
+    groupmode = _groupmode()
+    groups = dict([ (g.name, g) for g in Group.objects.filter(name__regex = r'^(prj|crs)-') ])
+    def gid(name):
+        return groups[name].groupid if name in groups else None
+    trees = []
+    memberships = {}
+
+    if 'share' in kinds:
+        projects = {}
+        for b in UserProjectBinding.objects.select_related('project__creator__profile', 'user__profile'):
+            projects.setdefault(b.project_id, []).append(b)
+        for bindings in projects.values():
+            project = bindings[0].project
+            if groupmode:
+                name = 'prj-%d' % project.id
+                memberships[name] = set([ b.user_id for b in bindings ])
+                expected = { (TAG_GROUP, gid(name)): 'rwX' }
+            else:
+                expected = dict([ ((TAG_USER, b.user.profile.userid), 'rwX') for b in bindings ])
+            trees.append(Tree('share', Dirname.share(bindings[0]), expected, project.fs_uid, groupmode))
+
+    courses = {}
+    if 'course' in kinds or 'usercourse' in kinds:
+        for b in UserCourseBinding.objects.select_related('course', 'user__profile'):
+            courses.setdefault(b.course_id, []).append(b)
+    for bindings in courses.values():
+        course = bindings[0].course
+        teachers = [ b for b in bindings if b.is_teacher ]
+        students = [ b for b in bindings if not b.is_teacher ]
+        g_teacher, g_student = 'crs-%d-teacher' % course.id, 'crs-%d-student' % course.id
+        if groupmode:
+            memberships[g_teacher] = set([ b.user_id for b in teachers ])
+            memberships[g_student] = set([ b.user_id for b in students ])
+            teacher_rw = { (TAG_GROUP, gid(g_teacher)): 'rwX' }
+            teacher_r = { (TAG_GROUP, gid(g_teacher)): 'rX' }
+            student_r = { (TAG_GROUP, gid(g_student)): 'rX' }
+        else:
+            teacher_rw = dict([ ((TAG_USER, b.user.profile.userid), 'rwX') for b in teachers ])
+            teacher_r = dict([ ((TAG_USER, b.user.profile.userid), 'rX') for b in teachers ])
+            student_r = dict([ ((TAG_USER, b.user.profile.userid), 'rX') for b in students ])
+        if 'course' in kinds:
+            public = dict(student_r)
+            public.update(teacher_rw)
+            trees.append(Tree('course', Dirname.courseprivate(course), teacher_rw, None, groupmode))
+            trees.append(Tree('course', Dirname.coursepublic(course), public, None, groupmode))
+        if 'usercourse' in kinds:
+            for b in bindings:
+                # the teachers are granted the course workdir, their own workdir included
+                trees.append(Tree('usercourse', Dirname.usercourseworkdir(b), teacher_r, b.user.profile.userid, False))
+
+    if 'assignment' in kinds:
+        states = [ UserAssignmentBinding.ST_CORRECTING, UserAssignmentBinding.ST_FEEDBACK ]
+        for b in UserAssignmentBinding.objects.filter(state__in = states, corrector__isnull = False, submitted_at__isnull = False).select_related('assignment__coursecode__course', 'user__profile', 'corrector__profile'):
+            expected = { (TAG_USER, b.corrector.profile.userid): 'rwX', (TAG_USER, b.user.profile.userid): 'rX' }
+            trees.append(Tree('assignment', Dirname.assignmentcorrectdir(b), expected, None, False))
+    return trees, memberships
+
+
+class Drift:
+    """
+    @summary: the findings of the scan of a tree, only a few sample paths are kept per entry
+    """
+    SAMPLES = 3
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.n_entries = 0
+        self.missing = {}       # (tag, qualifier) -> [ count, sample paths ]
+        self.extra = {}
+        self.owner = None       # the actual owner if it differs
+        self.inherit = []       # expected entries missing from the default ACL of the root
+        self.errors = []
+
+    def _note(self, d, key, path):
+        record = d.setdefault(key, [ 0, [] ])
+        record[0] += 1
+        if len(record[1]) < self.SAMPLES:
+            record[1].append(path)
+
+    @property
+    def has_drift(self):
+        return bool(self.missing or self.extra or self.owner is not None or self.inherit)
+
+    def lines(self):
+        def fmt(key):
+            return "%s:%s" % ('u' if key[0] == TAG_USER else 'g', key[1])
+        for key, (n, samples) in self.missing.items():
+            yield "missing %s:%s on %d entries, e.g. %s" % (fmt(key), self.tree.expected[key], n, ", ".join(samples))
+        for key, (n, samples) in self.extra.items():
+            yield "extra %s on %d entries, e.g. %s" % (fmt(key), n, ", ".join(samples))
+        if self.owner is not None:
+            yield "owner %d instead of %d" % (self.owner, self.tree.owner)
+        for key in self.inherit:
+            yield "default ACL misses %s" % fmt(key)
+        for e in self.errors:
+            yield "error %s" % e
+
+    def ops(self, revoke_extra = False):
+        """
+        @summary: the ACL operations repairing the drift, the tree is walked once by apply whatever the number of entries
+        """
+        ops = []
+        for key in set(self.missing.keys()).union(self.inherit):
+            f = grant if key[0] == TAG_USER else grant_group
+            ops.append(f(self.tree.root, key[1], self.tree.expected[key], default = self.tree.inherit))
+        if revoke_extra:
+            for key in self.extra.keys():
+                f = revoke if key[0] == TAG_USER else revoke_group
+                ops.append(f(self.tree.root, key[1], default = self.tree.inherit))
+        return ops
+
+
+def _check(drift, path, is_dir):
+    tree = drift.tree
+    entries = named_entries(path)
+    drift.n_entries += 1
+    for key, perms in tree.expected.items():
+        # whether X means x on a file depends on its mode, only the directories are checked for it to spare a stat call
+        need = permbits(perms, is_dir, 0)
+        have = entries.get(key)
+        if have is None or need & ~have:
+            drift._note(drift.missing, key, path)
+    for key in entries.keys():
+        if not key in tree.expected:
+            drift._note(drift.extra, key, path)
+
+def scan(tree):
+    """
+    @summary: walk a tree with os.scandir and compare the named ACL entries to the expected ones
+    @returns: a Drift instance
+    """
+    drift = Drift(tree)
+    if None in [ k[1] for k in tree.expected.keys() ]:
+        drift.errors.append("group of the tree is missing")
+        tree = tree._replace(expected = dict([ (k, p) for k, p in tree.expected.items() if k[1] is not None ]))
+        drift.tree = tree
+    try:
+        st = os.lstat(tree.root)
+    except FileNotFoundError:
+        return drift
+    if tree.owner is not None and st.st_uid != tree.owner:
+        drift.owner = st.st_uid
+    if tree.inherit:
+        defaults = named_entries(tree.root, default = True)
+        drift.inherit = [ k for k in tree.expected.keys() if not k in defaults ]
+    stack = [ tree.root ]
+    while stack:
+        d = stack.pop()
+        try:
+            _check(drift, d, True)
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks = False):
+                        stack.append(entry.path)
+                    else:
+                        _check(drift, entry.path, False)
+        except OSError as e:
+            if len(drift.errors) < Drift.SAMPLES:
+                drift.errors.append("%s -- %s" % (d, e))
+    return drift
+
+
+class Checkpoint:
+    """
+    @summary: the roots already audited, saved atomically so an interrupted run resumes where it stopped
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = set(json.load(f).get('done', []))
+
+    def mark(self, roots):
+        if not self.path:
+            return
+        self.done.update(roots)
+        tmp = "%s.%d" % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({ 'done': sorted(self.done) }, f)
+        os.rename(tmp, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def audit(trees, repair = False, revoke_extra = False, workers = 8, batch = 100, checkpoint = None, report = None):
+    """
+    @summary: scan the trees on a thread pool in batches, repair the drift of each batch with a single ACL batch and checkpoint it
+    @param report: called with each Drift found
+    @returns: a dictionary of counters
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    todo = [ t for t in trees if not t.root in checkpoint.done ]
+    counters = { 'trees': 0, 'skipped': len(trees) - len(todo), 'entries': 0, 'drifted': 0, 'repaired': 0 }
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        for i in range(0, len(todo), batch):
+            chunk = todo[i:i + batch]
+            ops = []
+            for drift in pool.map(scan, chunk):
+                counters['trees'] += 1
+                counters['entries'] += drift.n_entries
+                if not drift.has_drift:
+                    continue
+                counters['drifted'] += 1
+                if report:
+                    report(drift)
+                if repair:
+                    ops.extend(drift.ops(revoke_extra))
+                    if drift.owner is not None:
+                        os.chown(drift.tree.root, drift.tree.owner, -1)
+            if ops:
+                stats = apply_acl(ops, workers = workers)
+                counters['repaired'] += stats['changed']
+            checkpoint.mark([ t.root for t in chunk ])
+    return counters
+
+def audit_memberships(memberships, repair = False):
+    """
+    @summary: compare the group memberships to the bindings in group mode
+    @returns: a list of (group name, missing user ids, extra user ids)
+    """
+    from django.contrib.auth.models import User
+    from hub.models import Group, UserGroupBinding
+    actual = {}
+    for name, user_id in UserGroupBinding.objects.filter(group__name__in = list(memberships.keys())).values_list('group__name', 'user_id'):
+        actual.setdefault(name, set()).add(user_id)
+    result = []
+    for name, expected in memberships.items():
+        missing, extra = expected - actual.get(name, set()), actual.get(name, set()) - expected
+        if not missing and not extra:
+            continue
+        result.append((name, missing, extra))
+        if repair:
+            group = Group.get_or_create_named(name)
+            for user in User.objects.filter(id__in = missing):
+                group.bind(user)
+            for user in User.objects.filter(id__in = extra):
+                group.unbind(user)
+    return result
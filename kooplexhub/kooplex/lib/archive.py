@@ -0,0 +1,117 @@
+"""
+@author: Jozsef Steger
+@summary: tar archives compressed in parallel. The tar stream is cut into blocks compressed by a pool of threads,
+gzip blocks are written as separate members of a multi-member gzip file, which gzip, tar and tarfile read as a single stream.
+The zstd codec needs the optional zstandard module, which compresses in its own threads, gzip is used without it.
+"""
+import os
+import gzip
+import time
+import logging
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.settings import KOOPLEX
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+archiveconf = KOOPLEX.get('archive', {})
+
+SUFFIX = { 'gzip': '.tar.gz', 'zstd': '.tar.zst' }
+
+def codec_of(codec = None):
+    """
+    @summary: the codec to use, falling back to gzip if zstandard is not installed
+    """
+    codec = codec or archiveconf.get('codec', 'gzip')
+    assert codec in SUFFIX, "Unknown codec %s" % codec
+    if codec == 'zstd' and zstandard is None:
+        logger.warning("zstandard module is missing, falling back to gzip")
+        return 'gzip'
+    return codec
+
+def filename(target, codec):
+    """
+    @summary: replace the .tar.gz suffix of the target by the one of the codec
+    """
+    if target.endswith(SUFFIX['gzip']):
+        return target[:-len(SUFFIX['gzip'])] + SUFFIX[codec]
+    return target
+
+
+class ParallelGzipWriter:
+    """
+    @summary: a write only file object compressing each block into a separate gzip member on a thread pool,
+    the members are written in order, and at most a few blocks per thread are held in memory
+    """
+    def __init__(self, fileobj, level, threads, blocksize):
+        self.fileobj = fileobj
+        self.level = level
+        self.blocksize = blocksize
+        self._pool = ThreadPoolExecutor(max_workers = threads)
+        self._pending = deque()
+        self._max_pending = 2 * threads
+        self._buffer = bytearray()
+
+    def _compress(self, block):
+        # zlib releases the GIL while compressing, mtime is fixed so equal content yields equal members
+        return gzip.compress(block, compresslevel = self.level, mtime = 0)
+
+    def _submit(self, block):
+        self._pending.append(self._pool.submit(self._compress, block))
+        while len(self._pending) > self._max_pending:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.blocksize:
+            self._submit(bytes(self._buffer[:self.blocksize]))
+            del self._buffer[:self.blocksize]
+        return len(data)
+
+    def close(self):
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+        self._pool.shutdown()
+
+
+def _writer(fileobj, codec, level, threads, blocksize):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level = level, threads = threads).stream_writer(fileobj, closefd = False)
+    return ParallelGzipWriter(fileobj, level, threads, blocksize)
+
+def archive(folder, target, codec = None, level = None, threads = None):
+    """
+    @summary: tar a folder into a compressed archive
+    @param codec: gzip or zstd, defaults to KOOPLEX['archive']['codec']
+    @param level: the compression level, defaults to KOOPLEX['archive']['level'] or the default of the codec
+    @param threads: the number of compressor threads, defaults to KOOPLEX['archive']['threads']
+    @returns: the name of the archive, its suffix follows the codec
+    """
+    codec = codec_of(codec)
+    level = level or archiveconf.get('level', { 'gzip': 6, 'zstd': 3 }[codec])
+    threads = threads or archiveconf.get('threads', min(8, os.cpu_count() or 1))
+    blocksize = archiveconf.get('blocksize', 4 * 1024 * 1024)
+    target = filename(target, codec)
+    t0 = time.time()
+    with open(target, 'wb') as f:
+        writer = _writer(f, codec, level, threads, blocksize)
+        try:
+            with tarfile.open(fileobj = writer, mode = 'w|', bufsize = blocksize) as tar:
+                tar.add(folder, arcname = '.', recursive = True)
+        finally:
+            writer.close()
+        size = f.tell()
+    dt = time.time() - t0
+    raw = tar.offset
+    logger.info("tar %s -> %s (%s level %d, %d threads): %.1f MB in %.1f s, %.1f MB/s, ratio %.2f" % (folder, target, codec, level, threads, raw / 1e6, dt, raw / 1e6 / max(dt, 1e-3), size / max(raw, 1)))
+    return target
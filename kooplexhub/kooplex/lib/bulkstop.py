@@ -0,0 +1,56 @@
+"""
+@author: Jozsef Steger
+@summary: select many containers at once and queue their stop or removal for the containerworker
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.lib import now
+from kooplex.lib.culler import last_activity
+
+logger = logging.getLogger(__name__)
+
+def select(course = None, image = None, idle_hours = None, exclude_teachers = False, workers = 16):
+    """
+    @summary: the running containers matching all the criteria given
+    @param course: the containers bound to this course
+    @param image: the containers of this image
+    @param idle_hours: the containers whose kernels have been idle for longer, the notebook servers are polled in parallel
+    @param exclude_teachers: leave the containers of the teachers of the course alone
+    @returns: a list of containers
+    """
+    from hub.models import Container, UserCourseBinding
+    containers = Container.objects.filter(state = Container.ST_RUNNING).select_related('user', 'user__profile', 'image')
+    if course is not None:
+        containers = containers.filter(coursecontainerbinding__course = course)
+        if exclude_teachers:
+            teachers = UserCourseBinding.objects.filter(course = course, is_teacher = True).values_list('user_id', flat = True)
+            containers = containers.exclude(user_id__in = list(teachers))
+    if image is not None:
+        containers = containers.filter(image = image)
+    containers = list(containers.distinct())
+    if idle_hours is None:
+        return containers
+    timenow = now()
+    def _idle(container):
+        try:
+            return (timenow - last_activity(container)).total_seconds() > idle_hours * 3600
+        except Exception as e:
+            logger.warning("cannot poll kernels of %s -- %s" % (container, e))
+            return False
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        return [ c for c, idle in zip(containers, pool.map(_idle, containers)) if idle ]
+
+def stop(containers, remove = False):
+    """
+    @summary: queue the stop or removal of the containers. The containerworker carries out the jobs with its own bounded
+    concurrency, one job at a time per container, so the caller does not wait for the docker engine and does not race
+    with the other pending jobs of the same container. The progress is reported by the job status.
+    @param remove: remove the containers instead of stopping them
+    @returns: the list of jobs
+    """
+    from hub.models import ContainerJob
+    action = ContainerJob.AC_REMOVE if remove else ContainerJob.AC_STOP
+    jobs = [ ContainerJob.enqueue(container, action) for container in containers ]
+    logger.info("queued %d containers to %s" % (len(jobs), action))
+    return jobs
@@ -3,11 +3,10 @@
 """
 import os
 import json
-import requests
 import logging
 
 from kooplex.settings import KOOPLEX
-from kooplex.lib import keeptrying, standardize_str
+from kooplex.lib import httpclient, standardize_str
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +41,7 @@ auth_basic_user_file /etc/passwords/%s;
 
     }
     logging.debug("+ %s ---> %s" % (kw['url'], kw['data']))
-    keeptrying(requests.post, 50, **kw)
+    httpclient.post('reportserver', **kw)
 
 def remove_report_nginx_api(report):
     str_name = standardize_str(report.proxy_path)
@@ -54,4 +53,4 @@ def remove_report_nginx_api(report):
 
     }
     logging.debug("- %s ---> %s" % (kw['url'], kw['data']))
-    return keeptrying(requests.delete, 5, **kw)
+    return httpclient.delete('reportserver', **kw)
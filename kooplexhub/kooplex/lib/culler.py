@@ -0,0 +1,113 @@
+"""
+@author: Jozsef Steger
+@summary: stop notebook containers whose kernels have been idle longer than the threshold of their course or image
+"""
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from kooplex.settings import KOOPLEX
+from kooplex.lib import now
+from kooplex.lib.jupyter import jupyter_kernels
+
+logger = logging.getLogger(__name__)
+
+def _parse_timestamp(ts):
+    for fmt in [ '%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ' ]:
+        try:
+            return datetime.datetime.strptime(ts, fmt).replace(tzinfo = datetime.timezone.utc)
+        except ValueError:
+            pass
+    raise ValueError("Unknown timestamp format %s" % ts)
+
+def idle_timeout(container, course):
+    """
+    @summary: the idle threshold of a container in minutes, the course setting overrides the image setting, which overrides the default
+    @returns: minutes or None if the container is not to be culled
+    """
+    if course is not None and course.idle_timeout is not None:
+        return course.idle_timeout
+    if container.image is not None and container.image.idle_timeout is not None:
+        return container.image.idle_timeout
+    return KOOPLEX.get('culler', {}).get('idle_timeout', None)
+
+def last_activity(container):
+    """
+    @summary: the time of the last kernel activity in a container. A busy kernel, or a connected one unless
+    KOOPLEX['culler']['cull_connected'] is set, counts as active right now. Without kernels the start of the container counts.
+    """
+    cull_connected = KOOPLEX.get('culler', {}).get('cull_connected', False)
+    timenow = now()
+    latest = container.launched_at
+    for kernel in jupyter_kernels(container):
+        if kernel.get('execution_state') == 'busy':
+            return timenow
+        if kernel.get('connections', 0) > 0 and not cull_connected:
+            return timenow
+        if kernel.get('last_activity'):
+            latest = max(latest, _parse_timestamp(kernel['last_activity']))
+    return latest
+
+def candidates():
+    """
+    @summary: the running notebook containers with an idle threshold, report containers are never culled
+    @returns: a list of (container, threshold in seconds) tuples
+    """
+    from hub.models import Container, CourseContainerBinding, ReportContainerBinding
+    running = list(Container.objects.filter(state = Container.ST_RUNNING).select_related('user', 'user__profile', 'image'))
+    ids = [ c.id for c in running ]
+    courses = dict([ (b.container_id, b.course) for b in CourseContainerBinding.objects.filter(container_id__in = ids).select_related('course') ])
+    reports = set(ReportContainerBinding.objects.filter(container_id__in = ids).values_list('container_id', flat = True))
+    result = []
+    for c in running:
+        if c.id in reports:
+            continue
+        threshold = idle_timeout(c, courses.get(c.id))
+        if threshold is not None:
+            result.append((c, threshold * 60))
+    return result
+
+def _probe(container):
+    try:
+        return container, (now() - last_activity(container)).total_seconds(), None
+    except Exception as e:
+        return container, None, e
+
+def _stop(container, idle, threshold):
+    from hub.models import CullEvent
+    try:
+        container.docker_stop()
+        CullEvent.objects.create(container_name = container.name, user = container.user, idle_seconds = idle, threshold_seconds = threshold)
+        logger.info("culled %s idle for %d s" % (container, idle))
+    except Exception as e:
+        logger.error("cannot cull %s -- %s" % (container, e))
+        CullEvent.objects.create(container_name = container.name, user = container.user, idle_seconds = idle, threshold_seconds = threshold, is_success = False, message = str(e)[:512])
+    finally:
+        connection.close()
+
+def cull(dry = False, workers = 16):
+    """
+    @summary: poll the kernels of the candidates concurrently, and stop the idle ones through the usual docker_stop path
+    @returns: a list of (container, idle seconds, threshold seconds, culled) tuples of the polled containers,
+    idle seconds is None if the notebook server could not be polled
+    """
+    containers = candidates()
+    thresholds = dict([ (c.id, t) for c, t in containers ])
+    report = []
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        stops = []
+        for container, idle, error in pool.map(_probe, [ c for c, _ in containers ]):
+            threshold = thresholds[container.id]
+            if error is not None:
+                logger.warning("cannot poll kernels of %s -- %s" % (container, error))
+                report.append((container, None, threshold, False))
+                continue
+            to_cull = idle > threshold
+            report.append((container, idle, threshold, to_cull))
+            if to_cull and not dry:
+                stops.append(pool.submit(_stop, container, int(idle), threshold))
+        for f in stops:
+            f.result()
+    return report
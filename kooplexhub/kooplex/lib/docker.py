@@ -7,7 +7,14 @@ import re
 import os
 import json
 import shlex
+import time
+import calendar
+import socket
+import threading
+import requests
+from collections import Counter
 from docker.client import Client
+from docker.errors import NotFound
 
 from kooplex.settings import KOOPLEX
 
@@ -15,15 +22,152 @@ from kooplex.lib import now
 
 logger = logging.getLogger(__name__)
 
+class PooledClient:
+    """
+    @summary: a proxy to a docker client shared by all Docker instances of the process.
+    The client is created lazily, keeps its connections to the docker socket alive, and
+    is dropped after a connection error so the next call rebuilds it.
+    """
+    _clients = {}
+    _lock = threading.Lock()
+
+    def __init__(self, base_url, **kw):
+        self.base_url = base_url
+        self.kw = kw
+
+    def _get(self):
+        with PooledClient._lock:
+            client = PooledClient._clients.get(self.base_url)
+            if client is None:
+                client = Client(base_url = self.base_url, **self.kw)
+                PooledClient._clients[self.base_url] = client
+                logger.debug("Client init %s" % self.base_url)
+            return client
+
+    def _drop(self, client):
+        with PooledClient._lock:
+            if PooledClient._clients.get(self.base_url) is client:
+                del PooledClient._clients[self.base_url]
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug("Closing client %s -- %s" % (self.base_url, e))
+
+    def healthcheck(self):
+        """
+        @summary: ping the docker engine, and rebuild the client if it is not responding
+        @returns: whether the engine responds after the check
+        """
+        client = self._get()
+        try:
+            return client.ping() in [ True, 'OK' ]
+        except Exception as e:
+            logger.warning("docker engine %s does not respond, rebuild client -- %s" % (self.base_url, e))
+            self._drop(client)
+        try:
+            return self._get().ping() in [ True, 'OK' ]
+        except Exception as e:
+            logger.error("docker engine %s is not available -- %s" % (self.base_url, e))
+            return False
+
+    def __getattr__(self, name):
+        client = self._get()
+        attr = getattr(client, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kw):
+            try:
+                return attr(*args, **kw)
+            except (requests.exceptions.ConnectionError, socket.error) as e:
+                logger.warning("docker engine %s connection error, client dropped -- %s" % (self.base_url, e))
+                self._drop(client)
+                raise
+        return call
+
+
+def _bytes(size):
+    """
+    @summary: convert docker style memory sizes like 2g or 512m to bytes
+    """
+    if isinstance(size, int):
+        return size
+    units = { 'b': 1, 'k': 2 ** 10, 'm': 2 ** 20, 'g': 2 ** 30 }
+    size = str(size).strip().lower()
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size or 0)
+
+
 class Docker:
     dockerconf = KOOPLEX.get('docker', {})
+    # container name -> (timestamp, docker container info), shared by all instances in the process
+    _containerinfo = {}
+    _containerinfo_lock = threading.Lock()
 
-    def __init__(self):
-        base_url = self.dockerconf.get('base_url', '')
-        self.client = Client(base_url = base_url)
-        logger.debug("Client init")
+    def __init__(self, engine = None):
+        self.engine = engine or self.default_engine()
+        self.client = self._client(self.engine)
         self.check = None
 
+    @classmethod
+    def engines(cls):
+        """
+        @summary: the docker engines containers are placed on, configured by KOOPLEX['docker']['engines'] as a name -> base url dictionary.
+        Without that setting base_url is the only engine, called default.
+        """
+        return cls.dockerconf.get('engines') or { 'default': cls.dockerconf.get('base_url', '') }
+
+    @classmethod
+    def default_engine(cls):
+        """
+        @summary: the engine of system containers (impersonator, warm pool) and of containers created before placement was introduced
+        """
+        engines = cls.engines()
+        return cls.dockerconf.get('default_engine', 'default' if 'default' in engines else sorted(engines.keys())[0])
+
+    def _client(self, engine):
+        engines = self.engines()
+        if not engine in engines:
+            logger.error("docker engine %s is not configured, falling back to %s" % (engine, self.default_engine()))
+            engine = self.default_engine()
+        return PooledClient(engines[engine], timeout = self.dockerconf.get('timeout', 60), num_pools = self.dockerconf.get('num_pools', 10))
+
+    def client_of(self, container):
+        """
+        @summary: the client of the engine a container lives on
+        """
+        engine = container.engine or self.default_engine()
+        return self.client if engine == self.engine else self._client(engine)
+
+    def place(self, container):
+        """
+        @summary: choose the engine of a new container among the engines having the volumes, see volume_engines. The engine with the
+        most free memory is chosen, estimated as its total memory less the memory limit of the new container for each running one.
+        Ties are broken by the number of running containers.
+        @returns: the name of the engine, also stored in container.engine
+        """
+        engines = self.engines()
+        if container.engine in engines:
+            return container.engine
+        need = _bytes(container.resourceprofile.host_config.get('mem_limit', 0))
+        best = None
+        for engine in self.volume_engines():
+            client = self._client(engine)
+            try:
+                info = client.info()
+            except Exception as e:
+                logger.warning("docker engine %s is skipped in placement -- %s" % (engine, e))
+                continue
+            running = info.get('ContainersRunning', 0)
+            free = info.get('MemTotal', 0) - running * need
+            logger.debug("engine %s: %d running, %d bytes free" % (engine, running, free))
+            if best is None or (free, -running) > best[0]:
+                best = ((free, -running), engine)
+        assert best is not None, "No docker engine is available"
+        container.engine = best[1]
+        logger.info("container %s placed on engine %s" % (container, container.engine))
+        return container.engine
+
     def list_imagenames(self):
         logger.debug("Listing image names")
         pattern_imagenamefilter = KOOPLEX.get('docker', {}).get('pattern_imagename_filter', r'^image-%(\w+):\w$')
@@ -42,75 +186,288 @@ class Docker:
         for volume in volumes['Volumes']:
             yield volume['Name']
 
+    @classmethod
+    def volume_engines(cls):
+        """
+        @summary: the engines the volumes are created on. Containers on several engines see the same data only if the volumes are
+        on shared storage, configured by KOOPLEX['docker']['volume_driver'] and ['volume_driver_opts'], where %(name)s in an option
+        stands for the name of the volume. Without a shared driver the volumes are local to the default engine.
+        """
+        if cls.dockerconf.get('volume_driver'):
+            return sorted(cls.engines().keys())
+        return [ cls.default_engine() ]
+
     def create_volume(self, volume):
-        volume_dir = None #self.dockerconf.get('volume_dir', '')
-        if volume_dir:
-            self.client.create_volume(
-                name = volume.name, 
-                driver='local', 
-                driver_opts = {
-                    'device': '%s/%s/'%(volume_dir, volume.name), 
-                    'o': 'bind', 
-                    'type': 'none'}
+        for engine in self.volume_engines():
+            self._create_volume(self._client(engine), volume)
+        return True
+
+    def _create_volume(self, client, volume):
+        driver = self.dockerconf.get('volume_driver')
+        if driver:
+            opts = dict([ (k, v % { 'name': volume.name }) for k, v in self.dockerconf.get('volume_driver_opts', {}).items() ])
+            client.create_volume(
+                name = volume.name,
+                driver = driver,
+                driver_opts = opts,
                 )
         else:
-            self.client.create_volume(
+            client.create_volume(
                 name = volume.name, 
                 )
-        logger.debug("Volume %s created"%volume.name)
-        return True #self.get_container(container)
+        logger.debug("Volume %s created on %s" % (volume.name, client.base_url))
 
     def delete_volume(self, volume):
-        self.client.remove_volume(name = volume.name)
+        for engine in self.volume_engines():
+            try:
+                self._client(engine).remove_volume(name = volume.name)
+            except NotFound:
+                logger.warning("Volume %s is missing from engine %s" % (volume.name, engine))
         logger.debug("Volume %s deleted"%volume.name)
 
+    def _remember(self, name, info):
+        timestamp = time.time()
+        ttl = self.dockerconf.get('containerinfo_ttl', 5)
+        with Docker._containerinfo_lock:
+            Docker._containerinfo[name] = (timestamp, info)
+            if len(Docker._containerinfo) > self.dockerconf.get('containerinfo_size', 4096):
+                for n, (t, _) in list(Docker._containerinfo.items()):
+                    if timestamp - t > ttl:
+                        del Docker._containerinfo[n]
+
+    def _forget(self, name):
+        with Docker._containerinfo_lock:
+            Docker._containerinfo.pop(name, None)
+
     def get_container(self, container):
-        for item in self.client.containers(all = True):
+        ttl = self.dockerconf.get('containerinfo_ttl', 5)
+        with Docker._containerinfo_lock:
+            cached = Docker._containerinfo.get(container.name)
+        if cached is not None and time.time() - cached[0] < ttl:
+            logger.debug("Get container %s (cached)" % container.name)
+            return cached[1]
+        info = None
+        # the name filter matches substrings, so exact match is still checked
+        for item in self.client_of(container).containers(all = True, filters = { 'name': container.name }):
             # docker API prepends '/' in front of container names
             if '/' + container.name in item['Names']:
                 logger.debug("Get container %s" % container.name)
-                return item
-        return None
+                info = item
+                break
+        self._remember(container.name, info)
+        return info
+
+    def list_containerstates(self):
+        """
+        @summary: list all containers of the docker engine of this instance in a single API call
+        @returns: a dictionary mapping container names to their engine state (running, exited, created, ...)
+        """
+        states = {}
+        for item in self.client.containers(all = True):
+            for name in item['Names']:
+                # docker API prepends '/' in front of container names
+                states[name.lstrip('/')] = item['State']
+                self._remember(name.lstrip('/'), item)
+        logger.debug("Listed %d containers" % len(states))
+        return states
+
+    def container_events(self, since, until):
+        """
+        @summary: iterate over container lifecycle events reported by the docker engine
+        @param since: unix timestamp, the beginning of the time window
+        @param until: unix timestamp, the end of the time window, the call blocks until then
+        """
+        filters = { 'type': 'container', 'event': [ 'start', 'die', 'stop', 'oom', 'destroy' ] }
+        for event in self.client.events(since = since, until = until, filters = filters, decode = True):
+            yield event
+
+    def container_stats(self, name):
+        """
+        @summary: take a single resource usage sample of a running container
+        @param name: the name of the container
+        @returns: (cpu usage in percent of one core, memory usage in bytes, memory limit in bytes)
+        """
+        stats = self.client.stats(name, decode = True, stream = False)
+        cpu, precpu = stats.get('cpu_stats', {}), stats.get('precpu_stats', {})
+        d_container = cpu.get('cpu_usage', {}).get('total_usage', 0) - precpu.get('cpu_usage', {}).get('total_usage', 0)
+        d_system = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+        ncpu = cpu.get('online_cpus') or len(cpu.get('cpu_usage', {}).get('percpu_usage') or [ 0 ])
+        cpu_percent = 100. * ncpu * d_container / d_system if d_system > 0 and d_container > 0 else 0.
+        memory = stats.get('memory_stats', {})
+        # page cache is reclaimable, do not count it
+        mem_usage = memory.get('usage', 0) - memory.get('stats', {}).get('cache', 0)
+        return cpu_percent, mem_usage, memory.get('limit', 0)
+
+    @staticmethod
+    def _logtime(line):
+        """
+        @summary: the timestamp prefix of a log line as a comparable (seconds since epoch, fraction) pair
+        """
+        ts = line.split(b' ', 1)[0]
+        head, _, fraction = ts.rstrip(b'Z').partition(b'.')
+        try:
+            return calendar.timegm(time.strptime(head.decode(), '%Y-%m-%dT%H:%M:%S')), float(b'0.' + (fraction or b'0'))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _loglines(chunks):
+        """
+        @summary: cut the chunks of a log stream into lines, the frames of the stream may hold partial or several lines
+        """
+        buf = b''
+        for chunk in chunks:
+            buf += chunk
+            while True:
+                i = buf.find(b'\n')
+                if i < 0:
+                    break
+                yield buf[:i + 1]
+                buf = buf[i + 1:]
+        if buf:
+            yield buf
+
+    def logs(self, container, tail = 200, follow = False, max_bytes = 2 ** 20, seconds = 60, poll = 1):
+        """
+        @summary: iterate over the lines of the log of a container. The log is streamed and the stream is dropped at the byte cap,
+        so the hub never holds more of it than a line. Following is done by short polls of the lines since the second of the last
+        line sent instead of a docker follow stream, which blocks as long as the container is quiet, so the deadline holds
+        whatever the container prints.
+        @param tail: the number of lines from the end of the log to start with, 'all' for the whole log
+        @param follow: keep polling the new lines
+        @param max_bytes: the cap of the bytes yielded
+        @param seconds: how long to follow
+        @param poll: seconds between the polls
+        """
+        client = self.client_of(container)
+        deadline = time.time() + seconds
+        sent = 0
+        # since has a resolution of a second, the lines of the last second sent are returned again by the next poll
+        last = None
+        recent = Counter()
+        options = { 'tail': tail }
+        while True:
+            stream = client.logs(container.name, stream = True, follow = False, timestamps = True, **options)
+            seen = Counter()
+            try:
+                for line in self._loglines(stream):
+                    t = self._logtime(line)
+                    if t is not None:
+                        if last is not None and t[0] < last:
+                            continue
+                        if t[0] == last:
+                            seen[line] += 1
+                            if seen[line] <= recent[line]:
+                                continue
+                        else:
+                            last = t[0]
+                            recent = Counter()
+                        recent[line] += 1
+                    if sent + len(line) > max_bytes:
+                        yield line[:max_bytes - sent]
+                        yield b"\n[log truncated at %d bytes]\n" % max_bytes
+                        return
+                    sent += len(line)
+                    yield line
+            finally:
+                if hasattr(stream, 'close'):
+                    stream.close()
+            if not follow:
+                return
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                yield b"\n[stopped following]\n"
+                return
+            time.sleep(min(poll, remaining))
+            options = { 'tail': 'all', 'since': last if last is not None else int(time.time() - poll) }
 
     def create_container(self, container):
-        volumes = []    # the list of mount points in the container
-        binds = {}      # a mapping dictionary of the container mounts
-        for volume in container.volumes:
-            logger.debug("container %s, volume %s" % (container, volume))
-            mp = volume.mountpoint
-            volumes.append(mp)
-            binds[volume.name] = { 'bind': mp, 'mode': volume.mode(container.user) }
-        logger.debug("container %s binds %s" % (container, binds))
-        host_config = self.client.create_host_config(
+        from kooplex.lib.fs_mountplan import build_mountplan
+        plan = build_mountplan(container)
+        logger.debug("container %s binds %s" % (container, plan.binds))
+        imagename = container.image.imagename if container.image else self.dockerconf.get('default_image', 'basic')
+        profile = container.resourceprofile
+        self.place(container)
+        self._create(container.name, imagename, plan.mountpoints, plan.binds, container.environment, profile.host_config, self.client_of(container))
+        container.resources = profile.signature
+        logger.debug("Container created")
+        self.managemount(container, plan.mountconf, force = True)
+        return self.get_container(container)
+
+    def _create(self, name, imagename, volumes, binds, environment, resources, client):
+        host_config = client.create_host_config(
             binds = binds,
-            privileged = True,
-            mem_limit = '2g',
-            memswap_limit = '170m',
-            mem_swappiness = 0,
 #            oom_kill_disable = True,
-            cpu_shares = 2,
+            **resources
         )
         network = self.dockerconf.get('network', 'host')
         networking_config = { 'EndpointsConfig': { network: {} } }
         ports = self.dockerconf.get('container_ports', [ 8000, 9000])
-        imagename = container.image.imagename if container.image else self.dockerconf.get('default_image', 'basic')
         args = {
-            'name': container.name,
+            'name': name,
             'image': imagename,
             'detach': True,
-            'hostname': container.name,
+            'hostname': name,
             'host_config': host_config,
             'networking_config': networking_config,
-            'environment': container.environment,
+            'environment': environment,
             'volumes': volumes,
             'ports': ports,
         }
-        self.client.create_container(**args)
-        logger.debug("Container created")
-        self.managemount(container) #FIXME: check if not called twice
+        client.create_container(**args)
+        self._forget(name)
+
+    def create_pooled(self, pooled, volumes):
+        """
+        @summary: create and boot a generic container for the warm pool of an image
+        @param pooled: the pool entry
+        @type pooled: hub.models.PooledContainer
+        @param volumes: the volumes to mount, all of them read-write
+        """
+        mountpoints = [ v.mountpoint for v in volumes ]
+        binds = dict([ (v.name, { 'bind': v.mountpoint, 'mode': 'rw' }) for v in volumes ])
+        environment = {
+            'CONTAINER_NAME': pooled.name,
+            'NB_PORT': KOOPLEX.get('spawner', {}).get('port', 8000),
+            'NB_HOST': KOOPLEX.get('base_url', 'localhost'),
+            'POOLED': 'true',
+            'ADOPTCONF': self.dockerconf.get('adoptconf', '/tmp/adopt.conf'),
+        }
+        from hub.models import ResourceProfile
+        pooled.engine = self.engine
+        self._create(pooled.name, pooled.image.imagename, mountpoints, binds, environment, ResourceProfile.default().host_config, self.client)
+        self.client.start(pooled.name)
+        logger.debug("Pooled container %s created and started" % pooled.name)
+
+    def adopt_pooled(self, pooled, container):
+        """
+        @summary: hand over a booted pooled container to a user: rename it, then pass the environment and the mount configuration.
+        The image waits for the adopt configuration before it starts the notebook server.
+        """
+        from hub.models import ResourceProfile
+        container.engine = pooled.engine
+        self.client_of(container).rename(pooled.name, container.name)
+        self._forget(pooled.name)
+        self._forget(container.name)
+        path, filename = os.path.split(self.dockerconf.get('adoptconf', '/tmp/adopt.conf'))
+        # the mount configuration is written first, the notebook server is started when the adopt configuration shows up
+        self.managemount(container, force = True)
+        lines = [ "%s=%s" % (k, v) for k, v in container.environment.items() ]
+        lines.append('')
+        self._writefile(container.name, path, filename, "\n".join(lines).encode('utf8'), self.client_of(container))
+        container.resources = ResourceProfile.default().signature
+        logger.info("Pooled container %s adopted as %s" % (pooled.name, container.name))
         return self.get_container(container)
 
-    def _writefile(self, container_name, path, filename, content):
+    def remove_pooled(self, pooled):
+        try:
+            self._client(pooled.engine or self.engine).remove_container(pooled.name, force = True)
+        except Exception as e:
+            logger.warning("Cannot remove pooled container %s -- %s" % (pooled.name, e))
+        finally:
+            self._forget(pooled.name)
+
+    def _writefile(self, container_name, path, filename, content, client = None):
         import tarfile
         import time
         from io import BytesIO
@@ -123,41 +480,60 @@ class Docker:
         tar.close()
         tarstream.seek(0)
         try:
-            status = self.client.put_archive(container = container_name, path = path, data = tarstream)
+            status = (client or self.client).put_archive(container = container_name, path = path, data = tarstream)
             logger.info("container %s put_archive %s/%s returns %s" % (container_name, path, filename, status))
+            return status
         except Exception as e:
             logger.error("container %s put_archive %s/%s fails -- %s" % (container_name, path, filename, e))
+            return False
 
+    def _readfile(self, container_name, path, filename, client = None):
+        """
+        @returns: the content of a file in a container, None if it cannot be read
+        """
+        import tarfile
+        from io import BytesIO
+        try:
+            stream, _ = (client or self.client).get_archive(container_name, os.path.join(path, filename))
+            data = stream.read() if hasattr(stream, 'read') else b''.join(stream)
+            with tarfile.open(fileobj = BytesIO(data)) as archive:
+                return archive.extractfile(filename).read()
+        except Exception as e:
+            logger.debug("container %s get_archive %s/%s fails -- %s" % (container_name, path, filename, e))
+            return None
 
-    def managemount(self, container):
-        from kooplex.lib.fs_dirname import Dirname
-        
-        path, filename = os.path.split(self.dockerconf.get('mountconf', '/tmp/mount.conf'))
-        mapper = []
-        for v in container.volumes:
-            mapper.extend([ "%s:%s" % (v.volumetype, d) for d in Dirname.containervolume_listfolders(container, v) ])
-        #NOTE: mounter uses read to process the mapper configuration, thus we need to make sure '\n' terminates the config mapper file
-        mapper.append('')
-        logger.debug("container %s map %s" % (container, mapper))
-        file_data = "\n".join(mapper).encode('utf8')
-        self._writefile(container.name, path, filename, file_data)
-
-    def trigger_impersonator(self, vcproject):       #FIXME: dont call it 1-by-1
-        from kooplex.lib.fs_dirname import Dirname
-        container_name = self.dockerconf.get('impersonator', 'impersonator')
-        path, filename = os.path.split(self.dockerconf.get('gitcommandconf', '/tmp/gitcommand.conf'))
-        cmdmaps = []
-        token = vcproject.token
-        fn_clonesh = os.path.join(Dirname.vcpcache(vcproject), "clone.sh")
-        fn_key = os.path.join(Dirname.userhome(vcproject.token.user), '.ssh', token.fn_rsa)
-        cmdmaps.append("%s:%s:%s:%s" % (token.user.username, fn_key, token.repository.domain, fn_clonesh))
-        cmdmaps.append('')
-        file_data = "\n".join(cmdmaps).encode('utf8')
-        self._writefile(container_name, path, filename, file_data)
 
+    def mountconf(self, container):
+        """
+        @summary: render the mount configuration of a container
+        @returns: the content of the mapper configuration file
+        @rtype: bytes
+        """
+        from kooplex.lib.fs_mountplan import build_mountplan
+        return build_mountplan(container).mountconf
+
+    def managemount(self, container, file_data = None, force = False):
+        """
+        @summary: write the mount configuration in the container, unless the file there has the same content.
+        The file itself is compared, so the hub and the worker processes never trust a stale record of an earlier write.
+        @param file_data: the rendered configuration, rendered here if not given
+        @param force: write even if the content did not change
+        @returns: whether the configuration was written
+        """
+        if file_data is None:
+            file_data = self.mountconf(container)
+        path, filename = os.path.split(self.dockerconf.get('mountconf', '/tmp/mount.conf'))
+        client = self.client_of(container)
+        if not force and self._readfile(container.name, path, filename, client) == file_data:
+            logger.debug("container %s mount configuration unchanged" % container)
+            return False
+        return bool(self._writefile(container.name, path, filename, file_data, client))
 
     def run_container(self, container):
         docker_container_info = self.get_container(container)
+        if docker_container_info is None and self.dockerconf.get('warmpool', False):
+            from kooplex.lib.warmpool import adopt
+            docker_container_info = adopt(self, container)
         if docker_container_info is None:
             logger.debug("Container did not exist, Creating new one")
             docker_container_info = self.create_container(container)
@@ -175,45 +551,58 @@ class Docker:
         container.save()
 
     def start_container(self, container):
-        self.client.start(container.name)
+        self.client_of(container).start(container.name)
+        self._forget(container.name)
         # we need to retrieve the container state after starting it
         docker_container_info = self.get_container(container)
         container_state = docker_container_info['State']
         logger.debug("Container state %s" % container_state)
         container.last_message = str(container_state)
         container.last_message_at = now()
-        assert container_state == 'running', "Container failed to start: %s" % docker_container_info
+        if container_state != 'running':
+            try:
+                tail = self.client_of(container).logs(container.name, tail = 5).decode(errors = 'replace').strip()
+            except Exception as e:
+                tail = "logs unavailable -- %s" % e
+            raise AssertionError("Container failed to start (%s): %s" % (docker_container_info.get('Status'), tail[-400:]))
 
     def stop_container(self, container):
         try:
-            self.client.stop(container.name)
+            self.client_of(container).stop(container.name)
             container.last_message = 'Container stopped'
         except Exception as e:
             logger.warn("docker container not found by API -- %s" % e)
             container.last_message = str(e)
+        finally:
+            self._forget(container.name)
 
     def remove_container(self, container):
         try:
-            self.client.remove_container(container.name)
+            self.client_of(container).remove_container(container.name)
             container.last_message = 'Container removed'
             container.last_message_at = now()
+            container.engine = None
         except Exception as e:
             logger.warn("docker container not found by API -- %s" % e)
             container.last_message = str(e)
             container.last_message_at = now()
+        finally:
+            self._forget(container.name)
         logger.debug("Container removed %s" % container.name)
 
 #FIXME: az execute2 lesz az igazi...
     def execute(self, container, command):
         logger.info("execution: %s in %s" % (command, container))
-        execution = self.client.exec_create(container = container.name, cmd = shlex.split(command))
-        return self.client.exec_start(execution, detach = False)
+        client = self.client_of(container)
+        execution = client.exec_create(container = container.name, cmd = shlex.split(command))
+        return client.exec_start(execution, detach = False)
 
     def execute2(self, container, command):
         logger.info("execution: %s in %s" % (command, container))
-        execution = self.client.exec_create(container = container.name, cmd = shlex.split(command))
-        response = self.client.exec_start(exec_id = execution['Id'], stream = False)
-        check = self.client.exec_inspect(exec_id = execution['Id'])
+        client = self.client_of(container)
+        execution = client.exec_create(container = container.name, cmd = shlex.split(command))
+        response = client.exec_start(exec_id = execution['Id'], stream = False)
+        check = client.exec_inspect(exec_id = execution['Id'])
         self.check = check
         if check['ExitCode'] != 0:
             logger.error('Execution %s in %s failed -- %s' % (command, container, check))
@@ -4,6 +4,7 @@ import requests
 import requests.auth
 
 from kooplex.settings import KOOPLEX
+from . import httpclient
 
 logger = logging.getLogger(__name__)
 
@@ -18,14 +19,14 @@ def list_libraries(fstoken):
 
 def seafilepw_update(username, password):
     A = requests.auth.HTTPBasicAuth(KOOPLEX['impersonator'].get('username'), KOOPLEX['impersonator'].get('password'))
-    requests.get('{}/api/setpass/{}/{}'.format(KOOPLEX['impersonator'].get('seafile_api', 'http://localhost'), username, password), auth = A)
+    httpclient.get('impersonator', '{}/api/setpass/{}/{}'.format(KOOPLEX['impersonator'].get('seafile_api', 'http://localhost'), username, password), auth = A)
 
 def impersonator_sync(library, start):
     url_base = KOOPLEX['impersonator'].get('base_url', 'http://localhost')
     A = requests.auth.HTTPBasicAuth(KOOPLEX['impersonator'].get('username'), KOOPLEX['impersonator'].get('password'))
     try:
-        resp_echo = requests.get(url_base, auth = A)
-    except ConnectionError:
+        resp_echo = httpclient.get('impersonator', url_base, auth = A, retries = 1)
+    except requests.exceptions.ConnectionError:
         logger.critical('impersonator API is not running')
         raise
     if start:
@@ -33,7 +34,7 @@ def impersonator_sync(library, start):
     else:
         url = '{}/api/sync/desync/{}/{}'.format(url_base, library.token.user.username, library.library_id)
     try:
-        resp_info = requests.get(url, auth = A)
+        resp_info = httpclient.get('impersonator', url, auth = A, retries = 1)
         rj = resp_info.json()
         if 'error' in rj:
             logger.warning('error to start={} synchronizing {} for user {} -- daemon response: {}'.format(start, library.library_id, library.token.user.username, rj))
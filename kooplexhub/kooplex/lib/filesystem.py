@@ -13,7 +13,10 @@ from distutils import dir_util
 from distutils import file_util
 import tarfile
 
+from kooplex.settings import KOOPLEX
 from kooplex.lib import bash, Dirname, Filename
+from kooplex.lib.acl import grant, revoke, grant_group, apply as apply_acl
+from kooplex.lib.archive import archive as tar_archive
 
 logger = logging.getLogger(__name__)
 
@@ -36,22 +39,31 @@ def _mkdir(path, uid = 0, gid = 0, mode = 0b111101000):
 
 
 def _grantaccess(user, folder, acl = 'rwX'):
-    bash("setfacl -R -m u:%d:%s %s" % (user.profile.userid, acl, folder))
+    return apply_acl([ grant(folder, user.profile.userid, acl) ])
 
 def _revokeaccess(user, folder):
-    bash("setfacl -R -x u:%d %s" % (user.profile.userid, folder))
+    return apply_acl([ revoke(folder, user.profile.userid) ])
 
+def _groupmode():
+    """
+    @summary: in group mode the share and course roots carry inheritable ACL entries of a group created at mkdir time,
+    and membership changes only bind or unbind the user to that group. Otherwise per user entries are written recursively.
+    """
+    return KOOPLEX.get('acl', {}).get('mode', 'user') == 'group'
 
-def _archivedir(folder, target, remove = True):
+
+def _archivedir(folder, target, remove = True, codec = None):
+    """
+    @summary: archive a folder with parallel compression
+    @param codec: gzip or zstd, defaults to KOOPLEX['archive']['codec'], archives read back by the hub have to be gzip
+    """
     if not os.path.exists(folder):
         logger.warning("Folder %s is missing" % folder)
         return
     try:
         assert len(os.listdir(folder)) > 0, "Folder %s is empty" % folder
         dir_util.mkpath(os.path.dirname(target))
-        with tarfile.open(target, mode='w:gz') as archive:
-            archive.add(folder, arcname = '.', recursive = True)
-            logger.debug("tar %s -> %s" % (folder, target))
+        tar_archive(folder, target, codec = codec)
     except Exception as e:
         logger.error("Cannot create archive %s -- %s" % (folder, e))
     finally:
@@ -59,6 +71,16 @@ def _archivedir(folder, target, remove = True):
             dir_util.remove_tree(folder)
             logger.debug("Folder %s removed" % folder)
 
+def _garbagedir(kind, folder, owner, label):
+    """
+    @summary: move a folder aside and queue it for the garbage store, the sideeffectworker archives and removes it
+    """
+    from hub.models import GarbageArchive
+    try:
+        GarbageArchive.collect(kind, folder, owner, label)
+    except Exception as e:
+        logger.error("Cannot collect garbage %s -- %s" % (folder, e))
+
 def _copy_dir(f_source, f_target, remove = False):
     if not os.path.exists(f_source):
         msg = "Folder %s not found" % f_source
@@ -98,8 +120,7 @@ def mkdir_home(user):
 
 def garbagedir_home(user):
     dir_home = Dirname.userhome(user)
-    garbage = Filename.userhome_garbage(user)
-    _archivedir(dir_home, garbage)
+    _garbagedir('home', dir_home, user.username, user.username)
 
 ########################################
 
@@ -157,8 +178,7 @@ def snapshot_report(report):
 def garbage_report(report):
     #remove tagged report
     dir_source = Dirname.report_with_tag(report)
-    garbage = Filename.report_garbage(report)
-    _archivedir(dir_source, garbage, remove = True)
+    _garbagedir('report', dir_source, report.creator.username, "%s-%s" % (report.name, report.ts_human))
 
 def prepare_dashboardreport_withinitcell(report):
     import json
@@ -184,20 +204,31 @@ def mkdir_share(userprojectbinding):
     project = userprojectbinding.project
     dir_share = Dirname.share(userprojectbinding)
     _mkdir(dir_share, uid = project.fs_uid, gid = project.fs_gid)
+    if _groupmode():
+        from hub.models import Group
+        apply_acl([ grant_group(dir_share, Group.of_project(project).groupid, default = True) ], recursive = False)
 
 def garbagedir_share(userprojectbinding):
+    project = userprojectbinding.project
     dir_share = Dirname.share(userprojectbinding)
-    garbage = Filename.share_garbage(userprojectbinding)
-    _archivedir(dir_share, garbage)
+    _garbagedir('share', dir_share, project.creator.username, project.uniquename)
 
 
 def grantaccess_share(userprojectbinding):
     user = userprojectbinding.user
+    if _groupmode():
+        from hub.models import Group
+        Group.of_project(userprojectbinding.project).bind(user)
+        return
     dir_share = Dirname.share(userprojectbinding)
     _grantaccess(user, dir_share)
 
 def revokeaccess_share(userprojectbinding):
     user = userprojectbinding.user
+    if _groupmode():
+        from hub.models import Group
+        Group.of_project(userprojectbinding.project).unbind(user)
+        return
     dir_share = Dirname.share(userprojectbinding)
     _revokeaccess(user, dir_share)
 
@@ -208,8 +239,7 @@ def mkdir_workdir(userprojectbinding):
 
 def archivedir_workdir(userprojectbinding):
     dir_workdir = Dirname.workdir(userprojectbinding)
-    target = Filename.workdir_archive(userprojectbinding)
-    _archivedir(dir_workdir, target)
+    _garbagedir('workdir', dir_workdir, userprojectbinding.user.username, userprojectbinding.uniquename)
 
 
 #FIXME: obsoleted
@@ -248,6 +278,15 @@ def mkdir_course_share(course):
         _mkdir(dir_courseprivate, gid = course.groupid, mode = 0o770)
         dir_coursepublic = Dirname.coursepublic(course)
         _mkdir(dir_coursepublic, gid = course.groupid, mode = 0o750)
+        if _groupmode():
+            from hub.models import Group
+            teachers = Group.of_course(course, is_teacher = True).groupid
+            students = Group.of_course(course, is_teacher = False).groupid
+            apply_acl([
+                grant_group(dir_courseprivate, teachers, default = True),
+                grant_group(dir_coursepublic, teachers, default = True),
+                grant_group(dir_coursepublic, students, 'rX', default = True),
+            ], recursive = False)
         logger.info("Course dir created for course %s" % course)
     except KeyError as e:
         logger.error("Cannot create course dir, KOOPLEX['mountpoint']['course'] is missing")
@@ -255,11 +294,15 @@ def mkdir_course_share(course):
 
 def grantacl_course_share(usercoursebinding):
     try:
+        if _groupmode():
+            from hub.models import Group
+            Group.of_course(usercoursebinding.course, usercoursebinding.is_teacher).bind(usercoursebinding.user)
+            return
         dir_coursepublic = Dirname.coursepublic(usercoursebinding.course)
         dir_courseprivate = Dirname.courseprivate(usercoursebinding.course)
         if usercoursebinding.is_teacher:
-            _grantaccess(usercoursebinding.user, dir_coursepublic)
-            _grantaccess(usercoursebinding.user, dir_courseprivate)
+            uid = usercoursebinding.user.profile.userid
+            apply_acl([ grant(dir_coursepublic, uid), grant(dir_courseprivate, uid) ])
         else:
             _grantaccess(usercoursebinding.user, dir_coursepublic, acl = 'rX')
     except Exception as e:
@@ -267,19 +310,24 @@ def grantacl_course_share(usercoursebinding):
 
 def revokeacl_course_share(usercoursebinding):
     try:
+        if _groupmode():
+            from hub.models import Group
+            Group.of_course(usercoursebinding.course, usercoursebinding.is_teacher).unbind(usercoursebinding.user)
+            return
         dir_coursepublic = Dirname.coursepublic(usercoursebinding.course)
         dir_courseprivate = Dirname.courseprivate(usercoursebinding.course)
+        uid = usercoursebinding.user.profile.userid
+        ops = [ revoke(dir_coursepublic, uid) ]
         if usercoursebinding.is_teacher:
-            _revokeaccess(usercoursebinding.user, dir_courseprivate)
-        _revokeaccess(usercoursebinding.user, dir_coursepublic)
+            ops.append(revoke(dir_courseprivate, uid))
+        apply_acl(ops)
     except Exception as e:
         logger.error("Cannot revoke acl %s -- %s" % (usercoursebinding, e))
 
 
 def garbagedir_course_share(course):
     dir_course = Dirname.course(course)
-    garbage = Filename.course_garbage(course)
-    _archivedir(dir_course, garbage)
+    _garbagedir('course', dir_course, None, course.folder)
 
 
 def mkdir_course_workdir(usercoursebinding):
@@ -287,6 +335,12 @@ def mkdir_course_workdir(usercoursebinding):
         dir_usercourse = Dirname.usercourseworkdir(usercoursebinding)
         uid = usercoursebinding.user.profile.userid
         gid = usercoursebinding.course.groupid
+        if _groupmode():
+            # the workdir of the student inherits the entry of the teachers
+            from hub.models import Group
+            dir_courseworkdir = Dirname.courseworkdir(usercoursebinding)
+            dir_util.mkpath(dir_courseworkdir)
+            apply_acl([ grant_group(dir_courseworkdir, Group.of_course(usercoursebinding.course, is_teacher = True).groupid, 'rX', default = True) ], recursive = False)
         _mkdir(dir_usercourse, uid = uid, gid = gid, mode = 0o770)
     except KeyError as e:
         logger.error("Cannot create course dir, KOOPLEX['mountpoint']['usercourse'] is missing")
@@ -294,15 +348,30 @@ def mkdir_course_workdir(usercoursebinding):
 
 def grantacl_course_workdir(usercoursebinding):
     try:
-        if usercoursebinding.is_teacher:
+        if usercoursebinding.is_teacher and not _groupmode():
             dir_usercourse = Dirname.courseworkdir(usercoursebinding)
             _grantaccess(usercoursebinding.user, dir_usercourse, acl = 'rX') #NOTE: formerly rw access was granted
     except Exception as e:
         logger.error("Cannot grant acl %s -- %s" % (usercoursebinding, e))
 
+def grantacl_usercourse_teachers(usercoursebinding):
+    """
+    @summary: the teachers of the course get read access to the workdir of a new student in a single batch.
+    The course workdir above was granted to them recursively when they joined the course.
+    """
+    from hub.models import UserCourseBinding
+    if _groupmode():
+        return
+    try:
+        dir_usercourse = Dirname.usercourseworkdir(usercoursebinding)
+        teachers = UserCourseBinding.objects.filter(course = usercoursebinding.course, is_teacher = True).select_related('user__profile')
+        apply_acl([ grant(dir_usercourse, b.user.profile.userid, 'rX') for b in teachers ])
+    except Exception as e:
+        logger.error("Cannot grant acl %s -- %s" % (usercoursebinding, e))
+
 def revokeacl_course_workdir(usercoursebinding):
     try:
-        if usercoursebinding.is_teacher:
+        if usercoursebinding.is_teacher and not _groupmode():
             dir_usercourse = Dirname.courseworkdir(usercoursebinding)
             _revokeaccess(usercoursebinding.user, dir_usercourse)
     except Exception as e:
@@ -313,8 +382,7 @@ def archive_course_workdir(usercoursebinding):
     if usercoursebinding.is_teacher:
         return
     dir_usercourse = Dirname.usercourseworkdir(usercoursebinding)
-    archive = Filename.courseworkdir_archive(usercoursebinding)
-    _archivedir(dir_usercourse, archive)
+    _garbagedir('usercourse', dir_usercourse, usercoursebinding.user.username, usercoursebinding.course.folder)
 
 
 def rmdir_course_workdir(course):
@@ -329,7 +397,7 @@ def rmdir_course_workdir(course):
 def snapshot_assignment(assignment):
     dir_source = Dirname.assignmentsource(assignment)
     archive = Filename.assignmentsnapshot(assignment)
-    _archivedir(dir_source, archive, remove = False)
+    _archivedir(dir_source, archive, remove = False, codec = 'gzip')
 
 def garbage_assignmentsnapshot(assignment):
     try:
@@ -366,16 +434,17 @@ def cp_assignmentsnapshot(userassignmentbinding):
                 
             
             safe_extract(archive, path=dir_target)
-        _revokeaccess(userassignmentbinding.user, dir_target)
-        for binding in UserCourseBinding.objects.filter(course = assignment.coursecode.course, is_teacher = True):
-            _grantaccess(binding.user, dir_target, acl = 'rX')
+        ops = [ revoke(dir_target, userassignmentbinding.user.profile.userid) ]
+        for binding in UserCourseBinding.objects.filter(course = assignment.coursecode.course, is_teacher = True).select_related('user__profile'):
+            ops.append(grant(dir_target, binding.user.profile.userid, 'rX'))
+        apply_acl(ops)
     except Exception as e:
         logger.error("Cannot cp snapshot dir %s -- %s" % (userassignmentbinding, e))
 
 def cp_userassignment(userassignmentbinding):
     dir_source = Dirname.assignmentworkdir(userassignmentbinding)
     archive = Filename.assignmentcollection(userassignmentbinding)
-    _archivedir(dir_source, archive, remove = userassignmentbinding.assignment.remove_collected)
+    _archivedir(dir_source, archive, remove = userassignmentbinding.assignment.remove_collected, codec = 'gzip')
 
 def cp_userassignment2correct(userassignmentbinding):
     try:
@@ -402,8 +471,7 @@ def cp_userassignment2correct(userassignmentbinding):
                 
             
             safe_extract(archive, path=dir_target)
-        _grantaccess(userassignmentbinding.corrector, dir_target, acl = 'rwX')
-        _grantaccess(userassignmentbinding.user, dir_target, acl = 'rX')
+        apply_acl([ grant(dir_target, userassignmentbinding.corrector.profile.userid, 'rwX'), grant(dir_target, userassignmentbinding.user.profile.userid, 'rX') ])
     except Exception as e:
         logger.error("Cannot copy correct dir %s -- %s" % (userassignmentbinding, e))
 
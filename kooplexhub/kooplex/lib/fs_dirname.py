@@ -91,71 +91,6 @@ class Dirname:
 
     @staticmethod
     def containervolume_listfolders(container, volume):
-        from hub.models import UserCourseBinding, UserAssignmentBinding
-        def get_usercoursebinding_userstate():
-            try:
-                usercoursebinding = UserCourseBinding.objects.get(user = container.user, course = container.course)
-            except UserCourseBinding.DoesNotExist:
-                logger.error("Silly situation, cannot map %s %s COZ user course binding instance is missing" % (volume, container))
-                return None, None
-            if container.course in container.user.profile.courses_taught():
-                return usercoursebinding, 'teacher'
-            elif container.course in container.user.profile.courses_attend():
-                return usercoursebinding, 'student'
-            else:
-                logger.error("Silly situation, cannot map %s %s" % (volume, container))
-                return None, None
-
-        if volume.volumetype == volume.HOME:
-            yield Dirname.userhome(container.user)
-        elif volume.volumetype == volume.GARBAGE:
-            yield Dirname.usergarbage(container.user)
-        elif volume.volumetype == volume.SHARE:
-            for upb in container.userprojectbindings:
-                yield Dirname.share(upb)
-        elif volume.volumetype == volume.WORKDIR:
-            for upb in container.userprojectbindings:
-                yield Dirname.workdir(upb)
-        elif volume.volumetype == volume.GIT:
-            for vcppb in container.vcprojectprojectbindings:
-                yield Dirname.vcpcache(vcppb.vcproject)
-        elif volume.volumetype == volume.FILESYNC:
-            for fslpb in container.fslibraryprojectbindings:
-                yield Dirname.fscache(fslpb.fslibrary)
-        elif volume.volumetype == volume.COURSE_SHARE:
-            if container.course in container.user.profile.courses_taught():
-                yield Dirname.course(container.course)
-            elif container.course in container.user.profile.courses_attend():
-                yield Dirname.coursepublic(container.course)
-            else:
-                logger.error("Silly situation, cannot map %s %s" % (volume, container))
-        elif volume.volumetype == volume.COURSE_WORKDIR and container.course:
-            usercoursebinding, userstatus = get_usercoursebinding_userstate()
-            if userstatus == 'teacher':
-                yield Dirname.courseworkdir(usercoursebinding)
-            elif userstatus == 'student':
-                yield Dirname.usercourseworkdir(usercoursebinding)
-            else:
-                yield "OOPS_%s" % volume.volumetype
-        elif volume.volumetype == volume.COURSE_ASSIGNMENTDIR and container.course:
-            _, userstatus = get_usercoursebinding_userstate()
-            if userstatus == 'teacher':
-                for binding in UserAssignmentBinding.objects.all():
-                    if binding.state == UserAssignmentBinding.ST_QUEUED or binding.corrector is None or binding.assignment.coursecode.course != container.course:
-                        continue
-                    if binding.corrector != container.user:
-                        continue
-                    yield Dirname.assignmentcorrectdir(binding)
-            elif userstatus == 'student':
-                for binding in UserAssignmentBinding.objects.filter(user = container.user):
-                    if binding.state == UserAssignmentBinding.ST_QUEUED or binding.corrector is None or binding.assignment.coursecode.course != container.course:
-                        continue
-                    yield Dirname.assignmentcorrectdir(binding)
-            else:
-                yield "OOPS_%s" % volume.volumetype
-        elif volume.volumetype == volume.REPORT:
-            yield Dirname.reportroot(container.user)
-        else:
-            yield "MISSING_DIRNAME_%s" % volume.volumetype
-
-
+        from .fs_mountplan import build_mountplan
+        for folder in build_mountplan(container).listfolders(volume):
+            yield folder
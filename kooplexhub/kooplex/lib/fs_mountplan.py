@@ -0,0 +1,186 @@
+"""
+@author: Jozsef Steger
+@summary: compute the volume binds and the folder mapper of containers with a fixed number of queries
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+MountVolume = namedtuple('MountVolume', [ 'name', 'volumetype', 'mountpoint', 'mode' ])
+
+class MountPlan(namedtuple('MountPlan', [ 'container_name', 'volumes', 'folders' ])):
+    """
+    @summary: the immutable mount plan of a container
+    @ivar volumes: tuple of MountVolume, the docker volumes to bind
+    @ivar folders: tuple of (volume name, volume type, folder) triplets, the subfolders the mounter maps
+    """
+    __slots__ = ()
+
+    @property
+    def mountpoints(self):
+        return [ v.mountpoint for v in self.volumes ]
+
+    @property
+    def binds(self):
+        return dict([ (v.name, { 'bind': v.mountpoint, 'mode': v.mode }) for v in self.volumes ])
+
+    def listfolders(self, volume):
+        for name, _, folder in self.folders:
+            if name == volume.name:
+                yield folder
+
+    @property
+    def mapper(self):
+        return [ "%s:%s" % (volumetype, folder) for _, volumetype, folder in self.folders ]
+
+    @property
+    def mountconf(self):
+        #NOTE: mounter uses read to process the mapper configuration, thus we need to make sure '\n' terminates the config mapper file
+        return "\n".join(self.mapper + [ '' ]).encode('utf8')
+
+
+def build_mountplan(container):
+    return build_mountplans([ container ])[container.id]
+
+def build_mountplans(containers):
+    """
+    @summary: compute the mount plans of a batch of containers
+    @param containers: the container model instances
+    @returns: a dictionary mapping container ids to MountPlan instances
+    """
+    from hub.models import Volume, VolumeOwnerBinding, VolumeContainerBinding, ProjectContainerBinding, CourseContainerBinding
+    from hub.models import UserProjectBinding, VCProjectProjectBinding, FSLibraryProjectBinding, UserCourseBinding, UserAssignmentBinding
+    from django.db.models import Q
+    from .fs_dirname import Dirname
+    containers = list(containers)
+    ids = [ c.id for c in containers ]
+    users = set([ c.user_id for c in containers ])
+
+    volumes = {}
+    for b in VolumeContainerBinding.objects.filter(container_id__in = ids).select_related('volume', 'volume__extrafields').order_by('id'):
+        volumes.setdefault(b.container_id, []).append(b.volume)
+    functional = [ v.id for vs in volumes.values() for v in vs if v.volumetype == Volume.FUNCTIONAL ]
+    owners = set(VolumeOwnerBinding.objects.filter(volume_id__in = functional).values_list('volume_id', 'owner_id'))
+
+    projects = {}
+    for b in ProjectContainerBinding.objects.filter(container_id__in = ids).select_related('project').order_by('id'):
+        projects.setdefault(b.container_id, []).append(b.project)
+    project_ids = set([ p.id for ps in projects.values() for p in ps ])
+    userprojectbindings = {}
+    creators = {}
+    for b in UserProjectBinding.objects.filter(project_id__in = project_ids).select_related('user', 'project'):
+        userprojectbindings[(b.user_id, b.project_id)] = b
+        if b.role == UserProjectBinding.RL_CREATOR:
+            creators[b.project_id] = b.user
+    for b in userprojectbindings.values():
+        b.project._creator = creators.get(b.project_id)
+    for ps in projects.values():
+        for p in ps:
+            p._creator = creators.get(p.id)
+    vcppbs = {}
+    for b in VCProjectProjectBinding.objects.filter(project_id__in = project_ids).select_related('vcproject', 'vcproject__token').order_by('id'):
+        vcppbs.setdefault(b.project_id, []).append(b)
+    fslpbs = {}
+    for b in FSLibraryProjectBinding.objects.filter(project_id__in = project_ids, fslibrary__token__user_id__in = users).select_related('fslibrary', 'fslibrary__token').order_by('id'):
+        fslpbs.setdefault((b.project_id, b.fslibrary.token.user_id), []).append(b)
+
+    courses = {}
+    for b in CourseContainerBinding.objects.filter(container_id__in = ids).select_related('course'):
+        courses.setdefault(b.container_id, b.course)
+    course_ids = set([ c.id for c in courses.values() ])
+    usercoursebindings = {}
+    for b in UserCourseBinding.objects.filter(course_id__in = course_ids, user_id__in = users).select_related('user', 'course').order_by('id'):
+        usercoursebindings.setdefault((b.user_id, b.course_id), []).append(b)
+    userassignmentbindings = {}
+    query = Q(assignment__coursecode__course_id__in = course_ids) & ~Q(state = UserAssignmentBinding.ST_QUEUED) & Q(corrector__isnull = False) & (Q(user_id__in = users) | Q(corrector_id__in = users))
+    for b in UserAssignmentBinding.objects.filter(query).select_related('user', 'assignment', 'assignment__coursecode', 'assignment__coursecode__course').order_by('id'):
+        userassignmentbindings.setdefault(b.assignment.coursecode.course_id, []).append(b)
+
+    plans = {}
+    for container in containers:
+        user = container.user
+        course = courses.get(container.id)
+        container_projects = projects.get(container.id, [])
+        upbs = [ userprojectbindings[(user.id, p.id)] for p in container_projects if (user.id, p.id) in userprojectbindings ]
+        ucbs = usercoursebindings.get((user.id, course.id), []) if course else []
+        if any([ b.is_teacher for b in ucbs ]):
+            userstatus = 'teacher'
+        elif ucbs:
+            userstatus = 'student'
+        else:
+            userstatus = None
+        mountvolumes = []
+        folders = []
+        for volume in volumes.get(container.id, []):
+            if volume.volumetype == Volume.FUNCTIONAL:
+                mode = 'rw' if (volume.id, user.id) in owners else 'ro'
+            else:
+                mode = volume.mode(user)
+            mountvolumes.append(MountVolume(volume.name, volume.volumetype, volume.mountpoint, mode))
+            for folder in _listfolders(Dirname, container, user, volume, course, userstatus, ucbs, upbs, container_projects, vcppbs, fslpbs, userassignmentbindings):
+                folders.append((volume.name, volume.volumetype, folder))
+        plans[container.id] = MountPlan(container.name, tuple(mountvolumes), tuple(folders))
+        logger.debug("container %s plan %s" % (container, plans[container.id]))
+    return plans
+
+def _listfolders(Dirname, container, user, volume, course, userstatus, ucbs, upbs, projects, vcppbs, fslpbs, userassignmentbindings):
+    from hub.models import UserAssignmentBinding
+    if volume.volumetype == volume.HOME:
+        yield Dirname.userhome(user)
+    elif volume.volumetype == volume.GARBAGE:
+        yield Dirname.usergarbage(user)
+    elif volume.volumetype == volume.SHARE:
+        for upb in upbs:
+            yield Dirname.share(upb)
+    elif volume.volumetype == volume.WORKDIR:
+        for upb in upbs:
+            yield Dirname.workdir(upb)
+    elif volume.volumetype == volume.GIT:
+        serve_history = {}
+        for project in projects:
+            creator = project.creator
+            for vcppb in vcppbs.get(project.id, []):
+                if vcppb.vcproject.token.user_id == user.id:
+                    yield Dirname.vcpcache(vcppb.vcproject)
+                    serve_history[project.id] = None
+                if creator is not None and vcppb.vcproject.token.user_id == creator.id:
+                    if not project.id in serve_history:
+                        serve_history[project.id] = vcppb
+        for vcppb in serve_history.values():
+            if vcppb is not None:
+                yield Dirname.vcpcache(vcppb.vcproject)
+    elif volume.volumetype == volume.FILESYNC:
+        for project in projects:
+            for fslpb in fslpbs.get((project.id, user.id), []):
+                yield Dirname.fscache(fslpb.fslibrary)
+    elif volume.volumetype == volume.COURSE_SHARE:
+        if userstatus == 'teacher':
+            yield Dirname.course(course)
+        elif userstatus == 'student':
+            yield Dirname.coursepublic(course)
+        else:
+            logger.error("Silly situation, cannot map %s %s" % (volume, container))
+    elif volume.volumetype == volume.COURSE_WORKDIR and course:
+        if userstatus == 'teacher':
+            yield Dirname.courseworkdir(ucbs[0])
+        elif userstatus == 'student':
+            yield Dirname.usercourseworkdir(ucbs[0])
+        else:
+            logger.error("Silly situation, cannot map %s %s COZ user course binding instance is missing" % (volume, container))
+            yield "OOPS_%s" % volume.volumetype
+    elif volume.volumetype == volume.COURSE_ASSIGNMENTDIR and course:
+        if userstatus == 'teacher':
+            for binding in userassignmentbindings.get(course.id, []):
+                if binding.corrector_id == user.id:
+                    yield Dirname.assignmentcorrectdir(binding)
+        elif userstatus == 'student':
+            for binding in userassignmentbindings.get(course.id, []):
+                if binding.user_id == user.id:
+                    yield Dirname.assignmentcorrectdir(binding)
+        else:
+            yield "OOPS_%s" % volume.volumetype
+    elif volume.volumetype == volume.REPORT:
+        yield Dirname.reportroot(user)
+    else:
+        yield "MISSING_DIRNAME_%s" % volume.volumetype
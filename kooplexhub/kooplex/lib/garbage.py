@@ -0,0 +1,233 @@
+"""
+@author: Jozsef Steger
+@summary: content addressed store of the garbage. The files of a folder are cut into chunks named by their sha256 digest,
+each chunk is compressed and stored once, however many archives contain it. An archive is a manifest listing the entries of
+the folder and the digests of their chunks. Chunks no manifest refers to any more are removed by a sweep.
+"""
+import os
+import json
+import gzip
+import zlib
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.settings import KOOPLEX
+from kooplex.lib import Dirname
+
+logger = logging.getLogger(__name__)
+
+garbageconf = KOOPLEX.get('garbage', {})
+
+def store_root():
+    if 'store' in garbageconf:
+        return garbageconf['store']
+    return os.path.join(Dirname.mountpoint['garbage'], '.store')
+
+def _chunkpath(digest):
+    return os.path.join(store_root(), 'chunks', digest[:2], digest[2:4], digest)
+
+def manifestpath(name):
+    return os.path.join(store_root(), 'manifests', '%s.json.gz' % name)
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp = "%s.tmp.%d.%d" % (path, os.getpid(), threading.get_ident())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.rename(tmp, path)
+
+
+class Stats:
+    def __init__(self):
+        self.files = 0
+        self.raw_bytes = 0
+        self.chunks = 0
+        self.new_chunks = 0
+        self.stored_bytes = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def _put(block, level):
+    """
+    @summary: store a chunk unless it is already there. An existing chunk is touched, so a sweep running meanwhile spares it.
+    @returns: the digest and the number of bytes written
+    """
+    digest = hashlib.sha256(block).hexdigest()
+    path = _chunkpath(digest)
+    try:
+        os.utime(path)
+        return digest, 0
+    except FileNotFoundError:
+        pass
+    data = zlib.compress(block, level)
+    _atomic_write(path, data)
+    return digest, len(data)
+
+def _walk(folder):
+    """
+    @summary: the entries of a folder tree, symbolic links are recorded but not followed
+    """
+    stack = [ '' ]
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(folder, relative)) as it:
+            for entry in sorted(it, key = lambda e: e.name):
+                path = os.path.join(relative, entry.name)
+                st = entry.stat(follow_symlinks = False)
+                record = { 'path': path, 'mode': st.st_mode & 0o7777, 'uid': st.st_uid, 'gid': st.st_gid, 'mtime': st.st_mtime }
+                if entry.is_symlink():
+                    record.update({ 'type': 'l', 'target': os.readlink(entry.path) })
+                elif entry.is_dir(follow_symlinks = False):
+                    record['type'] = 'd'
+                    stack.append(path)
+                elif entry.is_file(follow_symlinks = False):
+                    record.update({ 'type': 'f', 'size': st.st_size })
+                else:
+                    # sockets, fifos and devices are not archived
+                    continue
+                yield entry.path, record
+
+def store(folder, name, threads = None):
+    """
+    @summary: store a folder tree. The chunks are digested, compressed and written on a thread pool, at most a few chunks
+    per thread are held in memory. Storing the same folder again under the same name is harmless.
+    @param name: the name of the manifest
+    @returns: the statistics, see Stats
+    """
+    threads = threads or garbageconf.get('threads', 4)
+    chunksize = garbageconf.get('chunksize', 1024 * 1024)
+    level = garbageconf.get('level', 6)
+    stats = Stats()
+    records = []
+    pending = deque()
+
+    def settle(n):
+        while len(pending) > n:
+            record, future = pending.popleft()
+            digest, written = future.result()
+            record['chunks'].append(digest)
+            stats.chunks += 1
+            if written:
+                stats.new_chunks += 1
+                stats.stored_bytes += written
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers = threads) as pool:
+        for path, record in _walk(folder):
+            records.append(record)
+            if record['type'] != 'f':
+                continue
+            record['chunks'] = []
+            stats.files += 1
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(chunksize)
+                    if not block:
+                        break
+                    stats.raw_bytes += len(block)
+                    # the chunks of a file are settled in order, the digests are appended in place
+                    pending.append((record, pool.submit(_put, block, level)))
+                    settle(2 * threads)
+        settle(0)
+    manifest = gzip.compress("\n".join([ json.dumps(r) for r in records ]).encode(), mtime = 0)
+    _atomic_write(manifestpath(name), manifest)
+    dt = time.time() - t0
+    logger.info("stored %s as %s: %d files, %.1f MB in %.1f s, %d of %d chunks new, %.1f MB written" % (folder, name, stats.files, stats.raw_bytes / 1e6, dt, stats.new_chunks, stats.chunks, stats.stored_bytes / 1e6))
+    return stats.as_dict()
+
+def read_manifest(name):
+    with gzip.open(manifestpath(name), 'rt') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def restore(name, target):
+    """
+    @summary: recreate the folder tree of a manifest under target, the owners are restored when run as root
+    """
+    records = list(read_manifest(name))
+    os.makedirs(target, exist_ok = True)
+    for r in records:
+        path = os.path.join(target, r['path'])
+        if r['type'] == 'd':
+            os.makedirs(path, exist_ok = True)
+        elif r['type'] == 'l':
+            os.symlink(r['target'], path)
+        else:
+            with open(path, 'wb') as f:
+                for digest in r['chunks']:
+                    with open(_chunkpath(digest), 'rb') as c:
+                        f.write(zlib.decompress(c.read()))
+    # directories last and deepest first, so writing into them does not spoil their mode and mtime
+    for r in sorted(records, key = lambda r: (r['type'] == 'd', -r['path'].count(os.sep))):
+        path = os.path.join(target, r['path'])
+        try:
+            os.chown(path, r['uid'], r['gid'], follow_symlinks = False)
+        except PermissionError:
+            pass
+        if r['type'] != 'l':
+            os.chmod(path, r['mode'])
+            os.utime(path, (r['mtime'], r['mtime']))
+
+def discard(name):
+    try:
+        os.unlink(manifestpath(name))
+    except FileNotFoundError:
+        logger.warning("manifest %s is missing" % name)
+
+def sweep(names, grace = None, dry = False):
+    """
+    @summary: remove the chunks none of the listed manifests refer to. Chunks written or touched recently are
+    spared, they may belong to an archive being stored.
+    @param names: the manifests to keep
+    @param grace: seconds, defaults to KOOPLEX['garbage']['sweep_grace'] or a day
+    @returns: the number of chunks and bytes removed
+    """
+    grace = grace if grace is not None else garbageconf.get('sweep_grace', 24 * 3600)
+    live = set()
+    for name in names:
+        for r in read_manifest(name):
+            live.update(r.get('chunks', []))
+    deadline = time.time() - grace
+    n, size = 0, 0
+    dir_chunks = os.path.join(store_root(), 'chunks')
+    if not os.path.isdir(dir_chunks):
+        return n, size
+    for dirpath, _, filenames in os.walk(dir_chunks):
+        for fn in filenames:
+            if fn in live:
+                continue
+            path = os.path.join(dirpath, fn)
+            st = os.stat(path)
+            if st.st_mtime > deadline:
+                continue
+            n += 1
+            size += st.st_size
+            if not dry:
+                os.unlink(path)
+    logger.info("sweep %s %d chunks, %.1f MB" % ("would remove" if dry else "removed", n, size / 1e6))
+    return n, size
+
+def stage(folder):
+    """
+    @summary: move a folder aside in its own volume, so it can be archived later and the name is free right away
+    @returns: the new path, None if the folder is missing
+    """
+    if not os.path.exists(folder):
+        logger.warning("Folder %s is missing" % folder)
+        return None
+    staging = os.path.join(os.path.dirname(folder), '.garbage-%s.%f' % (os.path.basename(folder), time.time()))
+    os.rename(folder, staging)
+    logger.debug("staged %s -> %s" % (folder, staging))
+    return staging
+
+def unstage(staging):
+    shutil.rmtree(staging)
+    logger.debug("Folder %s removed" % staging)
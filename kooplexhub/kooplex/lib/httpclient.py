@@ -0,0 +1,213 @@
+"""
+@author: Jozsef Steger
+@summary: a shared HTTP client of the upstream services (proxy, report server, jupyter, impersonator).
+Each upstream has its own pooled session, retry policy, deadline budget, circuit breaker and counters, an upstream of
+many hosts has a bounded map of circuits, one per host.
+"""
+import time
+import random
+import logging
+import threading
+import requests
+import requests.adapters
+from collections import OrderedDict
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'pool_size': 10,
+    'timeout': (3.05, 30),      # connect and read timeouts of a single call
+    'retries': 5,               # number of calls at most
+    'deadline': 30,             # seconds, the budget of all calls and sleeps together
+    'backoff': .1,              # seconds, the first sleep between calls
+    'backoff_max': 5,           # seconds, the sleeps are capped
+    'failure_threshold': 5,     # consecutive failures that open the circuit
+    'reset_after': 30,          # seconds the circuit stays open before a trial call is let through
+    'circuits': 1024,           # hosts whose circuit is kept
+}
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """
+    @summary: raised without calling the upstream while its circuit is open
+    """
+    pass
+
+
+class Circuit:
+    """
+    @summary: the breaker state of a single host of an upstream
+    """
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+
+class Upstream:
+    def __init__(self, name, **conf):
+        self.name = name
+        self.conf = dict(DEFAULTS)
+        self.conf.update(conf)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = self.conf['pool_size'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        # the circuits of the hosts, least recently used first
+        self._circuits = OrderedDict()
+        self.n_calls = 0
+        self.n_errors = 0
+        self.n_retries = 0
+        self.n_rejected = 0
+        self.latency_total = 0.
+        self.latency_max = 0.
+
+    def __str__(self):
+        return "<Upstream %s %s>" % (self.name, self.state)
+
+    def _circuit(self, host):
+        """
+        @summary: the circuit of a host, the least recently used ones are dropped above KOOPLEX['http'][name]['circuits'] hosts
+        """
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = Circuit()
+            while len(self._circuits) > self.conf['circuits']:
+                self._circuits.popitem(last = False)
+        else:
+            self._circuits.move_to_end(host)
+        return circuit
+
+    def _state(self, circuit):
+        if circuit.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.time() - circuit.opened_at >= self.conf['reset_after'] else 'open'
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(self._circuit(None))
+
+    def _admit(self, host):
+        with self._lock:
+            circuit = self._circuit(host)
+            if circuit.opened_at is None:
+                return
+            if time.time() - circuit.opened_at >= self.conf['reset_after'] and not circuit.trial:
+                circuit.trial = True
+                return
+            self.n_rejected += 1
+        raise CircuitOpen("circuit of upstream %s is open" % self._label(host))
+
+    def _label(self, host):
+        return self.name if host is None else "%s:%s" % (self.name, host)
+
+    def _record(self, host, latency, failed):
+        with self._lock:
+            circuit = self._circuit(host)
+            self.n_calls += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            circuit.trial = False
+            if failed:
+                self.n_errors += 1
+                circuit.failures += 1
+                if circuit.opened_at is not None or circuit.failures >= self.conf['failure_threshold']:
+                    if circuit.opened_at is None:
+                        logger.error("circuit of upstream %s opens after %d failures" % (self._label(host), circuit.failures))
+                    circuit.opened_at = time.time()
+            else:
+                if circuit.opened_at is not None:
+                    logger.info("circuit of upstream %s closes" % self._label(host))
+                circuit.failures = 0
+                circuit.opened_at = None
+
+    def request(self, method, url, retries = None, deadline = None, host = None, **kw):
+        """
+        @summary: call the upstream, retry failed calls with capped and jittered exponential backoff within the deadline
+        @param method: the HTTP method
+        @param url: the URL to call
+        @param host: the host of an upstream having many, like the notebook servers, each host has its own circuit
+        @param retries: the number of calls at most, defaults to the configuration of the upstream
+        @param deadline: seconds, the overall time budget, defaults to the configuration of the upstream
+        @param kw: keyword arguments passed to requests
+        @returns: the response
+        @raises CircuitOpen if the upstream is considered down, or the last exception of the calls
+        """
+        retries = retries or self.conf['retries']
+        t_end = time.time() + (deadline or self.conf['deadline'])
+        dt = self.conf['backoff']
+        kw.setdefault('timeout', self.conf['timeout'])
+        attempt = 0
+        while True:
+            attempt += 1
+            self._admit(host)
+            t0 = time.time()
+            try:
+                response = self.session.request(method, url, **kw)
+                self._record(host, time.time() - t0, response.status_code >= 500)
+                return response
+            except Exception as e:
+                self._record(host, time.time() - t0, True)
+                sleep = random.uniform(dt / 2, dt)
+                if attempt >= retries or time.time() + sleep >= t_end:
+                    logger.error("gave up %s %s after %d calls -- %s" % (method, url, attempt, e))
+                    raise
+                logger.warning("%s %s failed (%s) [backoff %.2f s and try %d more]" % (method, url, e, sleep, retries - attempt))
+                with self._lock:
+                    self.n_retries += 1
+                time.sleep(sleep)
+                dt = min(2 * dt, self.conf['backoff_max'])
+
+    def statistics(self):
+        with self._lock:
+            return {
+                'state': self._state(self._circuit(None)),
+                'open_circuits': len([ c for c in self._circuits.values() if c.opened_at is not None ]),
+                'calls': self.n_calls,
+                'errors': self.n_errors,
+                'retries': self.n_retries,
+                'rejected': self.n_rejected,
+                'latency_mean': self.latency_total / self.n_calls if self.n_calls else None,
+                'latency_max': self.latency_max,
+            }
+
+
+_upstreams = {}
+_lock = threading.Lock()
+
+def upstream(name):
+    """
+    @summary: the shared client of an upstream, configured by KOOPLEX['http'][name]
+    """
+    httpconf = KOOPLEX.get('http', {})
+    with _lock:
+        if not name in _upstreams:
+            _upstreams[name] = Upstream(name, **httpconf.get(name, {}))
+        return _upstreams[name]
+
+def request(name, method, url, **kw):
+    """
+    @summary: call an upstream, names like jupyter:<containername> share the client of their prefix and have a circuit of their own
+    """
+    name, _, host = name.partition(':')
+    return upstream(name).request(method, url, host = host or None, **kw)
+
+def get(name, url, **kw):
+    return request(name, 'GET', url, **kw)
+
+def post(name, url, **kw):
+    return request(name, 'POST', url, **kw)
+
+def delete(name, url, **kw):
+    return request(name, 'DELETE', url, **kw)
+
+def statistics():
+    """
+    @summary: counters of all the upstreams used by this process
+    """
+    with _lock:
+        upstreams = list(_upstreams.values())
+    return dict([ (u.name, u.statistics()) for u in upstreams ])
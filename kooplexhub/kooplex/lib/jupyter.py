@@ -1,9 +1,8 @@
 #
 import os
-import requests
 
 from kooplex.settings import KOOPLEX
-from kooplex.lib import keeptrying
+from kooplex.lib import httpclient
 
 def jupyter_session(container):
     """
@@ -13,5 +12,20 @@ def jupyter_session(container):
         'url': os.path.join(KOOPLEX.get('spawner', {}).get('pattern_jupyterapi') % info, 'sessions'), 
         'headers': {'Authorization': 'token %s' % container.report.password, },
     }
-    return keeptrying(requests.get, 50, **kw)
+    return httpclient.get('jupyter', **kw)
  
+
+def jupyter_kernels(container):
+    """
+    @summary: list the kernels of the notebook server running in a container
+    @returns: the list of kernel models, each having last_activity, execution_state and connections
+    """
+    kw = {
+        'url': os.path.join(container.url, container.proxy_path, 'api', 'kernels'),
+        'headers': {'Authorization': 'token %s' % container.user.profile.token, },
+        'retries': 1,
+        'deadline': KOOPLEX.get('culler', {}).get('timeout', 10),
+    }
+    response = httpclient.get('jupyter:%s' % container.name, **kw)
+    response.raise_for_status()
+    return response.json()
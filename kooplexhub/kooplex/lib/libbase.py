@@ -4,6 +4,7 @@
 """
 import re
 import time
+import random
 import logging
 import subprocess
 import shlex
@@ -36,14 +37,16 @@ def human_localtime(d):
     return d.astimezone(local_timezone).strftime('%Y_%m_%d-%H:%M:%S')
 
 
-def keeptrying(method, times, **kw):
+def keeptrying(method, times, backoff_max = 5, **kw):
     """
     @summary: run an arbitrary method with keyword arguments. In case an exception is raised during the call, 
-    keep trying some more times with exponentially increasing waiting time between consecutive calls.
+    keep trying some more times with exponentially increasing, jittered waiting time between consecutive calls.
     @param method: the method to call
     @type method: callable
     @param times: the number of trials
     @type times: int
+    @param backoff_max: the cap of the waiting time in seconds
+    @type backoff_max: float
     @param kw: keyword arguments to pass to the method
     @returns the return value of method
     @raises the last exception if calling th method fails times many times
@@ -59,8 +62,8 @@ def keeptrying(method, times, **kw):
             if times == 0:
                 logging.error("gave up execution of %s" % method)
                 raise
-            time.sleep(dt)
-            dt *= 2
+            time.sleep(random.uniform(dt / 2, dt))
+            dt = min(2 * dt, backoff_max)
 
 
 def bash(command):
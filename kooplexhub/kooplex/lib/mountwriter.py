@@ -0,0 +1,62 @@
+"""
+@author: Jozsef Steger
+@summary: process-wide coalescing writer of container mount configurations
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+dockerconf = KOOPLEX.get('docker', {})
+
+_lock = threading.Lock()
+_pending = set()    # the ids of containers waiting for a mount configuration update
+_timer = None
+_pool = ThreadPoolExecutor(max_workers = dockerconf.get('mountconf_workers', 4))
+
+def schedule(container):
+    """
+    @summary: request a mount configuration update of a container. Requests arriving within the
+    delay are coalesced, and each affected container is written at most once per flush.
+    """
+    global _timer
+    with _lock:
+        _pending.add(container.id)
+        if _timer is None:
+            _timer = threading.Timer(dockerconf.get('mountconf_delay', 1), flush)
+            _timer.daemon = True
+            _timer.start()
+            logger.debug("Aggregating timer started.")
+        else:
+            logger.debug("still aggregating... %d containers pending" % len(_pending))
+
+def flush():
+    """
+    @summary: render the mount configuration of all pending containers, and write the changed ones on the thread pool
+    @returns: the list of futures of the writes
+    """
+    global _timer, _pending
+    from django.db import connection
+    from hub.models import Container
+    from kooplex.lib import Docker
+    from kooplex.lib.fs_mountplan import build_mountplans
+    with _lock:
+        container_ids = _pending
+        _pending = set()
+        _timer = None
+    futures = []
+    try:
+        docker = Docker()
+        containers = list(Container.objects.filter(id__in = container_ids).exclude(state = Container.ST_NOTPRESENT).select_related('user'))
+        plans = build_mountplans(containers)
+        for container in containers:
+            futures.append(_pool.submit(docker.managemount, container, plans[container.id].mountconf))
+        logger.debug("flushed mount configuration of %d containers" % len(futures))
+    except Exception as e:
+        logger.error("cannot manage mapping in containers %s -- %s" % (container_ids, e))
+    finally:
+        connection.close()
+    return futures
@@ -3,12 +3,12 @@
 """
 import os
 import json
-import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from kooplex.settings import KOOPLEX
 from hub.models import Container, Report
-from kooplex.lib import keeptrying
+from kooplex.lib import httpclient
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +18,7 @@ def getroutes():
         'url': os.path.join(proxyconf.get('base_url','localhost'), 'api', 'routes'), 
         'headers': {'Authorization': 'token %s' % proxyconf.get('auth_token', '') },
     }
-    return keeptrying(requests.get, 50, **kw)
+    return httpclient.get('proxy', **kw)
 
 
 def droproutes():
@@ -31,7 +31,7 @@ def droproutes():
             'headers': {'Authorization': 'token %s' % proxyconf.get('auth_token', '') },
         }
         logging.debug("- %s -/-> %s" % (kw['url'], v['target']))
-        resp_latest = keeptrying(requests.delete, 5, **kw)
+        resp_latest = httpclient.delete('proxy', **kw)
 #    return resp_latest
 
 
@@ -60,13 +60,13 @@ def _addroute_container(container, test=False):
                  'data': json.dumps({ 'target': container.url_test }),
              }
              logging.debug("+ %s ---> %s report proxy path latest" % (kw['url'], container.url))
-             keeptrying(requests.post, 50, **kw)
+             httpclient.post('proxy', **kw)
         except: 
              logging.debug("Container is not for report")
 
 
     logging.debug("+ %s ---> %s" % (kw['url'], container.url))
-    return keeptrying(requests.post, 50, **kw)
+    return httpclient.post('proxy', **kw)
 
  
 def _addroute_report(report):
@@ -83,7 +83,7 @@ def _addroute_report(report):
         'data': json.dumps({ 'target': target_url }),
     }
     logging.debug("+ %s ---> %s" % (kw['url'], target_url))
-    keeptrying(requests.post, 50, **kw)
+    httpclient.post('proxy', **kw)
 
     kw = {
         'url': os.path.join(proxyconf.get('base_url','localhost'), 'api', 'routes', route_prefix, report.proxy_path_latest), 
@@ -91,7 +91,7 @@ def _addroute_report(report):
         'data': json.dumps({ 'target': target_url }),
     }
     logging.debug("Report proxy + %s ---> %s" % (kw['url'], target_url))
-    return keeptrying(requests.post, 50, **kw)
+    return httpclient.post('proxy', **kw)
 
 def addroute(instance):
     if isinstance(instance, Container):
@@ -109,7 +109,7 @@ def _removeroute_container(container):
         'headers': {'Authorization': 'token %s' % proxyconf.get('auth_token', '') },
     }
     logging.debug("- %s -/-> %s" % (kw['url'], container.url))
-    return keeptrying(requests.delete, 5, **kw)
+    return httpclient.delete('proxy', **kw)
 
 def _removeroute_report(report):
     proxyconf = KOOPLEX.get('proxy', {})
@@ -120,7 +120,7 @@ def _removeroute_report(report):
         'headers': {'Authorization': 'token %s' % proxyconf.get('auth_token', '') },
     }
     logging.debug("- %s -/-> %s" % (kw['url'], target_url))
-    return keeptrying(requests.delete, 5, **kw)
+    return httpclient.delete('proxy', **kw)
 
 def removeroute(instance):
     if isinstance(instance, Container):
@@ -129,3 +129,79 @@ def removeroute(instance):
         return _removeroute_report(instance)
     logger.error('Not implemented')
 
+
+
+def desiredroutes():
+    """
+    @summary: the route table the proxy should hold according to the database
+    @returns: a dictionary mapping route paths to targets
+    """
+    reportconf = KOOPLEX.get('reportserver', {})
+    routes = {}
+    for c in Container.objects.filter(state = Container.ST_RUNNING).select_related('user'):
+        routes['/' + c.proxy_path.strip('/')] = c.url
+        routes['/' + c.proxy_path_test.strip('/')] = c.url_test
+        report = c.report
+        if report is not None:
+            routes['/' + os.path.join('notebook', report.proxy_path_latest).strip('/')] = c.url_test
+    for r in Report.objects.all().select_related('creator'):
+        target_url = reportconf.get('base_url', 'localhost')
+        route_prefix = 'report'
+        if r.reporttype != r.TP_STATIC:
+            route_prefix = 'notebook'
+            target_url = r.url_external
+        routes['/' + os.path.join(route_prefix, r.proxy_path).strip('/')] = target_url
+        routes['/' + os.path.join(route_prefix, r.proxy_path_latest).strip('/')] = target_url
+    return routes
+
+def diffroutes():
+    """
+    @summary: compare the route table of the proxy with the desired one
+    @returns: (add, change, delete) where add and change map route paths to targets, delete maps route paths to their current targets
+    """
+    current = dict([ (r, v.get('target')) for r, v in json.loads(getroutes().content.decode()).items() ])
+    desired = desiredroutes()
+    add = dict([ (r, t) for r, t in desired.items() if not r in current ])
+    change = dict([ (r, t) for r, t in desired.items() if r in current and current[r] != t ])
+    # the default route of the proxy is not ours
+    delete = dict([ (r, t) for r, t in current.items() if not r in desired and r != '/' ])
+    return add, change, delete
+
+def reconcileroutes(dry = False, workers = 8):
+    """
+    @summary: fetch the route table once, and apply only the necessary additions, target changes and deletions in parallel over the shared
+    session of the proxy upstream, whose pool size bounds the concurrency anyway
+    @returns: (add, change, delete, errors) as of diffroutes() and the number of failed calls
+    """
+    proxyconf = KOOPLEX.get('proxy', {})
+    headers = {'Authorization': 'token %s' % proxyconf.get('auth_token', '') }
+    add, change, delete = diffroutes()
+    if dry:
+        return add, change, delete, 0
+    def _post(route, target):
+        kw = {
+            'url': os.path.join(proxyconf.get('base_url','localhost'), 'api', 'routes', route.lstrip('/')),
+            'headers': headers,
+            'data': json.dumps({ 'target': target }),
+        }
+        logging.debug("+ %s ---> %s" % (kw['url'], target))
+        return httpclient.post('proxy', **kw)
+    def _delete(route, target):
+        kw = {
+            'url': os.path.join(proxyconf.get('base_url','localhost'), 'api', 'routes', route.lstrip('/')),
+            'headers': headers,
+        }
+        logging.debug("- %s -/-> %s" % (kw['url'], target))
+        return httpclient.delete('proxy', **kw)
+    errors = 0
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = [ pool.submit(_post, r, t) for r, t in list(add.items()) + list(change.items()) ]
+        futures.extend([ pool.submit(_delete, r, t) for r, t in delete.items() ])
+        for f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                logger.error("route reconciliation call failed -- %s" % e)
+                errors += 1
+    logger.info("routes reconciled: +%d ~%d -%d, %d errors" % (len(add), len(change), len(delete), errors))
+    return add, change, delete, errors
@@ -0,0 +1,67 @@
+"""
+@author: Jozsef Steger
+@summary: the common parts of the workers carrying out queued records, the containerworker and the sideeffectworker.
+A worker is identified by <hostname>:<pid>, it claims records by storing its id in their worker field.
+"""
+import os
+import time
+import socket
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def worker_id():
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+def is_gone(worker):
+    """
+    @summary: whether the process of a worker id of this host is not running any more
+    """
+    try:
+        pid = int(worker.rsplit(':', 1)[1])
+    except (IndexError, ValueError):
+        return True
+    # a worker started as the first process of its container may get the pid of its former instance
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+def reset_stale(model, field, running, queued):
+    """
+    @summary: requeue the records left running by former worker processes of this host. Records of a live sibling worker
+    on the same host are kept, workers of other hosts recover their own records.
+    @param model: the model of the queue
+    @param field: the name of the state field, running and queued are its values
+    @returns: the number of records requeued
+    """
+    workers = set(model.objects.filter(**{ field: running, 'worker__startswith': "%s:" % socket.gethostname() }).values_list('worker', flat = True))
+    gone = [ w for w in workers if is_gone(w) ]
+    return model.objects.filter(**{ field: running, 'worker__in': gone }).update(**{ field: queued, 'worker': None })
+
+def serve(claim, run, concurrency, poll, once = False):
+    """
+    @summary: claim records and run them on a thread pool
+    @param claim: called with the number of free threads, returns the claimed records
+    @param run: called with a record in a thread of the pool
+    @param once: return when nothing is left to claim and all the claimed records are done
+    """
+    running = {}
+    with ThreadPoolExecutor(max_workers = concurrency) as pool:
+        while True:
+            for record_id, future in list(running.items()):
+                if future.done():
+                    del running[record_id]
+            records = claim(concurrency - len(running))
+            for record in records:
+                running[record.id] = pool.submit(run, record)
+            if once and not records and not running:
+                break
+            if not records:
+                time.sleep(poll)
@@ -0,0 +1,76 @@
+"""
+@author: Jozsef Steger
+@summary: probe the notebook servers of the freshly started containers in the background, and record when they answer
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+readinessconf = KOOPLEX.get('readiness', {})
+
+def _probe(container):
+    try:
+        return container, container.probe_ready()
+    except Exception as e:
+        logger.error("cannot probe %s -- %s" % (container, e))
+        return container, False
+    finally:
+        connection.close()
+
+
+class ReadinessTracker:
+    """
+    @summary: the running containers not yet ready are probed with single short calls. A container not answering is probed
+    again after a capped, exponentially growing delay, so a slow booting image does not keep the probes busy.
+    """
+    def __init__(self, workers = 16):
+        self.workers = workers
+        self.backoff = readinessconf.get('backoff', .5)
+        self.backoff_max = readinessconf.get('backoff_max', 10)
+        self._attempts = {}
+        self._next_probe = {}
+
+    def due(self):
+        from hub.models import Container
+        t = time.time()
+        pending = list(Container.objects.filter(state = Container.ST_RUNNING, is_ready = False))
+        ids = set([ c.id for c in pending ])
+        for container_id in list(self._attempts.keys()):
+            if not container_id in ids:
+                # became ready, stopped or removed
+                self._attempts.pop(container_id)
+                self._next_probe.pop(container_id, None)
+        return [ c for c in pending if self._next_probe.get(c.id, 0) <= t ]
+
+    def round(self, pool):
+        """
+        @summary: probe the due containers once
+        @returns: the list of containers found ready
+        """
+        ready = []
+        for container, is_ready in pool.map(_probe, self.due()):
+            if is_ready:
+                ready.append(container)
+                self._attempts.pop(container.id, None)
+                self._next_probe.pop(container.id, None)
+                logger.info("%s is ready after %s" % (container, container.ready_at - container.launched_at))
+            else:
+                n = self._attempts.get(container.id, 0)
+                self._attempts[container.id] = n + 1
+                self._next_probe[container.id] = time.time() + min(self.backoff * 2 ** n, self.backoff_max)
+        return ready
+
+    def run(self, poll = .5, once = False):
+        with ThreadPoolExecutor(max_workers = self.workers) as pool:
+            while True:
+                ready = self.round(pool)
+                if once:
+                    break
+                if not ready:
+                    time.sleep(poll)
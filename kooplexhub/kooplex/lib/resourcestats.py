@@ -0,0 +1,249 @@
+"""
+@author: Jozsef Steger
+@summary: resource usage samples of containers kept in compact rolling per-minute and per-hour aggregates
+"""
+import os
+import time
+import struct
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+statsconf = KOOPLEX.get('stats', {})
+
+class _Ring:
+    """
+    @summary: fixed size ring of aggregates, slot i holds the samples taken in [ts[i], ts[i] + step)
+    """
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        self.ts = array('q', [ 0 ] * size)
+        self.n = array('q', [ 0 ] * size)
+        self.cpu_sum = array('f', [ 0 ] * size)
+        self.cpu_max = array('f', [ 0 ] * size)
+        self.mem_sum = array('f', [ 0 ] * size)  # MiB
+        self.mem_max = array('f', [ 0 ] * size)  # MiB
+
+    def add(self, t, cpu, mem):
+        slot_t = int(t) - int(t) % self.step
+        i = (slot_t // self.step) % self.size
+        if self.ts[i] != slot_t:
+            # the slot holds data one full turn older, overwrite
+            self.ts[i] = slot_t
+            self.n[i] = 0
+            self.cpu_sum[i] = self.cpu_max[i] = self.mem_sum[i] = self.mem_max[i] = 0
+        self.n[i] += 1
+        self.cpu_sum[i] += cpu
+        self.cpu_max[i] = max(self.cpu_max[i], cpu)
+        self.mem_sum[i] += mem
+        self.mem_max[i] = max(self.mem_max[i], mem)
+
+    def points(self, since = 0):
+        """
+        @summary: iterate over the non-empty slots in time order
+        @returns: (slot start, number of samples, mean cpu %, max cpu %, mean memory MiB, max memory MiB) tuples
+        """
+        for i in sorted(range(self.size), key = lambda i: self.ts[i]):
+            if self.n[i] and self.ts[i] >= since:
+                yield self.ts[i], self.n[i], self.cpu_sum[i] / self.n[i], self.cpu_max[i], self.mem_sum[i] / self.n[i], self.mem_max[i]
+
+    @property
+    def latest(self):
+        i = max(range(self.size), key = lambda i: self.ts[i])
+        return self.ts[i]
+
+    ARRAYS = [ 'ts', 'n', 'cpu_sum', 'cpu_max', 'mem_sum', 'mem_max' ]
+    HEADER = struct.Struct('<qq')
+
+    def tofile(self, f):
+        f.write(self.HEADER.pack(self.step, self.size))
+        for a in self.ARRAYS:
+            getattr(self, a).tofile(f)
+
+    @staticmethod
+    def fromfile(f):
+        step, size = _Ring.HEADER.unpack(f.read(_Ring.HEADER.size))
+        ring = _Ring.__new__(_Ring)
+        ring.step = step
+        ring.size = size
+        for a, typecode in zip(_Ring.ARRAYS, [ 'q', 'q', 'f', 'f', 'f', 'f' ]):
+            values = array(typecode)
+            values.fromfile(f, size)
+            setattr(ring, a, values)
+        return ring
+
+
+class RollingSeries:
+    """
+    @summary: the usage history of a single container, minute resolution for the recent past and hour resolution for the older data
+    """
+    RESOLUTIONS = [ 'minute', 'hour' ]
+
+    def __init__(self, minutes = None, hours = None):
+        self.rings = {
+            'minute': _Ring(60, minutes or statsconf.get('minutes', 24 * 60)),
+            'hour': _Ring(3600, hours or statsconf.get('hours', 30 * 24)),
+        }
+
+    def add(self, t, cpu, mem):
+        for ring in self.rings.values():
+            ring.add(t, cpu, mem)
+
+    def points(self, since = 0, resolution = 'minute'):
+        return self.rings[resolution].points(since)
+
+    @property
+    def latest(self):
+        return self.rings['minute'].latest
+
+    MAGIC = b'KXST\x01'
+
+    def tofile(self, f):
+        f.write(self.MAGIC)
+        for resolution in self.RESOLUTIONS:
+            self.rings[resolution].tofile(f)
+
+    @staticmethod
+    def fromfile(f):
+        """
+        @summary: read a series written by tofile, the ring sizes of the file are kept even if the configuration changed since
+        """
+        assert f.read(len(RollingSeries.MAGIC)) == RollingSeries.MAGIC, "not a stats file"
+        series = RollingSeries.__new__(RollingSeries)
+        series.rings = dict([ (resolution, _Ring.fromfile(f)) for resolution in RollingSeries.RESOLUTIONS ])
+        return series
+
+
+class ResourceStore:
+    """
+    @summary: the rolling series of the containers, the arrays of each are written into its own file in KOOPLEX['stats']['directory'],
+    a directory only the hub can access
+    """
+    def __init__(self, directory = None):
+        self.directory = directory or statsconf.get('directory', '/var/lib/hub/stats')
+        self.series = {}
+
+    def _names(self):
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [ fn[:-len('.stats')] for fn in filenames if fn.endswith('.stats') ]
+
+    def _fn(self, name):
+        return os.path.join(self.directory, "%s.stats" % name)
+
+    def load(self, name):
+        if not name in self.series:
+            try:
+                with open(self._fn(name), 'rb') as f:
+                    self.series[name] = RollingSeries.fromfile(f)
+            except FileNotFoundError:
+                self.series[name] = RollingSeries()
+            except Exception as e:
+                logger.error("cannot load stats of %s -- %s" % (name, e))
+                self.series[name] = RollingSeries()
+        return self.series[name]
+
+    def add(self, name, t, cpu, mem):
+        self.load(name).add(t, cpu, mem)
+
+    def save(self, names = None):
+        """
+        @summary: write the series atomically, so readers never see a partial file
+        """
+        os.makedirs(self.directory, mode = 0o700, exist_ok = True)
+        for name in names or self.series.keys():
+            tmp = "%s.%d" % (self._fn(name), os.getpid())
+            with open(tmp, 'wb') as f:
+                self.series[name].tofile(f)
+            os.rename(tmp, self._fn(name))
+
+    def expire(self):
+        """
+        @summary: remove the files of containers not sampled within the hour resolution window
+        """
+        horizon = time.time() - 3600 * statsconf.get('hours', 30 * 24)
+        for name in self._names():
+            path = self._fn(name)
+            if os.path.getmtime(path) < horizon:
+                os.unlink(path)
+                self.series.pop(name, None)
+                logger.info("expired stats %s" % name)
+
+    def usage(self, names, since = 0, resolution = 'minute'):
+        """
+        @summary: the summed usage of a set of containers
+        @returns: a list of (slot start, mean cpu %, max cpu %, mean memory MiB, max memory MiB) tuples in time order.
+        The max columns are the sums of the per container maxima, an upper bound of the peak of the set.
+        """
+        total = {}
+        for name in names:
+            for ts, _, cpu_mean, cpu_max, mem_mean, mem_max in self.load(name).points(since, resolution):
+                agg = total.setdefault(ts, [ 0., 0., 0., 0. ])
+                agg[0] += cpu_mean
+                agg[1] += cpu_max
+                agg[2] += mem_mean
+                agg[3] += mem_max
+        return [ (ts, ) + tuple(total[ts]) for ts in sorted(total.keys()) ]
+
+    def usage_user(self, user, **kw):
+        from hub.models import Container
+        return self.usage(Container.objects.filter(user = user).values_list('name', flat = True), **kw)
+
+    def usage_project(self, project, **kw):
+        from hub.models import ProjectContainerBinding
+        return self.usage(ProjectContainerBinding.objects.filter(project = project).values_list('container__name', flat = True), **kw)
+
+    def usage_course(self, course, **kw):
+        from hub.models import CourseContainerBinding
+        return self.usage(CourseContainerBinding.objects.filter(course = course).values_list('container__name', flat = True), **kw)
+
+    def top(self, n = 10, metric = 'cpu', window = 300):
+        """
+        @summary: the heaviest containers over the last few minutes, to find runaway kernels
+        @param metric: cpu or mem
+        @param window: seconds
+        @returns: a list of (container name, mean cpu %, mean memory MiB) tuples
+        """
+        since = time.time() - window
+        result = []
+        for name in self._names():
+            points = list(self.load(name).points(since))
+            if not points:
+                continue
+            weight = sum([ p[1] for p in points ])
+            result.append((name, sum([ p[2] * p[1] for p in points ]) / weight, sum([ p[4] * p[1] for p in points ]) / weight))
+        result.sort(key = lambda x: x[1] if metric == 'cpu' else x[2], reverse = True)
+        return result[:n]
+
+
+def collect(docker, store, workers = 8):
+    """
+    @summary: sample all running containers of the docker engine on a bounded thread pool, and save their series
+    @returns: the number of containers sampled
+    """
+    running = [ name for name, state in docker.list_containerstates().items() if state == 'running' ]
+    def _sample(name):
+        try:
+            return name, docker.container_stats(name)
+        except Exception as e:
+            logger.warning("cannot sample %s -- %s" % (name, e))
+            return name, None
+    t = time.time()
+    sampled = []
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        for name, sample in pool.map(_sample, running):
+            if sample is None:
+                continue
+            cpu, mem, _ = sample
+            store.add(name, t, cpu, mem / 2 ** 20)
+            sampled.append(name)
+    store.save(sampled)
+    logger.debug("sampled %d of %d running containers in %.2f s" % (len(sampled), len(running), time.time() - t))
+    return len(sampled)
@@ -1,8 +1,11 @@
+import logging
+import threading
 import requests
 import requests.auth
-import logging
+from concurrent.futures import Future
 
 from kooplex.settings import KOOPLEX
+from . import httpclient
 
 from .vc_github import list_projects as lp_gh
 from .vc_gitlab import list_projects as lp_gl
@@ -22,39 +25,118 @@ def list_projects(vctoken):
     else:
         raise NotImplementedError("Unknown version control system type: %s" % vctoken.type)
 
-def impersonator_clone(vcproject):
-    url_base = KOOPLEX['impersonator'].get('base_url', 'http://localhost')
-    A = requests.auth.HTTPBasicAuth(KOOPLEX['impersonator'].get('username'), KOOPLEX['impersonator'].get('password'))
-    try:
-        resp_echo = requests.get(url_base, auth = A)
-    except ConnectionError:
-        logger.critical('impersonator API is not running')
-        raise
-    params = {
+def _clone_params(vcproject):
+    return {
         'clone': vcproject.project_ssh_url,
         'username': vcproject.token.user.username,
         'port': vcproject.token.repository.ssh_port,
         'prefix': vcproject.token.repository.backend_type,
         'rsa_file': '/home/{}/.ssh/{}'.format(vcproject.token.user.username, vcproject.token.fn_rsa), #TODO: store rsa keys automagically in a separate folder in cache volume (?)
             }
-    url = '{}/api/versioncontrol/clone/{}'.format(url_base, vcproject.token.user.username)
-    try:
-        resp_info = requests.get(url, auth = A, params = params)
-        rj = resp_info.json()
-        if 'error' in rj:
-            logger.warning('error to clone {} for user {} -- daemon response: {}'.format(vcproject, vcproject.token.user.username, rj))
-            raise Exception(rj['error'])
-        return rj['clone_folder']
-    except Exception as e:
-        logger.error('error to clone {} for user {} -- {}'.format(vcproject, vcproject.token.user.username, e))
-        raise
+
+
+class CloneBatch:
+    """
+    @summary: collect the clone requests of many users for a short window and send them to the impersonator in a single call.
+    The impersonator answers a result for each item in order, either the clone folder or an error.
+    """
+    def __init__(self, window = None, max_items = None):
+        conf = KOOPLEX.get('impersonator', {})
+        self.window = window if window is not None else conf.get('clone_window', .2)
+        self.max_items = max_items or conf.get('clone_batch', 500)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def submit(self, vcproject):
+        """
+        @summary: queue a clone, the batch is sent when the window expires or it is full
+        @returns: a future resolving to the clone folder
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((vcproject, future))
+            if len(self._pending) >= self.max_items:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            self._send(batch)
+        return future
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        url_base = KOOPLEX['impersonator'].get('base_url', 'http://localhost')
+        A = requests.auth.HTTPBasicAuth(KOOPLEX['impersonator'].get('username'), KOOPLEX['impersonator'].get('password'))
+        url = '{}/api/versioncontrol/clone'.format(url_base)
+        try:
+            resp = httpclient.post('impersonator', url, auth = A, json = { 'clones': [ _clone_params(p) for p, _ in batch ] }, retries = 1)
+            results = resp.json().get('results', [])
+            assert len(results) == len(batch), "impersonator answered %d results for %d clones" % (len(results), len(batch))
+        except requests.exceptions.ConnectionError as e:
+            logger.critical('impersonator API is not running')
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        except Exception as e:
+            logger.error('error to clone a batch of {} projects -- {}'.format(len(batch), e))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        logger.info('sent a batch of {} clones to the impersonator'.format(len(batch)))
+        for (vcproject, future), rj in zip(batch, results):
+            if 'error' in rj:
+                logger.warning('error to clone {} for user {} -- daemon response: {}'.format(vcproject, vcproject.token.user.username, rj))
+                future.set_exception(Exception(rj['error']))
+            else:
+                future.set_result(rj['clone_folder'])
+
+_clonebatch = CloneBatch()
+
+def impersonator_clone_many(vcprojects):
+    """
+    @summary: clone many version control projects, possibly of many users, with a single call of the impersonator
+    @returns: a list of (vcproject, clone folder, exception) tuples, one of the last two is None
+    """
+    futures = [ (p, _clonebatch.submit(p)) for p in vcprojects ]
+    _clonebatch.flush()
+    result = []
+    for vcproject, future in futures:
+        try:
+            result.append((vcproject, future.result(), None))
+        except Exception as e:
+            result.append((vcproject, None, e))
+    return result
+
+def impersonator_clone(vcproject):
+    """
+    @summary: clone a version control project, concurrent calls within the window of the batch are sent together
+    @returns: the clone folder
+    """
+    return _clonebatch.submit(vcproject).result()
 
 def impersonator_removecache(vcproject):
     url_base = KOOPLEX['impersonator'].get('base_url', 'http://localhost')
     A = requests.auth.HTTPBasicAuth(KOOPLEX['impersonator'].get('username'), KOOPLEX['impersonator'].get('password'))
     try:
-        resp_echo = requests.get(url_base, auth = A)
-    except ConnectionError:
+        resp_echo = httpclient.get('impersonator', url_base, auth = A, retries = 1)
+    except requests.exceptions.ConnectionError:
         logger.critical('impersonator API is not running')
         raise
     params = {
@@ -64,7 +146,7 @@ def impersonator_removecache(vcproject):
             }
     url = '{}/api/versioncontrol/removecache/{}'.format(url_base, vcproject.token.user.username)
     try:
-        resp_info = requests.get(url, auth = A, params = params)
+        resp_info = httpclient.get('impersonator', url, auth = A, params = params, retries = 1)
         rj = resp_info.json()
         if 'error' in rj:
             logger.warning('error to clone {} for user {} -- daemon response: {}'.format(vcproject, vcproject.token.user.username, rj))
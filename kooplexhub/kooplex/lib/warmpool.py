@@ -0,0 +1,145 @@
+"""
+@author: Jozsef Steger
+@summary: a pool of booted generic containers per image, handed over to users when they start a container
+"""
+import time
+import uuid
+import logging
+
+from django.db import transaction
+
+from kooplex.settings import KOOPLEX
+
+logger = logging.getLogger(__name__)
+
+def pool_volumes(image):
+    """
+    @summary: the volume sets pooled containers of an image mount, the most frequent sets of system volumes mounted read-write
+    for everybody among the containers of the image, so that project and course containers of a shared image have their own
+    pooled containers. A container mounting another set of volumes is not served by the pool.
+    @returns: a dictionary mapping the key of each set, see volumes_key, to its volumes
+    """
+    from hub.models import Volume, VolumeContainerBinding
+    volumetypes = KOOPLEX.get('docker', {}).get('warmpool_volumetypes', [
+        Volume.HOME, Volume.GARBAGE, Volume.REPORT, Volume.FILESYNC, Volume.SHARE, Volume.WORKDIR, Volume.GIT,
+        Volume.COURSE_SHARE, Volume.COURSE_WORKDIR, Volume.COURSE_ASSIGNMENTDIR ])
+    mounts = {}
+    for container_id, volume_id in VolumeContainerBinding.objects.filter(container__image = image).values_list('container_id', 'volume_id'):
+        mounts.setdefault(container_id, []).append(volume_id)
+    volumes = dict([ (v.id, v) for v in Volume.objects.filter(id__in = set([ i for ids in mounts.values() for i in ids ])) ])
+    sets = {}
+    for ids in mounts.values():
+        vs = [ volumes[i] for i in ids ]
+        if any([ v.volumetype not in volumetypes for v in vs ]):
+            continue
+        key = volumes_key(vs)
+        n, _ = sets.get(key, (0, vs))
+        sets[key] = (n + 1, vs)
+    frequent = sorted(sets.items(), key = lambda x: x[1][0], reverse = True)[:KOOPLEX.get('docker', {}).get('warmpool_volumesets', 3)]
+    return dict([ (key, vs) for key, (_, vs) in frequent ])
+
+def volumes_key(volumes):
+    return ",".join(sorted([ v.name for v in volumes ]))
+
+def _claim(image, key):
+    from hub.models import PooledContainer
+    with transaction.atomic():
+        pooled = PooledContainer.objects.select_for_update().filter(image = image, volumes = key).order_by('created_at').first()
+        if pooled is not None:
+            pooled.delete()
+    return pooled
+
+def adopt(docker, container):
+    """
+    @summary: try to hand over a pooled container
+    @param docker: the docker driver
+    @type docker: kooplex.lib.Docker
+    @param container: the container model instance to be started
+    @returns: the docker container info of the adopted container, or None if the pool cannot serve the request
+    """
+    from hub.models import ImagePool, PoolAdoption, ResourceProfile
+    if container.image is None:
+        return None
+    try:
+        ImagePool.objects.get(image = container.image, is_active = True)
+    except ImagePool.DoesNotExist:
+        return None
+    t0 = time.time()
+    # a pooled container must not keep mounts the container would not get, only the pooled containers of the same volume set match
+    key = volumes_key(container.volumes)
+    if container.resourceprofile.signature != ResourceProfile.default().signature:
+        # pooled containers are created with the default resources
+        logger.debug("container %s needs its own resource profile" % container)
+        PoolAdoption.objects.create(image = container.image, container_name = container.name, is_hit = False)
+        return None
+    pooled = _claim(container.image, key)
+    if pooled is None:
+        logger.info("pool of image %s has no container mounting %s" % (container.image, key))
+        PoolAdoption.objects.create(image = container.image, container_name = container.name, is_hit = False)
+        return None
+    try:
+        info = docker.adopt_pooled(pooled, container)
+    except Exception as e:
+        logger.error("cannot adopt %s for %s -- %s" % (pooled, container, e))
+        docker.remove_pooled(pooled)
+        PoolAdoption.objects.create(image = container.image, container_name = container.name, is_hit = False)
+        return None
+    latency = time.time() - t0
+    PoolAdoption.objects.create(image = container.image, container_name = container.name, is_hit = True, latency = latency)
+    logger.info("%s adopted %s in %.3f s" % (container, pooled, latency))
+    return info
+
+def refill(docker, dry = False):
+    """
+    @summary: for each volume set of pool_volumes create pooled containers up to the minimum size of each active pool, and remove
+    the excess above the maximum size. The sizes apply to each volume set. Pooled containers of other volume sets are removed.
+    @returns: a list of (image, created, removed) tuples
+    """
+    from hub.models import ImagePool, PooledContainer
+    report = []
+    for pool in ImagePool.objects.all():
+        volumesets = pool_volumes(pool.image) if pool.is_active else {}
+        pooled = dict([ (key, []) for key in volumesets.keys() ])
+        removed = []
+        for entry in PooledContainer.objects.filter(image = pool.image).order_by('created_at'):
+            (pooled[entry.volumes] if entry.volumes in pooled else removed).append(entry)
+        todo = []
+        for key, entries in pooled.items():
+            todo.extend([ key ] * max(0, pool.min_size - len(entries)))
+            removed.extend(entries[:max(0, len(entries) - pool.max_size)])
+        report.append((pool.image, len(todo), len(removed)))
+        if dry:
+            continue
+        for key in todo:
+            entry = PooledContainer(name = "pool-%s-%s" % (pool.image.name, uuid.uuid4().hex[:8]), image = pool.image, volumes = key)
+            try:
+                docker.create_pooled(entry, volumesets[key])
+                entry.save()
+            except Exception as e:
+                logger.error("cannot create pooled container %s -- %s" % (entry, e))
+                docker.remove_pooled(entry)
+        for entry in removed:
+            docker.remove_pooled(entry)
+            entry.delete()
+    return report
+
+def statistics():
+    """
+    @summary: pool hit rate and adoption latency per image
+    """
+    from hub.models import PoolAdoption
+    stats = {}
+    for a in PoolAdoption.objects.all().select_related('image'):
+        s = stats.setdefault(a.image.name, { 'hit': 0, 'miss': 0, 'latencies': [] })
+        if a.is_hit:
+            s['hit'] += 1
+            s['latencies'].append(a.latency)
+        else:
+            s['miss'] += 1
+    for s in stats.values():
+        latencies = sorted(s.pop('latencies'))
+        n = s['hit'] + s['miss']
+        s['hitrate'] = s['hit'] / n if n else 0
+        s['latency_mean'] = sum(latencies) / len(latencies) if latencies else None
+        s['latency_p95'] = latencies[int(.95 * (len(latencies) - 1))] if latencies else None
+    return stats
@@ -103,6 +103,8 @@ DATABASES = {
         'PASSWORD': os.getenv('HUBDB_PW'),
         'HOST': os.getenv('HUBDB_HOSTNAME', '%s-hub-mysql' % PREFIX),
         'PORT': '3306',
+        # a view commits its changes and the side effects they enqueue together, or neither of them
+        'ATOMIC_REQUESTS': True,
     }
 }
 